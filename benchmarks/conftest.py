@@ -0,0 +1,38 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# Offline defaults, the benchmarks never contact Globus, Kafka or the schema hosts
+os.environ.setdefault("TRANSACTION_AUTHORIZER", "globus")
+os.environ.setdefault("TRANSACTION_CLIENT__CLIENT_ID", "benchmark")
+os.environ.setdefault("TRANSACTION_CLIENT__CLIENT_SECRET", "benchmark")
+os.environ.setdefault("TRANSACTION_CLIENT__ISSUER", "https://auth.globus.org")
+os.environ.setdefault("TRANSACTION_CLIENT__SCOPE_STRING", "benchmark")
+os.environ.setdefault("TRANSACTION_CLIENT__POLICY_PATH", (ROOT / "src" / "settings" / "config" / "access_control_policy.json").as_uri())
+os.environ.setdefault("TRANSACTION_SCHEMA_DIRECTORY", str(Path(__file__).parent / "schemas"))
+os.environ.setdefault("KAFKA_PRODUCER_CONFIG__BOOTSTRAP_SERVERS", "localhost:9092")
+os.environ.setdefault("KAFKA_PRODUCER_SUCCESS_TOPIC", "benchmark")
+
+sys.path.insert(0, str(ROOT / "src"))
+sys.path.append(str(ROOT / "test"))
+
+import synthetic  # noqa: E402
+
+ASSET_COUNTS = [10, 100, 1000, 5000]
+PROJECTS = ["CMIP6", "CMIP7"]
+
+
+@pytest.fixture(scope="session")
+def example_event() -> dict:
+    """schemas/post_event_example.json, completed with a geometry, links and ids."""
+    return synthetic.example_event()
+
+
+@pytest.fixture(scope="session", params=[(project, assets) for project in PROJECTS for assets in ASSET_COUNTS], ids=lambda p: f"{p[0]}-{p[1]}")
+def item(request, example_event) -> dict:
+    project, assets = request.param
+    return synthetic.synthetic_item(example_event, project, assets)
@@ -0,0 +1,26 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from stac_pydantic.item import Item
+
+from client import TransactionClient
+from settings import settings
+
+
+@pytest.fixture(scope="module")
+def transaction_client() -> TransactionClient:
+    # allowed_groups does not use the producer, skip connecting to Kafka
+    return TransactionClient.__new__(TransactionClient)
+
+
+@pytest.fixture(scope="module")
+def access_control_policy() -> dict:
+    return settings.client.load_access_control_policy(settings.client.policy_path)
+
+
+@pytest.mark.parametrize("institution_id", ["EC-Earth-Consortium", "unknown"])
+def test_allowed_groups(benchmark, transaction_client, access_control_policy, example_event, institution_id):
+    item = Item.model_validate(example_event["data"]["payload"]["item"])
+    setattr(item.properties, "cmip6:institution_id", institution_id)
+    benchmark(transaction_client.allowed_groups, item.properties, access_control_policy)
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from esgf_core_utils.models.kafka.events import CreatePayload, Data, KafkaEvent
+from stac_pydantic.item import Item
+
+from codec import codec
+from compression import compressor
+
+
+@pytest.fixture(scope="module")
+def kafka_event(example_event) -> KafkaEvent:
+    return KafkaEvent.model_validate(example_event)
+
+
+def synthetic_event(example_event: dict, item: dict) -> KafkaEvent:
+    payload = CreatePayload(method="POST", collection_id=item["collection"], item=Item.model_validate(item).model_dump())
+    return KafkaEvent.model_validate({"metadata": example_event["metadata"], "data": Data(type="STAC", payload=payload)})
+
+
+def test_kafka_event__example(benchmark, kafka_event):
+    benchmark(codec.encode_event, kafka_event)
+
+
+def test_kafka_event__synthetic(benchmark, example_event, item):
+    benchmark(codec.encode_event, synthetic_event(example_event, item))
+
+
+def test_kafka_event__build(benchmark, example_event, item):
+    benchmark(synthetic_event, example_event, item)
+
+
+def test_kafka_event__compressed(benchmark, example_event, item):
+    event = synthetic_event(example_event, item)
+    benchmark(lambda: compressor.compress(codec.encode_event(event)))
@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from stac_fastapi.extensions.transaction.request import PartialItem, PatchAddReplaceTest
+from stac_pydantic.item import Item
+
+from utils import (
+    get_null_keys,
+    operation_to_partial_item,
+    validate_extensions,
+    validate_geometry,
+    validate_patch,
+    validate_post,
+)
+
+RETRACTION = {"properties": {"retracted": True}}
+
+
+def test_validate_extensions(benchmark, item):
+    extensions = item["stac_extensions"]
+    benchmark(lambda: validate_extensions(collection_id=item["collection"], item_extensions=list(extensions)))
+
+
+def test_validate_extensions__defaults(benchmark, item):
+    benchmark(lambda: validate_extensions(collection_id=item["collection"], item_extensions=[]))
+
+
+def test_validate_post(benchmark, item):
+    model = Item.model_validate(item)
+    extensions = validate_extensions(collection_id=item["collection"], item_extensions=list(item["stac_extensions"]))
+    benchmark(validate_post, item_id=model.id, item=model, extensions=extensions)
+
+
+def test_validate_patch__retraction(benchmark, item):
+    patch = PartialItem.model_validate(RETRACTION)
+    extensions = validate_extensions(collection_id=item["collection"], item_extensions=[])
+    benchmark(validate_patch, item_id=item["id"], item=patch, extensions=extensions)
+
+
+def test_validate_patch__assets(benchmark, item):
+    patch = PartialItem.model_validate({"stac_extensions": item["stac_extensions"], "assets": item["assets"]})
+    extensions = validate_extensions(collection_id=item["collection"], item_extensions=list(item["stac_extensions"]))
+    benchmark(validate_patch, item_id=item["id"], item=patch, extensions=extensions)
+
+
+def test_operation_to_partial_item(benchmark, item):
+    operations = [PatchAddReplaceTest(op="add", path=f"/assets/{key}", value=asset) for key, asset in item["assets"].items()]
+    operations.append(PatchAddReplaceTest(op="replace", path="/properties/retracted", value=True))
+    benchmark(operation_to_partial_item, collection_id=item["collection"], operations=operations)
+
+
+def test_get_null_keys(benchmark, item):
+    patch = PartialItem.model_validate({"properties": {"retracted": None}, "assets": item["assets"]})
+    benchmark(get_null_keys, patch)
+
+
+@pytest.mark.parametrize("vertices", [5, 100, 10000])
+def test_validate_geometry(benchmark, vertices):
+    # Polygon around a latitude band with ``vertices`` points along each edge
+    step = 360.0 / (vertices - 1)
+    south = [[-180.0 + i * step, -45.0] for i in range(vertices)]
+    north = [[180.0 - i * step, 45.0] for i in range(vertices)]
+    geometry = {"type": "Polygon", "coordinates": [south + north + [south[0]]]}
+    benchmark(validate_geometry, geometry)
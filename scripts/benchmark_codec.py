@@ -0,0 +1,89 @@
+import argparse
+import json
+import timeit
+from pathlib import Path
+
+from esgf_core_utils.models.kafka.events import KafkaEvent
+from stac_pydantic.item import Item
+
+"""
+Compare the JSON codecs available to the Transaction API (TRANSACTION_CODEC)
+on a schemas/post_event_example.json sized item:
+    decode: request body bytes -> dict (CodecRequest.json)
+    encode: dict -> bytes (CodecJSONResponse)
+    validation input: Item -> dict (utils.validate_post)
+    event value: model -> bytes (TransactionClient Kafka value)
+"""
+
+EXAMPLE_EVENT = Path(__file__).parent.parent / "schemas" / "post_event_example.json"
+
+
+def load_event(path: Path) -> dict:
+    event = json.loads(path.read_text())
+    item = event["data"]["payload"]["item"]
+    # The example predates the geometry and links being populated by the publisher
+    item["bbox"] = [-180.0, -90.0, 180.0, 90.0]
+    item["geometry"] = {
+        "type": "Polygon",
+        "coordinates": [[[-180.0, -90.0], [180.0, -90.0], [180.0, 90.0], [-180.0, 90.0], [-180.0, -90.0]]],
+    }
+    item["properties"]["datetime"] = None
+    item["links"] = []
+    event["metadata"].setdefault("event_id", "benchmark")
+    event["metadata"].setdefault("request_id", "benchmark")
+    return event
+
+
+def codec_functions() -> dict:
+    functions = {
+        "json": (
+            json.loads,
+            lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf8"),
+        ),
+    }
+    try:
+        import orjson
+
+        functions["orjson"] = (orjson.loads, orjson.dumps)
+    except ImportError:
+        print("orjson not installed, skipping")
+    try:
+        import msgspec
+
+        functions["msgspec"] = (msgspec.json.Decoder().decode, msgspec.json.Encoder().encode)
+    except ImportError:
+        print("msgspec not installed, skipping")
+    return functions
+
+
+def report(name: str, timer: timeit.Timer, number: int) -> None:
+    best = min(timer.repeat(repeat=5, number=number)) / number
+    print(f"{name:<40} {best * 1e6:>10.1f} us")
+
+
+def main(args):
+    event = load_event(Path(args.event))
+    item = event["data"]["payload"]["item"]
+    body = json.dumps(item).encode("utf8")
+    model = Item.model_validate(item)
+    kafka_event = KafkaEvent.model_validate(event)
+    print(f"Item size: {len(body)} bytes, {len(item['assets'])} assets\n")
+
+    for name, (loads, dumps) in codec_functions().items():
+        report(f"{name} decode", timeit.Timer(lambda: loads(body)), args.number)
+        report(f"{name} encode", timeit.Timer(lambda: dumps(item)), args.number)
+
+    print()
+    report("validation input: json round trip", timeit.Timer(lambda: json.loads(model.model_dump_json())), args.number)
+    report("validation input: model_dump(mode=json)", timeit.Timer(lambda: model.model_dump(mode="json")), args.number)
+    report("event value: model_dump_json().encode", timeit.Timer(lambda: kafka_event.model_dump_json().encode("utf8")), args.number)
+    report("event value: serializer to_json", timeit.Timer(lambda: kafka_event.__pydantic_serializer__.to_json(kafka_event)), args.number)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Transaction API JSON codecs.")
+    parser.add_argument("--event", type=str, default=str(EXAMPLE_EVENT), help="A Kafka event containing the item to benchmark with.")
+    parser.add_argument("--number", type=int, default=200, help="Number of calls per timing.")
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,110 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from collections import Counter
+from pathlib import Path
+
+"""
+Startup profile of the Transaction API
+    Imports api in fresh interpreters with -X importtime and reports:
+        - wall time of the import, and of the deferred startup steps (startup.py)
+        - import time per top-level package (self time of its modules)
+        - slowest modules (cumulative time, including their imports)
+    for the import of api, and for the imports deferred to the startup steps.
+    Run with the environment of the API, e.g. TRANSACTION_AUTHORIZER and TRANSACTION_CLIENT__*.
+"""
+
+SRC = Path(__file__).parent.parent / "src"
+
+MARKER = "-- startup --"
+PROGRAM = """
+import json, sys, time
+started = time.perf_counter()
+import api
+imported = time.perf_counter()
+print(sys.argv[1], file=sys.stderr, flush=True)
+from startup import startup
+startup.start().result()
+print(json.dumps({"import_seconds": imported - started, "startup_seconds": time.perf_counter() - imported}))
+"""
+
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int, int]]:
+    """(module, depth, self us, cumulative us) of every ``-X importtime`` line."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return modules
+
+
+def profile(runs: int) -> tuple[list[dict], str]:
+    timings, stderr = [], ""
+    for _ in range(runs):
+        process = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", PROGRAM, MARKER],
+            cwd=SRC,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise SystemExit(process.stderr)
+        timings.append(json.loads(process.stdout.strip().splitlines()[-1]))
+        # Keep the breakdown of the fastest run, the least disturbed by the machine
+        if min(timings, key=lambda t: t["import_seconds"]) is timings[-1]:
+            stderr = process.stderr
+    return timings, stderr
+
+
+def breakdown(modules: list[tuple[str, int, int, int]], top: int, depth: int) -> dict:
+    packages = Counter()
+    for name, _, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    slowest = sorted((m for m in modules if m[1] <= depth), key=lambda m: m[3], reverse=True)
+    return {
+        "packages": {name: us / 1e6 for name, us in packages.most_common(top)},
+        "modules": {name: cumulative_us / 1e6 for name, _, _, cumulative_us in slowest[:top]},
+    }
+
+
+def main(args):
+    timings, stderr = profile(args.runs)
+    api_stderr, _, startup_stderr = stderr.partition(MARKER)
+
+    report = {
+        "runs": args.runs,
+        "import_seconds": statistics.median(t["import_seconds"] for t in timings),
+        "startup_seconds": statistics.median(t["startup_seconds"] for t in timings),
+        "import": breakdown(parse_importtime(api_stderr), args.top, args.depth),
+        "startup": breakdown(parse_importtime(startup_stderr), args.top, args.depth),
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"import api:     {report['import_seconds'] * 1000:8.1f} ms (median of {args.runs})")
+    print(f"startup steps:  {report['startup_seconds'] * 1000:8.1f} ms")
+    for phase in ["import", "startup"]:
+        print(f"\n[{phase}] top {args.top} packages, self time of their modules")
+        for name, seconds in report[phase]["packages"].items():
+            print(f"{seconds * 1000:8.1f} ms  {name}")
+        print(f"\n[{phase}] top {args.top} modules, cumulative time, up to depth {args.depth}")
+        for name, seconds in report[phase]["modules"].items():
+            print(f"{seconds * 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time breakdown of the Transaction API")
+    parser.add_argument("--runs", type=int, default=5, help="Interpreters to start")
+    parser.add_argument("--top", type=int, default=20, help="Packages and modules to report")
+    parser.add_argument("--depth", type=int, default=2, help="Import depth of the reported modules")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    main(args)
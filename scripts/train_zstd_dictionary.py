@@ -0,0 +1,70 @@
+import argparse
+import json
+from pathlib import Path
+
+import zstandard
+
+"""
+Train a zstd dictionary for Kafka event values (TRANSACTION_COMPRESSION__DICTIONARY_PATH).
+
+Samples are read from JSON files (Kafka events or STAC items, e.g. schemas/*.json or generated payloads)
+and JSONL files (one event or item per line, e.g. captured requests). Every document is re-encoded
+compactly, as the API sends it, and each of its assets is added as a sample of its own so that the
+repeated asset structure is learnt even from a small corpus.
+"""
+
+
+def iter_documents(paths: list[Path]):
+    for path in paths:
+        if path.is_dir():
+            yield from iter_documents(sorted(p for p in path.iterdir() if p.suffix in (".json", ".jsonl")))
+        elif path.suffix == ".jsonl":
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+        else:
+            with open(path) as f:
+                yield json.load(f)
+
+
+def find_assets(document: dict) -> dict:
+    if "assets" in document:
+        return document["assets"]
+    payload = document.get("data", {}).get("payload", {})
+    return payload.get("item", {}).get("assets", {})
+
+
+def get_samples(paths: list[Path]) -> list[bytes]:
+    samples = []
+    for document in iter_documents(paths):
+        samples.append(json.dumps(document, separators=(",", ":")).encode("utf8"))
+        if isinstance(document, dict):
+            for key, asset in find_assets(document).items():
+                samples.append(json.dumps({key: asset}, separators=(",", ":")).encode("utf8"))
+    return samples
+
+
+def main(args):
+    samples = get_samples([Path(p) for p in args.samples])
+    print(f"Training on {len(samples)} samples, {sum(len(s) for s in samples)} bytes")
+
+    dictionary = zstandard.train_dictionary(args.size, samples, level=args.level)
+    Path(args.output).write_bytes(dictionary.as_bytes())
+    print(f"Dictionary {dictionary.dict_id()} written to {args.output}")
+
+    plain = zstandard.ZstdCompressor(level=args.level)
+    trained = zstandard.ZstdCompressor(level=args.level, dict_data=dictionary)
+    for document in samples[:5]:
+        print(f"{len(document):>8} bytes -> {len(plain.compress(document)):>7} zstd, {len(trained.compress(document)):>7} zstd + dictionary")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train a zstd dictionary for STAC item events.")
+    parser.add_argument("samples", nargs="+", help="JSON or JSONL files, or directories of them, to train on.")
+    parser.add_argument("--output", type=str, default="stac-item.zstd-dict", help="Where to write the dictionary.")
+    parser.add_argument("--size", type=int, default=112640, help="Maximum dictionary size in bytes.")
+    parser.add_argument("--level", type=int, default=3, help="Compression level, should match TRANSACTION_COMPRESSION__LEVEL.")
+    args = parser.parse_args()
+
+    main(args)
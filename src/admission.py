@@ -0,0 +1,124 @@
+import logging
+from typing import Callable
+
+from esgf_core_utils.models.exceptions import RFC9457Exception
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from codec import CodecJSONResponse
+from settings import settings
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+FastAPI Middleware Admission Controller
+    Write requests (POST, PUT, PATCH, DELETE) are admitted while:
+        - in-flight requests < TRANSACTION_ADMISSION__MAX_IN_FLIGHT_REQUESTS, else 429
+        - in-flight body bytes (Content-Length) < TRANSACTION_ADMISSION__MAX_IN_FLIGHT_BYTES, else 429
+        - events accepted and not yet delivered < TRANSACTION_ADMISSION__MAX_PRODUCER_QUEUE, else 503:
+          produces in flight, and records waiting in the outbox if enabled
+    Rejected requests get a Retry-After header and are not authorized, validated or produced.
+    A single request larger than the byte limit is admitted when no other body is in flight.
+"""
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+
+class TooManyRequestsException(RFC9457Exception):
+    """
+    Too many requests in flight
+    """
+
+    def __init__(self, instance: str) -> None:
+        self.status_code = 429
+        self.type = "https://esgf.io/publication/errors/too-many-requests"
+        self.title = "Too many requests in flight"
+        self.detail = "The API is processing too many requests -- please retry after the number of seconds in the Retry-After header."
+        self.instance = instance
+
+
+class ServiceOverloadedException(RFC9457Exception):
+    """
+    Event stream is not keeping up
+    """
+
+    def __init__(self, instance: str) -> None:
+        self.status_code = 503
+        self.type = "https://esgf.io/publication/errors/service-overloaded"
+        self.title = "The event stream is not keeping up"
+        self.detail = "Too many events are waiting to be delivered -- please retry after the number of seconds in the Retry-After header."
+        self.instance = instance
+
+
+class AdmissionController(BaseHTTPMiddleware):
+    def __init__(self, app, backlog: Callable[[], int] | None = None) -> None:
+        super().__init__(app)
+        self.backlog = backlog
+        self.in_flight_requests = 0
+        self.in_flight_bytes = 0
+
+    def event_backlog(self) -> int:
+        """Number of events waiting to be delivered."""
+        if self.backlog is None:
+            return 0
+        return self.backlog()
+
+    def admit(self, body_bytes: int, instance: str) -> None:
+        """Check the limits for a new request.
+
+        Args:
+            body_bytes (int): request body size
+            instance (str): error instance
+
+        Raises:
+            TooManyRequestsException: in-flight request or byte limit reached
+            ServiceOverloadedException: event backlog limit reached
+        """
+        admission = settings.admission
+        if self.in_flight_requests >= admission.max_in_flight_requests:
+            raise TooManyRequestsException(instance=instance)
+        if self.in_flight_bytes and self.in_flight_bytes + body_bytes > admission.max_in_flight_bytes:
+            raise TooManyRequestsException(instance=instance)
+        if self.event_backlog() >= admission.max_producer_queue:
+            raise ServiceOverloadedException(instance=instance)
+
+    async def dispatch(self, request: Request, call_next):
+        if request.method not in WRITE_METHODS:
+            return await call_next(request)
+
+        try:
+            body_bytes = int(request.headers.get("content-length", 0))
+        except ValueError:
+            body_bytes = 0
+
+        try:
+            self.admit(body_bytes, instance=request.headers.get("x-request-id", ""))
+        except RFC9457Exception as exc:
+            logger.warning(
+                "Rejected %s %s: %s requests, %s bytes in flight, %s events waiting",
+                request.method,
+                request.url.path,
+                self.in_flight_requests,
+                self.in_flight_bytes,
+                self.event_backlog(),
+            )
+            return CodecJSONResponse(
+                status_code=exc.status_code,
+                content={
+                    "status_code": exc.status_code,
+                    "type": exc.type,
+                    "title": exc.title,
+                    "detail": exc.detail,
+                    "instance": exc.instance,
+                },
+                headers={"Retry-After": str(settings.admission.retry_after_seconds)},
+            )
+
+        self.in_flight_requests += 1
+        self.in_flight_bytes += body_bytes
+        try:
+            return await call_next(request)
+        finally:
+            self.in_flight_requests -= 1
+            self.in_flight_bytes -= body_bytes
@@ -1,18 +1,26 @@
+import asyncio
 import logging
 import uuid
+from contextlib import asynccontextmanager, suppress
 
 from esgf_core_utils.models.exceptions import (
     InvalidTokenAudienceException,
     RFC9457Exception,
 )
-from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, FastAPI, Request
 from stac_fastapi.extensions import TransactionExtension
 from stac_fastapi.types.config import ApiSettings
 
+import fastlane
+import logs
+import metrics
+import warmup
+from admission import AdmissionController
 from authorizer import Authorizer
 from client import TransactionClient
+from codec import CodecJSONResponse, CodecRoute, codec
 from settings import settings
+from startup import StartupMiddleware, startup
 
 logger = logging.getLogger("uvicorn.error")
 logger.setLevel(logging.DEBUG if settings.debug else logging.INFO)
@@ -20,29 +28,71 @@ logger.setLevel(logging.DEBUG if settings.debug else logging.INFO)
 
 class HealthCheckFilter(logging.Filter):
     def filter(self, record):
+        # Matched on the path argument of uvicorn, without formatting every access log message
+        if isinstance(record.args, tuple):
+            return "/healthcheck" not in record.args
         return "/healthcheck" not in record.getMessage()
 
 
 logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
-
-app = FastAPI(debug=settings.debug)
+logs.configure(settings.logging)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Not awaited, the server starts listening while startup runs in the background
+    startup.start()
+    if settings.warmup.enabled and not warmup.warmed_up:
+        # Awaited, the worker only accepts traffic once warm
+        with suppress(Exception):
+            await startup.wait()
+        await asyncio.to_thread(warmup.warm_up, core_client, settings.warmup.collections)
+    core_client.open_outbox()
+    drainer_task = None
+    if core_client.outbox_drainer:
+        drainer_task = asyncio.create_task(core_client.outbox_drainer.run())
+    yield
+    if core_client.coalescer:
+        await core_client.coalescer.flush_all()
+    if drainer_task:
+        # Undelivered records stay in the outbox for the next process to drain
+        drainer_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await drainer_task
+        core_client.outbox.close()
+
+
+app = FastAPI(debug=settings.debug, lifespan=lifespan)
 
 
 # Health Check for AWS
 @app.get("/healthcheck")
 async def healthcheck():
-    return JSONResponse(
+    if startup.failed:
+        return CodecJSONResponse(
+            content={"healthcheck": False},
+            media_type="application/json",
+            status_code=503,
+        )
+    return CodecJSONResponse(
         content={"healthcheck": True},
         media_type="application/json",
         status_code=200,
     )
 
 
+if metrics.enabled:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def prometheus_metrics():
+        return metrics.metrics_response()
+
+
 if settings.authorizer == "egi":
 
     @app.get("/scope")
     async def scope():
-        return JSONResponse(
+        return CodecJSONResponse(
             content={"scope": settings.client.scope},
             media_type="application/json",
             status_code=200,
@@ -51,7 +101,7 @@ if settings.authorizer == "egi":
 
 @app.exception_handler(RFC9457Exception)
 async def rfc9457_handler(request: Request, exc: RFC9457Exception):
-    return JSONResponse(
+    return CodecJSONResponse(
         status_code=exc.status_code,
         content={
             "status_code": exc.status_code,
@@ -60,6 +110,7 @@ async def rfc9457_handler(request: Request, exc: RFC9457Exception):
             "detail": exc.detail,
             "instance": exc.instance,
         },
+        headers=getattr(exc, "headers", None),
     )
 
 
@@ -67,7 +118,7 @@ async def rfc9457_handler(request: Request, exc: RFC9457Exception):
 async def invalid_token_audience_handler(request: Request, exc: InvalidTokenAudienceException):
     event_id = uuid.uuid4().hex
     request_id = request.headers.get("x-request-id", uuid.uuid4().hex)
-    return JSONResponse(
+    return CodecJSONResponse(
         status_code=exc.status_code,
         content={
             "status_code": exc.status_code,
@@ -89,6 +140,49 @@ api_settings = ApiSettings(
 
 
 app.add_middleware(Authorizer)
+# Added after the authorizer to run before it, the authorizer needs the confidential client
+app.add_middleware(StartupMiddleware, startup=startup)
+if settings.profiling.enabled:
+    import profiling
+
+    app.state.profile_store = profiling.ProfileStore(settings.profiling.directory, settings.profiling.max_profiles)
+    app.add_middleware(profiling.ProfilingMiddleware, store=app.state.profile_store)
+    app.include_router(profiling.router)
+# Added last to run first, rejected requests skip authorization
+app.add_middleware(AdmissionController, backlog=core_client.event_backlog)
+if settings.capture.enabled:
+    import capture
+
+    # Outermost, requests are recorded as sent, including those the admission controller rejects
+    app.add_middleware(capture.CaptureMiddleware, capture_settings=settings.capture)
+
+HEALTHY = fastlane.static_response(200, codec.dumps({"healthcheck": True}), "application/json")
+UNHEALTHY = fastlane.static_response(503, codec.dumps({"healthcheck": False}), "application/json")
+NO_FAVICON = fastlane.static_response(404, codec.dumps({"detail": "Not Found"}), "application/json", "public, max-age=86400")
+fast_routes = {
+    "/healthcheck": lambda: UNHEALTHY if startup.failed else HEALTHY,
+    "/favicon.ico": lambda: NO_FAVICON,
+    # Generated on first use, once every route is registered
+    "/openapi.json": fastlane.once(
+        lambda: fastlane.static_response(200, codec.dumps(app.openapi()), "application/json", "public, max-age=3600")
+    ),
+}
+if settings.authorizer == "egi":
+    # The scope may come with the bootstrap secrets, the API answers until startup is done
+    fast_routes["/scope"] = fastlane.once(
+        lambda: (
+            fastlane.static_response(200, codec.dumps({"scope": settings.client.scope}), "application/json", "public, max-age=3600")
+            if startup.ready
+            else None
+        )
+    )
+# Added last to run before every other middleware
+app.add_middleware(fastlane.FastLane, routes=fast_routes)
 app.state.router_prefix = ""
-transaction_extension = TransactionExtension(client=core_client, settings=api_settings)
+transaction_extension = TransactionExtension(
+    client=core_client,
+    settings=api_settings,
+    router=APIRouter(route_class=CodecRoute),
+    response_class=CodecJSONResponse,
+)
 transaction_extension.register(app)
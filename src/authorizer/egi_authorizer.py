@@ -8,7 +8,10 @@ from esgf_core_utils.models.kafka.events import RequesterData
 from fastapi import Request
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from capture import sanitize_headers
+from metrics import INTROSPECTION_SECONDS, timer
 from settings import settings
+from tracing import server_span, span
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -30,10 +33,20 @@ class EGIAuthorizer(BaseHTTPMiddleware):
 
     async def dispatch(self, request: Request, call_next):
         # Need to bypass authorization for this endpoint
-        if request.url.path in ["/healthcheck", "/scope"]:
+        if request.url.path in ["/favicon.ico", "/healthcheck", "/metrics", "/openapi.json", "/scope"]:
             return await call_next(request)
 
-        logger.debug("Request Headers %s", request.headers)
+        with server_span(
+            "EGIAuthorizer.dispatch",
+            request.headers,
+            **{"http.request.method": request.method, "url.path": request.url.path},
+        ):
+            return await self._dispatch(request, call_next)
+
+    async def _dispatch(self, request: Request, call_next):
+        if logger.isEnabledFor(logging.DEBUG):
+            # Without the bearer token
+            logger.debug("Request Headers %s", sanitize_headers(request.headers.raw))
 
         auth = httpx.BasicAuth(
             username=settings.client.client_id,
@@ -45,18 +58,19 @@ class EGIAuthorizer(BaseHTTPMiddleware):
                 "Post request to %s",
                 settings.client.introspection_endpoint,
             )
-            response = await client.post(
-                settings.client.introspection_endpoint,
-                headers={"Content-type": "application/x-www-form-urlencoded"},
-                data=f"token={request.headers.get('authorization')[7:]}",
-                auth=auth,
-                timeout=5,
-            )
+            with timer(INTROSPECTION_SECONDS, "egi"), span("egi.introspect"):
+                response = await client.post(
+                    settings.client.introspection_endpoint,
+                    headers={"Content-type": "application/x-www-form-urlencoded"},
+                    data=f"token={request.headers.get('authorization')[7:]}",
+                    auth=auth,
+                    timeout=5,
+                )
             response.raise_for_status()
 
         token_info = response.json()
 
-        logger.debug("Token info: %s", token_info)
+        logger.debug("Token info: sub=%s client_id=%s", token_info.get("sub"), token_info.get("client_id"))
 
         if request.headers["host"] not in [urlparse(aud).hostname for aud in token_info["aud"]]:
             raise InvalidTokenAudienceException(
@@ -6,11 +6,11 @@ from threading import Lock
 
 from fastapi import Request
 from fastapi.responses import JSONResponse
-from globus_sdk import AccessTokenAuthorizer, GroupsClient
-from globus_sdk.scopes import GroupsScopes
 from starlette.middleware.base import BaseHTTPMiddleware
 
+from metrics import AUTH_CACHE, GROUP_LOOKUP_SECONDS, INTROSPECTION_SECONDS, timer
 from settings import settings
+from tracing import server_span, span
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -89,10 +89,18 @@ class GlobusAuthorizer(BaseHTTPMiddleware):
     async def dispatch(self, request: Request, call_next):
         # Health check endpoint for AWS ALB target group
         # Need to bypass authorization for this endpoint
-        bypass_paths = ["/favicon.ico", "/healthcheck"]
+        bypass_paths = ["/favicon.ico", "/healthcheck", "/metrics", "/openapi.json"]
         if request.url.path in bypass_paths:
             return await call_next(request)
 
+        with server_span(
+            "GlobusAuthorizer.dispatch",
+            request.headers,
+            **{"http.request.method": request.method, "url.path": request.url.path},
+        ):
+            return await self._dispatch(request, call_next)
+
+    async def _dispatch(self, request: Request, call_next):
         authorization_header = request.headers.get("authorization")
         if not authorization_header:
             return JSONResponse(
@@ -108,17 +116,21 @@ class GlobusAuthorizer(BaseHTTPMiddleware):
         access_token = authorization_header[7:].strip()
         cached_auth = _auth_cache.get(access_token)
         if cached_auth is not None:
+            AUTH_CACHE.labels("hit").inc()
             request.state.authorizer = cached_auth
             return await call_next(request)
+        AUTH_CACHE.labels("miss").inc()
 
-        response = settings.client.confidential_client.oauth2_token_introspect(access_token, include="identity_set_detail")
+        with timer(INTROSPECTION_SECONDS, "globus"), span("globus.introspect"):
+            response = settings.client.confidential_client.oauth2_token_introspect(access_token, include="identity_set_detail")
         token_info = response.data
 
         auth_error = self._validate_token_info(token_info)
         if auth_error is not None:
             return auth_error
 
-        groups = self.get_groups(access_token)
+        with timer(GROUP_LOOKUP_SECONDS), span("globus.get_groups"):
+            groups = self.get_groups(access_token)
         if not groups:
             return JSONResponse(
                 content={"detail": "Unauthorized - No active group memberships found"},
@@ -169,6 +181,9 @@ class GlobusAuthorizer(BaseHTTPMiddleware):
         Amazon API Gateway Authorization caching setting can be use to cache the authorizer response,
         and if the a new request with the same bearer token
         """
+        # Imported on first use, or by startup.py, rather than when the API is imported
+        from globus_sdk import AccessTokenAuthorizer, GroupsClient
+        from globus_sdk.scopes import GroupsScopes
 
         tokens = settings.client.confidential_client.oauth2_get_dependent_tokens(token, scope=GroupsScopes.view_my_groups_and_memberships)
         groups_token = tokens.by_resource_server[GroupsClient.resource_server]
@@ -0,0 +1,208 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable
+
+from settings import BootstrapSettings, settings
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Settings bootstrap
+    At startup, the configuration held outside the environment is fetched concurrently:
+        access_control_policy   TRANSACTION_CLIENT__POLICY_PATH, file or HTTP (Globus)
+        secrets                 Secrets Manager TRANSACTION_CLIENT__SECRET_NAME, if TRANSACTION_BOOTSTRAP__SECRETS
+    The result is shared by the workers of a host through TRANSACTION_BOOTSTRAP__CACHE_PATH:
+        - the first worker to start fetches while holding an flock, the others then read the cache
+        - the cache is used for TRANSACTION_BOOTSTRAP__CACHE_TTL_SECONDS, then fetched again
+        - if fetching fails, the last good copy is used, whatever its age
+        - a cache written for other sources, or failing its sha256 check, is ignored
+    The cache holds the secrets, it is only readable by its owner.
+"""
+
+
+@dataclass
+class CacheEntry:
+    data: dict
+    created: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+
+def digest(data: Any) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf8")).hexdigest()
+
+
+class BootstrapCache:
+    """
+    Bootstrap result cached in a local file, with expiry and integrity check
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    @contextmanager
+    def lock(self):
+        """Hold the exclusive lock of the cache, one process fetches at a time."""
+        descriptor = os.open(f"{self.path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def read(self, key: str) -> CacheEntry | None:
+        """Cached result of the sources identified by ``key``.
+
+        Args:
+            key (str): digest of the sources
+
+        Returns:
+            CacheEntry | None: cached result, None if missing, written for other sources or corrupt
+        """
+        try:
+            with open(self.path, "rb") as file:
+                cached = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as exc:
+            logger.warning("Bootstrap cache %s unreadable: %s", self.path, exc)
+            return None
+
+        if cached.get("key") != key:
+            return None
+        if cached.get("sha256") != digest(cached.get("data")):
+            logger.warning("Bootstrap cache %s failed its integrity check", self.path)
+            return None
+        return CacheEntry(data=cached["data"], created=cached["created"])
+
+    def write(self, key: str, data: dict) -> None:
+        """Atomically replace the cache.
+
+        Args:
+            key (str): digest of the sources
+            data (dict): result
+        """
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(descriptor, "w") as file:
+            json.dump({"key": key, "created": time.time(), "sha256": digest(data), "data": data}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+
+def fetch_secrets(secret_name: str, region: str, endpoint_url: str | None = None) -> dict:
+    """Secrets from AWS Secrets Manager.
+
+    Args:
+        secret_name (str): secret id, holding a JSON object
+        region (str): AWS region
+        endpoint_url (str | None): Secrets Manager endpoint, for a local stand-in
+
+    Returns:
+        dict: secrets
+    """
+    import boto3
+
+    client = boto3.session.Session().client("secretsmanager", region_name=region, endpoint_url=endpoint_url)
+    response = client.get_secret_value(SecretId=secret_name)
+    return json.loads(response["SecretString"])
+
+
+def sources(client_settings, bootstrap_settings: BootstrapSettings) -> dict[str, tuple[Any, Callable[[], Any]]]:
+    """Identity and loader of every source of the client settings."""
+    found = {}
+    policy_path = getattr(client_settings, "policy_path", None)
+    if policy_path:
+        found["access_control_policy"] = (policy_path, partial(client_settings.load_access_control_policy, policy_path))
+    secret_name = getattr(client_settings, "secret_name", None)
+    if bootstrap_settings.secrets and secret_name:
+        identity = [secret_name, client_settings.region, bootstrap_settings.secrets_endpoint_url]
+        found["secrets"] = (identity, partial(fetch_secrets, *identity))
+    return found
+
+
+def fetch(loaders: dict[str, Callable[[], Any]]) -> dict:
+    """Run the loaders concurrently.
+
+    Raises:
+        Exception: first loader to fail
+    """
+    with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="bootstrap") as executor:
+        futures = {name: executor.submit(loader) for name, loader in loaders.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+def load(client_settings, bootstrap_settings: BootstrapSettings) -> dict:
+    """Fetch the sources of the client settings, through the cache if enabled.
+
+    Args:
+        client_settings: GlobusClientSettings or CEDAClientSettings
+        bootstrap_settings (BootstrapSettings): bootstrap settings
+
+    Raises:
+        Exception: fetching failed and there is no cached copy
+
+    Returns:
+        dict: result of each source
+    """
+    found = sources(client_settings, bootstrap_settings)
+    if not found:
+        return {}
+    loaders = {name: loader for name, (_, loader) in found.items()}
+    if not bootstrap_settings.cache_path:
+        return fetch(loaders)
+
+    key = digest({name: identity for name, (identity, _) in found.items()})
+    cache = BootstrapCache(bootstrap_settings.cache_path)
+    with cache.lock():
+        cached = cache.read(key)
+        if cached and cached.age < bootstrap_settings.cache_ttl_seconds:
+            logger.info("Bootstrap loaded from %s", cache.path)
+            return cached.data
+
+        started = time.perf_counter()
+        try:
+            data = fetch(loaders)
+        except Exception as exc:
+            if cached is None:
+                raise
+            logger.warning("Bootstrap failed, using the copy cached %.0fs ago: %s", cached.age, exc)
+            return cached.data
+        logger.info("Bootstrap fetched %s in %.3fs", ", ".join(loaders), time.perf_counter() - started)
+
+        try:
+            cache.write(key, data)
+        except OSError as exc:
+            logger.warning("Bootstrap cache %s not written: %s", cache.path, exc)
+        return data
+
+
+def initialize_client(client_settings=None, bootstrap_settings: BootstrapSettings | None = None) -> None:
+    """Apply the bootstrap result to the client settings, then initialize them.
+
+    Args:
+        client_settings: client settings, settings.client by default
+        bootstrap_settings (BootstrapSettings | None): bootstrap settings, settings.bootstrap by default
+    """
+    client_settings = client_settings or settings.client
+    data = load(client_settings, bootstrap_settings or settings.bootstrap)
+
+    for key, value in data.get("secrets", {}).items():
+        if key in type(client_settings).model_fields:
+            setattr(client_settings, key, value)
+    if "access_control_policy" in data and client_settings.access_control_policy is None:
+        client_settings.access_control_policy = data["access_control_policy"]
+
+    client_settings.initialize()
@@ -0,0 +1,201 @@
+import base64
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from settings import CaptureSettings
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Traffic capture
+    Only installed when TRANSACTION_CAPTURE__ENABLED is true. Requests with a method in
+    TRANSACTION_CAPTURE__METHODS (write requests by default), TRANSACTION_CAPTURE__SAMPLE_RATE of
+    them, are appended once answered to JSONL segments, <directory>/capture-<pid>-<segment>.jsonl,
+    rotated every TRANSACTION_CAPTURE__SEGMENT_BYTES and keeping the last TRANSACTION_CAPTURE__MAX_SEGMENTS
+    of each process:
+        {"time", "method", "path", "query", "headers", "requester", "body", "body_encoding",
+         "body_truncated", "status", "duration_ms"}
+    Credentials are never written: the Authorization, Cookie and token headers are dropped, and the
+    bearer token is replaced by "requester", a digest telling publishers apart. Bodies are cut at
+    TRANSACTION_CAPTURE__MAX_BODY_BYTES. test/replay.py sends captured traffic to a local instance,
+    reading it with read_captures: this module imports without the settings.
+"""
+
+SEGMENT_PREFIX = "capture-"
+SEGMENT_SUFFIX = ".jsonl"
+DROPPED_HEADERS = {"authorization", "cookie", "proxy-authorization", "set-cookie", "x-api-key", "x-profile-token"}
+BYPASS_PATHS = {"/healthcheck", "/metrics"}
+
+
+def sanitize_headers(headers: list[tuple[bytes, bytes]]) -> dict[str, str]:
+    """Request headers without credentials."""
+    sanitized = {}
+    for name, value in headers:
+        name = name.decode("latin-1").lower()
+        if name in DROPPED_HEADERS or "token" in name or "secret" in name:
+            continue
+        sanitized[name] = value.decode("latin-1")
+    return sanitized
+
+
+def requester(headers: list[tuple[bytes, bytes]]) -> str | None:
+    """Digest of the bearer token, the same for every request of a publisher."""
+    for name, value in headers:
+        if name.lower() == b"authorization":
+            return hashlib.sha256(value).hexdigest()[:16]
+    return None
+
+
+class CaptureWriter:
+    """Appends records to rotating JSONL segments of this process."""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, max_segments: int = 10) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.segment = 0
+        self.file = None
+        self.pid = None
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / f"{SEGMENT_PREFIX}{self.pid}-{segment:06d}{SEGMENT_SUFFIX}"
+
+    def _rotate(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.segment += 1
+        if self.pid != os.getpid():
+            # Segments are per process, a forked worker starts its own
+            self.pid, self.segment = os.getpid(), 0
+        self.file = open(self.segment_path(self.segment), "ab")
+        expired = self.segment - self.max_segments
+        if expired >= 0:
+            self.segment_path(expired).unlink(missing_ok=True)
+
+    def write(self, record: dict) -> None:
+        if self.file is None or self.pid != os.getpid() or self.file.tell() >= self.segment_bytes:
+            self._rotate()
+        self.file.write(json.dumps(record, separators=(",", ":")).encode("utf8") + b"\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class CaptureMiddleware:
+    """
+    ASGI middleware, recording requests as received, before the admission controller and the authorizer
+    """
+
+    def __init__(self, app, capture_settings: "CaptureSettings") -> None:
+        self.app = app
+        self.settings = capture_settings
+        self.methods = {method.upper() for method in capture_settings.methods}
+        self.writer = CaptureWriter(capture_settings.directory, capture_settings.segment_bytes, capture_settings.max_segments)
+
+    def captured(self, scope) -> bool:
+        if scope["type"] != "http" or scope["method"] not in self.methods or scope["path"] in BYPASS_PATHS:
+            return False
+        return self.settings.sample_rate >= 1.0 or random.random() < self.settings.sample_rate
+
+    def record(self, scope, started: float, body: bytes, status: int | None, duration: float) -> dict:
+        truncated = len(body) > self.settings.max_body_bytes
+        data = body[: self.settings.max_body_bytes]
+        try:
+            text, encoding = data.decode("utf8"), "utf8"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(data).decode("ascii"), "base64"
+        return {
+            "time": started,
+            "method": scope["method"],
+            "path": scope["path"],
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "headers": sanitize_headers(scope["headers"]),
+            "requester": requester(scope["headers"]),
+            "body": text,
+            "body_encoding": encoding,
+            "body_truncated": truncated,
+            "status": status,
+            "duration_ms": duration * 1000,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if not self.captured(scope):
+            return await self.app(scope, receive, send)
+
+        started = time.time()
+        start = time.perf_counter()
+        # Read ahead, so the bodies of requests rejected before the API reads them are recorded too
+        chunks = []
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+        body = b"".join(chunks)
+        body_sent = False
+        status = None
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            try:
+                self.writer.write(self.record(scope, started, body, status, time.perf_counter() - start))
+            except Exception as exc:
+                # Capture never fails a request
+                logger.warning("Request capture failed: %s", exc)
+
+
+def read_captures(directory: str) -> list[dict]:
+    """Captured requests of every process, in time order.
+
+    Args:
+        directory (str): capture directory
+
+    Returns:
+        list[dict]: records
+    """
+    records = []
+    for path in sorted(Path(directory).glob(f"{SEGMENT_PREFIX}*{SEGMENT_SUFFIX}")):
+        with path.open("rb") as f:
+            for line in f:
+                # The last line may be partial if the process was killed
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    records.sort(key=lambda record: record["time"])
+    return records
+
+
+def capture_body(record: dict) -> bytes:
+    """Request body of a captured record."""
+    if record.get("body_encoding") == "base64":
+        return base64.b64decode(record["body"])
+    return record["body"].encode("utf8")
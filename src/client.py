@@ -1,7 +1,8 @@
+import asyncio
 import logging
 import uuid
 from datetime import datetime
-from typing import Optional, Union
+from typing import Callable, Optional, Union
 
 from esgf_core_utils.models.auth import Authorizer
 from esgf_core_utils.models.exceptions import (
@@ -25,7 +26,6 @@ from esgf_core_utils.models.kafka.events import (
     Publisher,
     RequesterData,
 )
-from esgf_core_utils.models.kafka.producer import KafkaProducer
 from fastapi import Request, Response, status
 from stac_fastapi.extensions.transaction import BaseTransactionsClient
 from stac_fastapi.extensions.transaction.request import PartialItem, PatchOperation
@@ -33,7 +33,16 @@ from stac_fastapi.types.stac import Collection
 from stac_pydantic.item import Item
 from pydantic import TypeAdapter
 
+from coalesce import PatchCoalescer
+from codec import codec
+from compression import compressor
+import metrics
+from idempotency import IDEMPOTENCY_KEY_HEADER, RequestKey, idempotency_store, request_key
+from outbox import Outbox, OutboxDrainer, OutboxRecord
+from producer import get_producer
+from ratelimit import rate_limiter, requester, scheduler
 from settings import settings
+from tracing import message_headers, span
 from utils import (
     operation_to_partial_item,
     validate_extensions,
@@ -44,7 +53,6 @@ from utils import (
 # Setup logger
 # logger = logging.getLogger(__name__)
 logger = logging.getLogger("uvicorn.error")
-logger.setLevel(logging.DEBUG)
 
 patch_adapter = TypeAdapter(PartialItem | list[PatchOperation])
 
@@ -52,7 +60,42 @@ patch_adapter = TypeAdapter(PartialItem | list[PatchOperation])
 class TransactionClient(BaseTransactionsClient):
 
     def __init__(self):
-        self.producer = KafkaProducer()
+        self.producer = get_producer()
+        self.compressor = compressor
+        self.idempotency_store = idempotency_store
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.outbox = None
+        self.outbox_drainer = None
+        self.publishing = 0
+        self.coalescer = None
+        if settings.patch_coalescing.window_seconds > 0:
+            self.coalescer = PatchCoalescer(
+                window_seconds=settings.patch_coalescing.window_seconds,
+                max_patches=settings.patch_coalescing.max_patches,
+                publish=self.publish,
+            )
+
+    def open_outbox(self) -> None:
+        """Open the outbox, if enabled and not already open.
+
+        Called by the serving process: the outbox holds the flock of its slot, which a
+        preloading master (warmup.py) would otherwise share with all its workers.
+        """
+        if not settings.outbox.enabled or self.outbox is not None:
+            return
+        self.outbox = Outbox(
+            directory=settings.outbox.directory,
+            segment_bytes=settings.outbox.segment_bytes,
+            fsync=settings.outbox.fsync,
+        )
+        self.outbox_drainer = OutboxDrainer(
+            outbox=self.outbox,
+            producer=self.producer,
+            batch_size=settings.outbox.batch_size,
+            poll_interval_seconds=settings.outbox.poll_interval_seconds,
+            max_backoff_seconds=settings.outbox.max_backoff_seconds,
+        )
 
     def allowed_groups(self, properties, acp) -> list:
         if isinstance(acp, list):
@@ -102,7 +145,7 @@ class TransactionClient(BaseTransactionsClient):
             iss=token_info.get("iss"),
         )
 
-        logger.info("REQUESTER DATA: %s", requester_data)
+        logger.debug("REQUESTER DATA: %s", requester_data)
 
         auth = Auth(
             requester_data=requester_data,
@@ -138,7 +181,7 @@ class TransactionClient(BaseTransactionsClient):
             event_id=event_id,
         )
 
-        logger.info("REQUESTER DATA: %s", authorizer.requester_data)
+        logger.debug("REQUESTER DATA: %s", authorizer.requester_data)
 
         return Auth(
             requester_data=authorizer.requester_data.model_dump(),
@@ -166,6 +209,112 @@ class TransactionClient(BaseTransactionsClient):
                 event_id=event_id,
             )
 
+    async def request_key(self, method: str, collection_id: str, item_id: str, request: Request) -> RequestKey | None:
+        """Idempotency key of a request, None if idempotent publishing is disabled.
+
+        Args:
+            method (str): HTTP method
+            collection_id (str): ID of Item's Collection
+            item_id (str): ID of the Item
+            request (Request): current request
+
+        Returns:
+            RequestKey | None: key of the request
+        """
+        if not settings.idempotency.enabled:
+            return None
+
+        return request_key(
+            method=method,
+            collection_id=collection_id,
+            item_id=item_id,
+            body=await request.body(),
+            idempotency_key=request.headers.get(IDEMPOTENCY_KEY_HEADER),
+        )
+
+    def validate_item(
+        self,
+        collection_id: str,
+        item_id: str,
+        item: Item | PartialItem,
+        validate: Callable[..., None],
+    ) -> None:
+        """Validate an item's extensions, then the item.
+
+        Args:
+            collection_id (str): ID of Item's Collection
+            item_id (str): ID of the Item
+            item (Item | PartialItem): item to be validated
+            validate (Callable[..., None]): ``validate_post`` or ``validate_patch``
+        """
+        item_extensions = item.stac_extensions if item.stac_extensions else []
+        with metrics.stage("extensions"), span("validate_extensions"):
+            item_extensions = validate_extensions(collection_id=collection_id, item_extensions=item_extensions)
+        with span(validate.__name__, extensions=len(item_extensions)):
+            validate(
+                item_id=item_id,
+                item=item,
+                extensions=item_extensions,
+            )
+
+    async def schedule_validation(self, auth: Auth, request: Request, **kwargs) -> None:
+        """Validate an item, in the fair scheduler if enabled.
+
+        Args:
+            auth (Auth): authorized requester, the scheduling flow
+            request (Request): current request, costed by its body size
+        """
+        if self.scheduler is None:
+            return self.validate_item(**kwargs)
+
+        cost = int(request.headers.get("content-length") or 1)
+        await self.scheduler.run(requester(auth), cost, self.validate_item, **kwargs)
+
+    def event_backlog(self) -> int:
+        """Events accepted and not yet delivered: produces in flight, and records waiting in the outbox.
+
+        Returns:
+            int: number of events
+        """
+        return self.publishing + (self.outbox.backlog() if self.outbox else 0)
+
+    async def publish(self, key: str, event: KafkaEvent, request_id: str, event_id: str) -> None:
+        """Encode, compress and produce an event to the success event stream,
+        or append it to the outbox if enabled.
+
+        Args:
+            key (str): message key, the item id
+            event (KafkaEvent): event to be published
+            request_id (str): request id, for the error instance
+            event_id (str): event id, for the error instance
+
+        Raises:
+            UnknownException: Event could not be produced
+        """
+        with metrics.stage("serialization"):
+            value, headers = self.compressor.compress(codec.encode_event(event))
+
+        self.publishing += 1
+        try:
+            with metrics.stage("produce"), span("outbox.append" if self.outbox else "kafka.produce", key=key):
+                headers = headers + message_headers(request_id)
+                if self.outbox:
+                    await self.outbox.put(OutboxRecord(key=key.encode(), value=value, headers=headers))
+                else:
+                    # Delivery is waited for in a thread, a slow broker builds up produces in flight
+                    await asyncio.to_thread(
+                        self.producer.success,
+                        key=key,
+                        value=value,
+                        headers=headers,
+                    )
+
+        except Exception as exc:
+            logger.error("Error producing message: %s", exc)
+            raise UnknownException(instance=f"{request_id}:{event_id}") from exc
+        finally:
+            self.publishing -= 1
+
     async def create_item(
         self,
         collection_id: str,
@@ -177,80 +326,94 @@ class TransactionClient(BaseTransactionsClient):
 
         event_id = uuid.uuid4().hex
         request_id = headers.get("x-request-id", uuid.uuid4().hex)
+        metrics.set_request_labels(collection_id, "POST")
 
         try:
-            auth = self.authorize(
-                item=item,
-                role="CREATE",
-                request=request,
-                collection_id=collection_id,
-                request_id=request_id,
-                event_id=event_id,
-            )
+            with metrics.stage("authorize"), span("authorize", collection_id=collection_id, role="CREATE"):
+                auth = self.authorize(
+                    item=item,
+                    role="CREATE",
+                    request=request,
+                    collection_id=collection_id,
+                    request_id=request_id,
+                    event_id=event_id,
+                )
 
         except MissingPermissionException as exc:
             raise AuthorizationException(instance=f"{request_id}:{event_id}") from exc
 
-        item_extensions = item.stac_extensions if item.stac_extensions else []
+        if self.rate_limiter:
+            await self.rate_limiter.check(auth, collection_id=collection_id, instance=f"{request_id}:{event_id}")
+
+        key = await self.request_key(method="POST", collection_id=collection_id, item_id=item.id, request=request)
+        if key:
+            duplicate = await self.idempotency_store.lookup(key, instance=f"{request_id}:{event_id}")
+            if duplicate:
+                logger.info("Duplicate POST request for %s/%s", collection_id, item.id)
+                return duplicate
+
         try:
-            item_extensions = validate_extensions(collection_id=collection_id, item_extensions=item_extensions)
-            validate_post(
-                item_id=item.id,
-                item=item,
-                extensions=item_extensions,
+            try:
+                await self.schedule_validation(
+                    auth,
+                    request,
+                    collection_id=collection_id,
+                    item_id=item.id,
+                    item=item,
+                    validate=validate_post,
+                )
+
+            except (
+                ExpectedExtensionsMissingException,
+                OperationNotPermittedException,
+                STACValidationException,
+                UnexpectedExtensionException,
+                ExtensionBelowMinimumException,
+            ) as exc:
+                rfc_exc = RFC9457Exception()
+                rfc_exc.status_code = 400
+                rfc_exc.type = exc.type
+                rfc_exc.title = exc.title
+                rfc_exc.detail = exc.detail
+                rfc_exc.instance = f"{request_id}:{event_id}"
+                raise rfc_exc from exc
+
+            user_agent = headers.get("user-agent", "/").split("/")
+
+            payload = CreatePayload(
+                method="POST",
+                collection_id=collection_id,
+                item=item.model_dump(),
             )
 
-        except (
-            ExpectedExtensionsMissingException,
-            OperationNotPermittedException,
-            STACValidationException,
-            UnexpectedExtensionException,
-            ExtensionBelowMinimumException,
-        ) as exc:
-            rfc_exc = RFC9457Exception()
-            rfc_exc.status_code = 400
-            rfc_exc.type = exc.type
-            rfc_exc.title = exc.title
-            rfc_exc.detail = exc.detail
-            rfc_exc.instance = f"{request_id}:{event_id}"
-            raise rfc_exc from exc
-
-        user_agent = headers.get("user-agent", "/").split("/")
-
-        payload = CreatePayload(
-            method="POST",
-            collection_id=collection_id,
-            item=item.model_dump(),
-        )
+            data = Data(type="STAC", payload=payload)
 
-        data = Data(type="STAC", payload=payload)
+            publisher = Publisher(package=user_agent[0], version=user_agent[1] if len(user_agent) > 1 else "")
 
-        publisher = Publisher(package=user_agent[0], version=user_agent[1] if len(user_agent) > 1 else "")
+            metadata = Metadata(
+                auth=auth,
+                event_id=event_id,
+                publisher=publisher,
+                request_id=request_id,
+                time=datetime.now().isoformat(),
+                schema_version="1.0.0",
+            )
+            event = KafkaEvent(metadata=metadata, data=data)
 
-        metadata = Metadata(
-            auth=auth,
-            event_id=event_id,
-            publisher=publisher,
-            request_id=request_id,
-            time=datetime.now().isoformat(),
-            schema_version="1.0.0",
-        )
-        event = KafkaEvent(metadata=metadata, data=data)
+            await self.publish(key=item.id, event=event, request_id=request_id, event_id=event_id)
 
-        try:
-            self.producer.success(
-                key=item.id,
-                value=event.model_dump_json().encode("utf8"),
+            response = Response(
+                status_code=status.HTTP_202_ACCEPTED,
+                content="Item queued for publication",
             )
+            if key:
+                self.idempotency_store.record(key, response)
 
-        except Exception as exc:
-            logger.error("Error producing message: %s", exc)
-            raise UnknownException(instance=f"{request_id}:{event_id}") from exc
-
-        return Response(
-            status_code=status.HTTP_202_ACCEPTED,
-            content="Item queued for publication",
-        )
+            return response
+        finally:
+            if key:
+                # Once recorded a no-op, otherwise a duplicate waiting for this request is handled as new
+                self.idempotency_store.release(key)
 
     async def update_item(
         self,
@@ -268,85 +431,101 @@ class TransactionClient(BaseTransactionsClient):
         patch: PartialItem | list[PatchOperation],
         request: Request,
     ) -> Item | Response | None:
-        logger.info("PATCH REQUEST: %s", patch)
+        logger.info("PATCH REQUEST: %s/%s", collection_id, item_id)
+        logger.debug("PATCH BODY: %s", patch)
 
         item = operation_to_partial_item(collection_id=collection_id, operations=patch) if isinstance(patch, list) else patch
 
-        headers = request.headers.get("headers", {})
+        headers = request.headers
 
         event_id = uuid.uuid4().hex
-        request_id = headers.get("X-Request-ID", uuid.uuid4().hex)
-
-        auth = self.authorize(
-            collection_id=collection_id,
-            item=item,
-            role="UPDATE",
-            request=request,
-            request_id=request_id,
-            event_id=event_id,
-        )
-
-        item_extensions = item.stac_extensions if item.stac_extensions else []
-        try:
-
-            item_extensions = validate_extensions(collection_id=collection_id, item_extensions=item_extensions)
+        request_id = headers.get("x-request-id", uuid.uuid4().hex)
+        metrics.set_request_labels(collection_id, "PATCH")
 
-            validate_patch(
-                item_id=item_id,
+        with metrics.stage("authorize"), span("authorize", collection_id=collection_id, role="UPDATE"):
+            auth = self.authorize(
+                collection_id=collection_id,
                 item=item,
-                extensions=item_extensions,
+                role="UPDATE",
+                request=request,
+                request_id=request_id,
+                event_id=event_id,
             )
-        except (
-            ExpectedExtensionsMissingException,
-            OperationNotPermittedException,
-            STACValidationException,
-            UnexpectedExtensionException,
-            ExtensionBelowMinimumException,
-        ) as exc:
-            rfc_exc = RFC9457Exception()
-            rfc_exc.status_code = 400
-            rfc_exc.type = exc.type
-            rfc_exc.title = exc.title
-            rfc_exc.detail = exc.detail
-            rfc_exc.instance = f"{request_id}:{event_id}"
-            raise rfc_exc from exc
-
-        user_agent = headers.get("user-agent", "/").split("/")
-
-        payload = PatchPayload(
-            method="PATCH",
-            collection_id=collection_id,
-            item_id=item_id,
-            patch=patch_adapter.dump_python(patch),
-        )
 
-        data = Data(type="STAC", payload=payload)
+        if self.rate_limiter:
+            await self.rate_limiter.check(auth, collection_id=collection_id, instance=f"{request_id}:{event_id}")
 
-        publisher = Publisher(package=user_agent[0], version=user_agent[1] if len(user_agent) > 1 else "")
-        metadata = Metadata(
-            auth=auth,
-            event_id=event_id,
-            publisher=publisher,
-            request_id=request_id,
-            time=datetime.now().isoformat(),
-            schema_version="1.0.0",
-        )
-        event = KafkaEvent(metadata=metadata, data=data)
+        key = await self.request_key(method="PATCH", collection_id=collection_id, item_id=item_id, request=request)
+        if key:
+            duplicate = await self.idempotency_store.lookup(key, instance=f"{request_id}:{event_id}")
+            if duplicate:
+                logger.info("Duplicate PATCH request for %s/%s", collection_id, item_id)
+                return duplicate
 
         try:
-            self.producer.success(
-                key=item_id,
-                value=event.model_dump_json().encode("utf8"),
+            try:
+                await self.schedule_validation(
+                    auth,
+                    request,
+                    collection_id=collection_id,
+                    item_id=item_id,
+                    item=item,
+                    validate=validate_patch,
+                )
+            except (
+                ExpectedExtensionsMissingException,
+                OperationNotPermittedException,
+                STACValidationException,
+                UnexpectedExtensionException,
+                ExtensionBelowMinimumException,
+            ) as exc:
+                rfc_exc = RFC9457Exception()
+                rfc_exc.status_code = 400
+                rfc_exc.type = exc.type
+                rfc_exc.title = exc.title
+                rfc_exc.detail = exc.detail
+                rfc_exc.instance = f"{request_id}:{event_id}"
+                raise rfc_exc from exc
+
+            user_agent = headers.get("user-agent", "/").split("/")
+
+            publisher = Publisher(package=user_agent[0], version=user_agent[1] if len(user_agent) > 1 else "")
+            metadata = Metadata(
+                auth=auth,
+                event_id=event_id,
+                publisher=publisher,
+                request_id=request_id,
+                time=datetime.now().isoformat(),
+                schema_version="1.0.0",
             )
 
-        except Exception as exc:
-            logger.error("Error producing message: %s", exc)
-            raise UnknownException(instance=f"{request_id}:{event_id}") from exc
+            if self.coalescer:
+                await self.coalescer.submit(collection_id=collection_id, item_id=item_id, patch=patch, metadata=metadata)
+            else:
+                payload = PatchPayload(
+                    method="PATCH",
+                    collection_id=collection_id,
+                    item_id=item_id,
+                    patch=patch_adapter.dump_python(patch),
+                )
 
-        return Response(
-            status_code=status.HTTP_202_ACCEPTED,
-            content="Item queued for update",
-        )
+                data = Data(type="STAC", payload=payload)
+
+                event = KafkaEvent(metadata=metadata, data=data)
+                await self.publish(key=item_id, event=event, request_id=request_id, event_id=event_id)
+
+            response = Response(
+                status_code=status.HTTP_202_ACCEPTED,
+                content="Item queued for update",
+            )
+            if key:
+                self.idempotency_store.record(key, response)
+
+            return response
+        finally:
+            if key:
+                # Once recorded a no-op, otherwise a duplicate waiting for this request is handled as new
+                self.idempotency_store.release(key)
 
     async def delete_item(
         self,
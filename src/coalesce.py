@@ -0,0 +1,230 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from esgf_core_utils.models.exceptions import RFC9457Exception, UnknownException
+from esgf_core_utils.models.kafka.events import Data, KafkaEvent, Metadata, PatchPayload
+from pydantic import TypeAdapter
+from stac_fastapi.extensions.transaction.request import PartialItem, PatchOperation
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+PATCH coalescing
+    PATCH requests for the same (collection_id, item_id) arriving within
+    TRANSACTION_PATCH_COALESCING__WINDOW_SECONDS of the first one are merged into a single event.
+    Compatible patches:
+        - JSON patches (RFC 6902) are concatenated
+        - merge patches (RFC 7396) are composed, later values win
+        - patches from the same requester
+    An incompatible patch flushes the pending event before starting a new one, so the order
+    of changes is kept. Every request is answered once its event has been produced.
+"""
+
+patch_adapter = TypeAdapter(PartialItem | list[PatchOperation])
+
+
+class CoalescedMetadata(Metadata):
+    """
+    Metadata of an event coalescing several requests,
+    ``request_id`` and ``event_id`` are those of the first request.
+    """
+
+    request_ids: list[str]
+    event_ids: list[str]
+
+
+class CoalescedKafkaEvent(KafkaEvent):
+    """
+    Kafka event coalescing several PATCH requests.
+    """
+
+    metadata: CoalescedMetadata
+
+
+class IncompatiblePatchException(Exception):
+    """
+    Patches cannot be merged into one
+    """
+
+
+def compose_merge_patches(first: dict, second: dict) -> dict:
+    """Compose two merge patches, applying the result is equivalent to applying ``first`` then ``second``.
+
+    Args:
+        first (dict): first merge patch
+        second (dict): second merge patch
+
+    Raises:
+        IncompatiblePatchException: ``second`` merges into a value ``first`` replaces or removes
+
+    Returns:
+        dict: composed merge patch
+    """
+    composed = dict(first)
+    for key, value in second.items():
+        if isinstance(value, dict) and key in composed:
+            if not isinstance(composed[key], dict):
+                raise IncompatiblePatchException(key)
+            composed[key] = compose_merge_patches(composed[key], value)
+        else:
+            composed[key] = value
+    return composed
+
+
+class _Batch:
+    """Patches waiting to be produced as one event."""
+
+    def __init__(self, patch: PartialItem | list[PatchOperation], metadata: Metadata) -> None:
+        self.patch = patch.model_dump() if isinstance(patch, PartialItem) else list(patch)
+        self.metadata = metadata
+        self.request_ids = [metadata.request_id]
+        self.event_ids = [metadata.event_id]
+        self.waiters = [asyncio.get_running_loop().create_future()]
+        self.timer: asyncio.TimerHandle | None = None
+
+    def add(self, patch: PartialItem | list[PatchOperation], metadata: Metadata) -> bool:
+        """Merge a patch into the batch.
+
+        Returns:
+            bool: False if the patch is incompatible with the batch
+        """
+        if metadata.auth != self.metadata.auth:
+            return False
+
+        if isinstance(patch, PartialItem):
+            if not isinstance(self.patch, dict):
+                return False
+            try:
+                self.patch = compose_merge_patches(self.patch, patch.model_dump())
+            except IncompatiblePatchException:
+                return False
+        else:
+            if not isinstance(self.patch, list):
+                return False
+            self.patch.extend(patch)
+
+        self.request_ids.append(metadata.request_id)
+        self.event_ids.append(metadata.event_id)
+        self.waiters.append(asyncio.get_running_loop().create_future())
+        return True
+
+    def event(self, collection_id: str, item_id: str) -> CoalescedKafkaEvent:
+        patch = PartialItem.model_validate(self.patch) if isinstance(self.patch, dict) else self.patch
+        payload = PatchPayload(
+            method="PATCH",
+            collection_id=collection_id,
+            item_id=item_id,
+            patch=patch_adapter.dump_python(patch),
+        )
+        metadata = CoalescedMetadata(
+            **self.metadata.model_dump(),
+            request_ids=self.request_ids,
+            event_ids=self.event_ids,
+        )
+        return CoalescedKafkaEvent(metadata=metadata, data=Data(type="STAC", payload=payload))
+
+
+class PatchCoalescer:
+    """Merges PATCH requests for the same item within a short window."""
+
+    def __init__(
+        self,
+        window_seconds: float,
+        max_patches: int,
+        publish: Callable[..., Awaitable[None]],
+    ) -> None:
+        self.window_seconds = window_seconds
+        self.max_patches = max_patches
+        self._publish = publish
+        self._batches: dict[tuple[str, str], _Batch] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(
+        self,
+        collection_id: str,
+        item_id: str,
+        patch: PartialItem | list[PatchOperation],
+        metadata: Metadata,
+    ) -> None:
+        """Queue a validated patch and wait until it has been produced.
+
+        Args:
+            collection_id (str): ID of Item's Collection
+            item_id (str): ID of the Item
+            patch (PartialItem | list[PatchOperation]): validated patch
+            metadata (Metadata): metadata of the request
+
+        Raises:
+            UnknownException: Event could not be produced
+        """
+        key = (collection_id, item_id)
+        while True:
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = _Batch(patch, metadata)
+                batch.timer = asyncio.get_running_loop().call_later(self.window_seconds, self._flush_later, key, batch)
+                self._batches[key] = batch
+                break
+            if batch.add(patch, metadata):
+                break
+            # Another request may start a batch of the item while this one is produced, joined next
+            await self.flush(key, batch)
+
+        waiter = batch.waiters[-1]
+        if len(batch.waiters) >= self.max_patches:
+            await self.flush(key, batch)
+
+        try:
+            await waiter
+        except RFC9457Exception as exc:
+            raise UnknownException(instance=f"{metadata.request_id}:{metadata.event_id}") from exc
+
+    def _flush_later(self, key: tuple[str, str], batch: _Batch) -> None:
+        task = asyncio.get_running_loop().create_task(self.flush(key, batch))
+        # Referenced until done, the event loop only keeps weak references to tasks
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self, key: tuple[str, str], batch: _Batch | None = None) -> None:
+        """Produce the pending event of an item.
+
+        Args:
+            key (tuple[str, str]): (collection_id, item_id)
+            batch (_Batch | None, optional): only if it is still the pending batch. Defaults to any.
+        """
+        pending = self._batches.get(key)
+        if pending is None or (batch is not None and pending is not batch):
+            return
+        del self._batches[key]
+        batch = pending
+        if batch.timer is not None:
+            batch.timer.cancel()
+
+        collection_id, item_id = key
+        if len(batch.waiters) > 1:
+            logger.info("Coalesced %s PATCH requests for %s/%s", len(batch.waiters), collection_id, item_id)
+
+        try:
+            await self._publish(
+                key=item_id,
+                event=batch.event(collection_id=collection_id, item_id=item_id),
+                request_id=batch.metadata.request_id,
+                event_id=batch.metadata.event_id,
+            )
+        except Exception as exc:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+        else:
+            for waiter in batch.waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def flush_all(self) -> None:
+        """Produce all pending events, on shutdown."""
+        for key in list(self._batches):
+            await self.flush(key)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,172 @@
+import json
+from typing import Any
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+from settings import settings
+
+"""
+JSON codec
+    Used for: request bodies, JSON responses, jsonschema validation input, Kafka event values
+    Backends: json (stdlib), orjson, msgspec
+    Selected at startup: TRANSACTION_CODEC
+"""
+
+
+class JSONCodec:
+    """
+    Standard library JSON codec.
+    """
+
+    name = "json"
+
+    def loads(self, data: bytes | str) -> Any:
+        """Decode a JSON document.
+
+        Args:
+            data (bytes | str): JSON document
+
+        Raises:
+            json.JSONDecodeError: Invalid JSON
+
+        Returns:
+            Any: decoded document
+        """
+        return json.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        """Encode an object as compact UTF-8 JSON.
+
+        Args:
+            obj (Any): object to be encoded
+
+        Returns:
+            bytes: JSON document
+        """
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf8")
+
+    def encode_event(self, event: BaseModel) -> bytes:
+        """Encode a Kafka event as UTF-8 JSON.
+
+        pydantic-core serializes straight to bytes, which is faster than any
+        of the backends working from ``model_dump`` so it is shared by all codecs.
+
+        Args:
+            event (BaseModel): event to be encoded
+
+        Returns:
+            bytes: JSON document, identical to ``event.model_dump_json().encode("utf8")``
+        """
+        return event.__pydantic_serializer__.to_json(event)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    orjson codec.
+    """
+
+    name = "orjson"
+
+    def __init__(self) -> None:
+        import orjson
+
+        self._orjson = orjson
+
+    def loads(self, data: bytes | str) -> Any:
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        return self._orjson.loads(data)
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._orjson.dumps(obj)
+
+
+class MsgspecCodec(JSONCodec):
+    """
+    msgspec codec.
+    """
+
+    name = "msgspec"
+
+    def __init__(self) -> None:
+        import msgspec
+
+        self._decode_error = msgspec.DecodeError
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+
+    def loads(self, data: bytes | str) -> Any:
+        try:
+            return self._decoder.decode(data)
+        except self._decode_error as exc:
+            # FastAPI turns json.JSONDecodeError into a 422 response
+            raise json.JSONDecodeError(str(exc), data if isinstance(data, str) else data.decode("utf8", "replace"), 0) from exc
+
+    def dumps(self, obj: Any) -> bytes:
+        return self._encoder.encode(obj)
+
+
+CODECS = {
+    JSONCodec.name: JSONCodec,
+    OrjsonCodec.name: OrjsonCodec,
+    MsgspecCodec.name: MsgspecCodec,
+}
+
+
+def get_codec(name: str) -> JSONCodec:
+    """Get a codec by name.
+
+    Args:
+        name (str): codec name, one of ``CODECS``
+
+    Raises:
+        ValueError: Unknown codec
+        ImportError: Codec backend not installed
+
+    Returns:
+        JSONCodec: codec
+    """
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown codec {name}, expected one of {', '.join(CODECS)}")
+
+
+codec = get_codec(settings.codec)
+
+
+class CodecRequest(Request):
+    """
+    Request decoding its JSON body with the configured codec.
+    """
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            body = await self.body()
+            self._json = codec.loads(body)
+        return self._json
+
+
+class CodecRoute(APIRoute):
+    """
+    Route parsing request bodies with the configured codec.
+    """
+
+    def get_route_handler(self):
+        route_handler = super().get_route_handler()
+
+        async def codec_route_handler(request: Request):
+            return await route_handler(CodecRequest(request.scope, request.receive))
+
+        return codec_route_handler
+
+
+class CodecJSONResponse(JSONResponse):
+    """
+    JSON response rendered with the configured codec.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return codec.dumps(content)
@@ -0,0 +1,122 @@
+import threading
+from pathlib import Path
+
+from settings import CompressionSettings, settings
+
+"""
+Kafka event value compression
+    Algorithms: none, zstd (optionally with a trained dictionary, see scripts/train_zstd_dictionary.py)
+    Message headers:
+        content-encoding: zstd
+        zstd-dictionary-id: dictionary id, only when a dictionary is used
+    Selected at startup: TRANSACTION_COMPRESSION__ALGORITHM
+"""
+
+CONTENT_ENCODING_HEADER = "content-encoding"
+DICTIONARY_ID_HEADER = "zstd-dictionary-id"
+
+
+class Compressor:
+    """
+    Identity compressor, values are sent as is without a content-encoding header.
+    """
+
+    encoding = "identity"
+
+    def compress(self, value: bytes) -> tuple[bytes, list[tuple[str, bytes]]]:
+        """Compress an event value.
+
+        Args:
+            value (bytes): encoded event
+
+        Returns:
+            tuple[bytes, list[tuple[str, bytes]]]: compressed value and the Kafka headers describing it
+        """
+        return value, []
+
+
+class ZstdCompressor(Compressor):
+    """
+    Zstandard compressor, with an optional pre-trained dictionary.
+    """
+
+    encoding = "zstd"
+
+    def __init__(self, level: int = 3, dictionary_path: str | None = None) -> None:
+        import zstandard
+
+        self._zstandard = zstandard
+        self.level = level
+        self.dictionary = None
+        self.headers = [(CONTENT_ENCODING_HEADER, self.encoding.encode())]
+
+        if dictionary_path:
+            self.dictionary = zstandard.ZstdCompressionDict(Path(dictionary_path).read_bytes())
+            self.dictionary.precompute_compress(level=level)
+            self.headers.append((DICTIONARY_ID_HEADER, str(self.dictionary.dict_id()).encode()))
+
+        # ZstdCompressor instances must not be shared between threads
+        self._local = threading.local()
+
+    @property
+    def _compressor(self):
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._zstandard.ZstdCompressor(level=self.level, dict_data=self.dictionary)
+            self._local.compressor = compressor
+        return compressor
+
+    def compress(self, value: bytes) -> tuple[bytes, list[tuple[str, bytes]]]:
+        return self._compressor.compress(value), list(self.headers)
+
+
+def get_compressor(compression: CompressionSettings) -> Compressor:
+    """Get the compressor for the compression settings.
+
+    Args:
+        compression (CompressionSettings): compression settings
+
+    Returns:
+        Compressor: compressor
+    """
+    if compression.algorithm == "zstd":
+        return ZstdCompressor(level=compression.level, dictionary_path=compression.dictionary_path)
+    return Compressor()
+
+
+def decompress(value: bytes, headers: list[tuple[str, bytes]] | None, dictionaries: dict[int, bytes] | None = None) -> bytes:
+    """Decompress an event value using its Kafka headers, as a consumer would.
+
+    Args:
+        value (bytes): message value
+        headers (list[tuple[str, bytes]] | None): message headers
+        dictionaries (dict[int, bytes] | None): zstd dictionaries by dictionary id
+
+    Raises:
+        ValueError: Unsupported content-encoding or unknown dictionary
+
+    Returns:
+        bytes: encoded event
+    """
+    headers = dict(headers or [])
+    encoding = headers.get(CONTENT_ENCODING_HEADER, b"identity").decode()
+
+    if encoding == "identity":
+        return value
+
+    if encoding != "zstd":
+        raise ValueError(f"Unsupported content-encoding {encoding}")
+
+    import zstandard
+
+    dictionary = None
+    if DICTIONARY_ID_HEADER in headers:
+        dictionary_id = int(headers[DICTIONARY_ID_HEADER])
+        if dictionary_id not in (dictionaries or {}):
+            raise ValueError(f"Unknown zstd dictionary {dictionary_id}")
+        dictionary = zstandard.ZstdCompressionDict(dictionaries[dictionary_id])
+
+    return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(value)
+
+
+compressor = get_compressor(settings.compression)
@@ -0,0 +1,89 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Callable
+
+"""
+Fast lane
+    ASGI middleware in front of every other middleware, serving GET and HEAD of a few paths with
+    responses encoded once: no authorization, admission, capture, profiling, tracing or routing.
+    The load balancer polls /healthcheck constantly, browsers fetch /favicon.ico, and clients fetch
+    /openapi.json and /scope (EGI) before their requests.
+    A route returns None to let the request through to the API instead, e.g. until startup is done.
+    Cacheable responses carry an ETag, and If-None-Match is answered 304 Not Modified.
+"""
+
+NO_STORE = "no-store"
+
+
+@dataclass(frozen=True)
+class StaticResponse:
+    status: int
+    headers: list[tuple[bytes, bytes]]
+    body: bytes
+    etag: bytes | None = None
+
+
+def static_response(status: int, body: bytes, content_type: str, cache_control: str = NO_STORE) -> StaticResponse:
+    """A response encoded once, with an ETag unless ``no-store``.
+
+    Args:
+        status (int): status code
+        body (bytes): body
+        content_type (str): Content-Type
+        cache_control (str): Cache-Control
+
+    Returns:
+        StaticResponse: response
+    """
+    headers = [
+        (b"content-type", content_type.encode("latin-1")),
+        (b"content-length", str(len(body)).encode("latin-1")),
+        (b"cache-control", cache_control.encode("latin-1")),
+    ]
+    etag = None
+    if cache_control != NO_STORE:
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'.encode("latin-1")
+        headers.append((b"etag", etag))
+    return StaticResponse(status=status, headers=headers, body=body, etag=etag)
+
+
+def once(build: Callable[[], StaticResponse | None]) -> Callable[[], StaticResponse | None]:
+    """Route building its response on first use, then serving it unchanged. Not cached while None."""
+    response = None
+
+    def route() -> StaticResponse | None:
+        nonlocal response
+        if response is None:
+            response = build()
+        return response
+
+    return route
+
+
+class FastLane:
+    """
+    ASGI middleware serving the static responses of its routes, passing other requests on
+    """
+
+    def __init__(self, app, routes: dict[str, Callable[[], StaticResponse | None]]) -> None:
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            route = self.routes.get(scope["path"])
+            response = route() if route else None
+            if response is not None:
+                return await self.respond(scope, send, response)
+        await self.app(scope, receive, send)
+
+    async def respond(self, scope, send, response: StaticResponse) -> None:
+        status, headers, body = response.status, response.headers, response.body
+        if response.etag:
+            for name, value in scope["headers"]:
+                if name == b"if-none-match" and response.etag in (tag.strip() for tag in value.split(b",")):
+                    status, body = 304, b""
+                    headers = [(name, value) for name, value in headers if name in (b"cache-control", b"etag")]
+                    break
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
@@ -0,0 +1,38 @@
+import os
+
+"""
+Gunicorn configuration, preloading the API in the master before forking uvicorn workers
+    gunicorn --workers 4
+    The master imports the API, runs the startup steps and the warm-up once (warmup.py), then
+    forks the workers, which share its compiled validators and access control policy.
+    Requires the gunicorn dependency group. Any setting can be overridden on the command line,
+    e.g. --bind, --workers (or WEB_CONCURRENCY), --forwarded-allow-ips, --keyfile and --certfile.
+"""
+
+wsgi_app = "api:app"
+bind = ["0.0.0.0:8000"]
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+
+def when_ready(server):
+    # Called in the master once the API is imported and before the workers are forked
+    import api
+    import warmup
+
+    warmup.preload(api.core_client)
+
+
+def post_worker_init(worker):
+    # The uvicorn worker replaced the handlers of the uvicorn loggers with those of gunicorn
+    import logs
+    from settings import settings
+
+    logs.configure(settings.logging)
+
+
+def child_exit(server, worker):
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+
+from esgf_core_utils.models.exceptions import RFC9457Exception
+from fastapi import Response
+
+from settings import settings
+
+"""
+Idempotent publishing
+    Duplicate requests are answered with the original response, skipping validation and Kafka.
+    A request is a duplicate if either:
+        - it repeats an Idempotency-Key header, for the same item, with the same body
+        - its body is identical to the last change accepted for the same item
+    Entries expire after TRANSACTION_IDEMPOTENCY__TTL_SECONDS and at most
+    TRANSACTION_IDEMPOTENCY__MAX_ENTRIES are kept, per process.
+    A request not found is reserved until its response is recorded or it fails: a duplicate
+    arriving meanwhile, e.g. a retry racing its original, waits for it instead of publishing again.
+"""
+
+IDEMPOTENCY_KEY_HEADER = "idempotency-key"
+IDEMPOTENT_REPLAYED_HEADER = "Idempotent-Replayed"
+
+
+class IdempotencyKeyReusedException(RFC9457Exception):
+    """
+    Idempotency key reused with a different request
+    """
+
+    def __init__(self, idempotency_key: str, instance: str) -> None:
+        self.status_code = 422
+        self.type = "https://esgf.io/publication/errors/idempotency-key-reused"
+        self.title = "The Idempotency-Key has already been used for a different request"
+        self.detail = (
+            f"The Idempotency-Key `{idempotency_key}` was already used for a request with a different body "
+            "-- please use a new key for each distinct request and try again."
+        )
+        self.instance = instance
+
+
+@dataclass(frozen=True)
+class RequestKey:
+    item: str
+    digest: str
+    idempotency_key: str | None = None
+
+
+@dataclass
+class _CachedResponse:
+    expires_at: float
+    digest: str
+    status_code: int
+    content: bytes
+
+
+def request_key(
+    method: str,
+    collection_id: str,
+    item_id: str,
+    body: bytes,
+    idempotency_key: str | None = None,
+) -> RequestKey:
+    """Build the idempotency key of a request.
+
+    Args:
+        method (str): HTTP method
+        collection_id (str): ID of Item's Collection
+        item_id (str): ID of the Item
+        body (bytes): raw request body
+        idempotency_key (str | None): Idempotency-Key header
+
+    Returns:
+        RequestKey: key of the request
+    """
+    digest = hashlib.sha256(method.encode() + b"\n" + body).hexdigest()
+    return RequestKey(item=f"{collection_id}/{item_id}", digest=digest, idempotency_key=idempotency_key)
+
+
+class IdempotencyStore:
+    """Bounded in-process TTL store of accepted responses."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int) -> None:
+        self._ttl_seconds = ttl_seconds
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, _CachedResponse] = OrderedDict()
+        self._in_flight: dict[str, tuple[str, asyncio.Future]] = {}
+        self._lock = Lock()
+
+    def _get(self, key: str, now: float) -> _CachedResponse | None:
+        entry = self._entries.get(key)
+        if entry is not None and now >= entry.expires_at:
+            del self._entries[key]
+            return None
+        return entry
+
+    def _set(self, key: str, entry: _CachedResponse) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    @staticmethod
+    def _reservation(key: RequestKey) -> str:
+        if key.idempotency_key:
+            return f"{key.item}#{key.idempotency_key}"
+        return f"{key.item}@{key.digest}"
+
+    async def lookup(self, key: RequestKey, instance: str) -> Response | None:
+        """Get the original response of a duplicate request, or reserve the request.
+
+        A request not found is reserved, until ``record`` or ``release`` is called for it.
+
+        Args:
+            key (RequestKey): key of the request
+            instance (str): error instance
+
+        Raises:
+            IdempotencyKeyReusedException: Idempotency-Key reused with a different body
+
+        Returns:
+            Response | None: original response, None if the request is not a duplicate
+        """
+        reservation = self._reservation(key)
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                if key.idempotency_key:
+                    entry = self._get(reservation, now)
+                    if entry is not None and entry.digest != key.digest:
+                        raise IdempotencyKeyReusedException(idempotency_key=key.idempotency_key, instance=instance)
+                else:
+                    entry = self._get(key.item, now)
+                    if entry is not None and entry.digest != key.digest:
+                        entry = None
+
+                if entry is None:
+                    in_flight = self._in_flight.get(reservation)
+                    if in_flight is None:
+                        self._in_flight[reservation] = (key.digest, asyncio.get_running_loop().create_future())
+                        return None
+                    digest, done = in_flight
+                    if digest != key.digest:
+                        raise IdempotencyKeyReusedException(idempotency_key=key.idempotency_key, instance=instance)
+
+            if entry is not None:
+                return Response(
+                    status_code=entry.status_code,
+                    content=entry.content,
+                    headers={IDEMPOTENT_REPLAYED_HEADER: "true"},
+                )
+            # Looked up again once the original request is answered, reserved again if it failed
+            await asyncio.shield(done)
+
+    def release(self, key: RequestKey) -> None:
+        """Release the reservation of a request, if still held.
+
+        Args:
+            key (RequestKey): key of the request
+        """
+        with self._lock:
+            in_flight = self._in_flight.pop(self._reservation(key), None)
+        if in_flight is not None and not in_flight[1].done():
+            in_flight[1].set_result(None)
+
+    def record(self, key: RequestKey, response: Response) -> None:
+        """Record the response of an accepted request.
+
+        Args:
+            key (RequestKey): key of the request
+            response (Response): response sent
+        """
+        if self._ttl_seconds <= 0:
+            self.release(key)
+            return
+        entry = _CachedResponse(
+            expires_at=time.monotonic() + self._ttl_seconds,
+            digest=key.digest,
+            status_code=response.status_code,
+            content=response.body,
+        )
+        with self._lock:
+            # The last accepted change of an item replaces any earlier one,
+            # so re-sending an older body after a different change is not a duplicate
+            self._set(key.item, entry)
+            if key.idempotency_key:
+                self._set(f"{key.item}#{key.idempotency_key}", entry)
+        self.release(key)
+
+
+idempotency_store = IdempotencyStore(
+    ttl_seconds=settings.idempotency.ttl_seconds if settings.idempotency.enabled else 0,
+    max_entries=settings.idempotency.max_entries,
+)
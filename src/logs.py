@@ -0,0 +1,218 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import threading
+from collections.abc import Mapping
+from logging.handlers import QueueListener
+from typing import TYPE_CHECKING
+
+import metrics
+
+if TYPE_CHECKING:
+    from settings import LoggingSettings
+
+"""
+Logging pipeline
+    The handlers of the uvicorn (and gunicorn worker) loggers are moved behind a queue, written by
+    a listener thread: a request only appends its record, never formats it nor waits for stderr.
+    Messages are formatted by the listener, so arguments must not be modified once logged.
+        TRANSACTION_LOGGING__QUEUE              false writes records in the thread logging them
+        TRANSACTION_LOGGING__QUEUE_SIZE         records waiting to be written, further ones are dropped,
+                                                counted in transaction_log_records_dropped_total and
+                                                reported by a warning once the queue has room again
+        TRANSACTION_LOGGING__FORMAT             text (uvicorn's format) or json, one object per line
+        TRANSACTION_LOGGING__MAX_FIELD_CHARS    arguments and messages longer than this are truncated
+        TRANSACTION_LOGGING__SAMPLE_RATES       fraction of the records kept below WARNING, per logger,
+                                                e.g. {"uvicorn.access": 0.01}
+    The listener of a forked worker is started on its first record.
+"""
+
+LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+pipelines: dict[str, "LogPipeline"] = {}
+
+
+def truncate(value, max_chars: int):
+    """The value, or the start of its text if longer than ``max_chars``."""
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = value if isinstance(value, str) else str(value)
+    if len(text) <= max_chars:
+        return value
+    return f"{text[:max_chars]}... ({len(text) - max_chars} more characters)"
+
+
+class TruncatingFilter(logging.Filter):
+    """
+    Truncates long arguments and messages, keeping the arguments expected by the formatter
+    """
+
+    def __init__(self, max_chars: int) -> None:
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and len(record.msg) > self.max_chars:
+            record.msg = truncate(record.msg, self.max_chars)
+        if isinstance(record.args, Mapping) and "%(" in str(record.msg):
+            record.args = {key: truncate(value, self.max_chars) for key, value in record.args.items()}
+        elif isinstance(record.args, Mapping):
+            # A single mapping argument, logged with %s
+            record.args = (truncate(record.args, self.max_chars),)
+        elif record.args:
+            record.args = tuple(truncate(value, self.max_chars) for value in record.args)
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of the records below WARNING of each logger
+    """
+
+    def __init__(self, rates: dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class JSONFormatter(logging.Formatter):
+    """
+    One JSON object per record
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class LogPipeline:
+    """Queue of the records of a logger, written to its handlers by a listener thread."""
+
+    def __init__(self, handlers: list[logging.Handler], queue_size: int = 10000, name: str = "") -> None:
+        self.handlers = handlers
+        self.queue_size = queue_size
+        self.name = name
+        self.queue = None
+        self.listener = None
+        self.pid = None
+        self.dropped = 0
+        self.reported = 0
+        self.lock = threading.Lock()
+
+    def start(self) -> None:
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            # The listener of the parent is not running in a forked process
+            self.queue = queue.Queue(self.queue_size)
+            self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+            self.listener.start()
+            self.pid = os.getpid()
+
+    def put(self, record: logging.LogRecord) -> None:
+        if self.pid != os.getpid():
+            self.start()
+        try:
+            dropped = self.dropped
+            if dropped > self.reported:
+                # Reported once the queue has room again
+                self.queue.put_nowait(self._dropped_record(dropped - self.reported))
+                self.reported = dropped
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Dropped rather than blocking the request
+            self.dropped += 1
+            metrics.LOG_RECORDS_DROPPED.labels(self.name).inc()
+
+    def _dropped_record(self, count: int) -> logging.LogRecord:
+        """Warning of ``count`` records dropped."""
+        return logging.LogRecord(self.name, logging.WARNING, __file__, 0, "%d log records dropped, the logging queue was full", (count,), None)
+
+    def stop(self) -> None:
+        """Writes the queued records and stops the listener of this process."""
+        with self.lock:
+            if self.pid != os.getpid():
+                return
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+            self.pid = None
+
+
+class PipelineHandler(logging.Handler):
+    """
+    Appends records to a pipeline, in place of the handlers it writes to
+    """
+
+    def __init__(self, pipeline: LogPipeline) -> None:
+        super().__init__()
+        self.pipeline = pipeline
+
+    def handle(self, record: logging.LogRecord) -> bool:
+        # Without the lock of Handler.handle, the queue is thread-safe
+        if not self.filter(record):
+            return False
+        self.pipeline.put(record)
+        return True
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.pipeline.put(record)
+
+
+def configure(logging_settings: "LoggingSettings", names: tuple[str, ...] = LOGGERS) -> None:
+    """Sets up the logging pipeline of the loggers with handlers, again after their handlers are replaced.
+
+    Args:
+        logging_settings (LoggingSettings): logging settings
+        names (tuple[str, ...], optional): loggers. Defaults to the uvicorn loggers.
+    """
+    for name in names:
+        logger = logging.getLogger(name)
+        handlers = [handler for handler in logger.handlers if not isinstance(handler, PipelineHandler)]
+        if not handlers:
+            continue
+        for handler in handlers:
+            if not any(isinstance(f, TruncatingFilter) for f in handler.filters):
+                handler.addFilter(TruncatingFilter(logging_settings.max_field_chars))
+            if logging_settings.format == "json":
+                handler.setFormatter(JSONFormatter())
+
+        if not logging_settings.queue:
+            logger.handlers = handlers
+            front = handlers
+        else:
+            if name in pipelines:
+                pipelines[name].stop()
+            pipelines[name] = LogPipeline(handlers, logging_settings.queue_size, name)
+            logger.handlers = [PipelineHandler(pipelines[name])]
+            front = logger.handlers
+        if logging_settings.sample_rates:
+            for handler in front:
+                if not any(isinstance(f, SamplingFilter) for f in handler.filters):
+                    handler.addFilter(SamplingFilter(logging_settings.sample_rates))
+
+
+def shutdown() -> None:
+    """Writes the queued records of this process."""
+    for pipeline in pipelines.values():
+        pipeline.stop()
+
+
+atexit.register(shutdown)
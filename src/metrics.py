@@ -0,0 +1,116 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import Response
+
+from settings import settings
+from validation import DEFAULT_EXTENSIONS
+
+try:
+    import prometheus_client
+    from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Prometheus metrics
+    Exposed on /metrics, which bypasses the authorizer, if prometheus_client is installed
+    and TRANSACTION_METRICS is true. Stage metrics are labelled with the collection and
+    operation (POST/PATCH) of the request being handled, set once per request in a context
+    variable so the validation functions keep their signatures. Collections without default
+    extensions are labelled "other": the collection comes from the URL, before authorization.
+    With several workers set PROMETHEUS_MULTIPROC_DIR to aggregate their metrics.
+"""
+
+OTHER_COLLECTION = "other"
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+request_labels: ContextVar[tuple[str, str]] = ContextVar("request_labels", default=("", ""))
+
+
+class _NoOpMetric:
+    """Stands in for a metric when metrics are disabled."""
+
+    def labels(self, *args, **kwargs) -> "_NoOpMetric":
+        return self
+
+    def inc(self, amount: float = 1) -> None:
+        pass
+
+    def observe(self, amount: float) -> None:
+        pass
+
+
+enabled = prometheus_client is not None and settings.metrics
+
+if enabled:
+    AUTH_CACHE = Counter("transaction_auth_cache_total", "Authorizer cache lookups", ["result"])
+    INTROSPECTION_SECONDS = Histogram(
+        "transaction_introspection_seconds", "Token introspection latency", ["authorizer"], buckets=LATENCY_BUCKETS
+    )
+    GROUP_LOOKUP_SECONDS = Histogram("transaction_group_lookup_seconds", "Globus group lookup latency", buckets=LATENCY_BUCKETS)
+    STAGE_SECONDS = Histogram(
+        "transaction_stage_seconds",
+        "Request stage latency: authorize, extensions, geometry, serialization, produce",
+        ["stage", "collection", "operation"],
+        buckets=LATENCY_BUCKETS,
+    )
+    SCHEMA_VALIDATION_SECONDS = Histogram(
+        "transaction_schema_validation_seconds",
+        "JSON schema validation latency per extension",
+        ["extension", "collection", "operation"],
+        buckets=LATENCY_BUCKETS,
+    )
+    KAFKA_ACK_SECONDS = Histogram("transaction_kafka_ack_seconds", "Kafka produce to acknowledgement latency", buckets=LATENCY_BUCKETS)
+    LOG_RECORDS_DROPPED = Counter("transaction_log_records_dropped_total", "Log records dropped with the logging queue full", ["logger"])
+else:
+    AUTH_CACHE = INTROSPECTION_SECONDS = GROUP_LOOKUP_SECONDS = _NoOpMetric()
+    STAGE_SECONDS = SCHEMA_VALIDATION_SECONDS = KAFKA_ACK_SECONDS = LOG_RECORDS_DROPPED = _NoOpMetric()
+
+
+def set_request_labels(collection_id: str, operation: str) -> None:
+    """Label the stage metrics of the current request.
+
+    Args:
+        collection_id (str): ID of Item's Collection
+        operation (str): POST or PATCH
+    """
+    collection = collection_id if collection_id in DEFAULT_EXTENSIONS else OTHER_COLLECTION
+    request_labels.set((collection, operation))
+
+
+@contextmanager
+def timer(histogram, *labels: str):
+    """Observe the duration of a block in a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        (histogram.labels(*labels) if labels else histogram).observe(elapsed)
+
+
+def stage(name: str):
+    """Observe the duration of a request stage."""
+    return timer(STAGE_SECONDS, name, *request_labels.get())
+
+
+def schema_validation(extension: str):
+    """Observe the duration of the schema validation of an extension."""
+    return timer(SCHEMA_VALIDATION_SECONDS, extension, *request_labels.get())
+
+
+def metrics_response() -> Response:
+    """Render the metrics of this process, or of all workers in multiprocess mode."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,424 @@
+import asyncio
+import fcntl
+import json
+import logging
+import mmap
+import os
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Event outbox
+    Accepted events are appended to a local, segmented, append-only log and a background
+    drainer replays them to Kafka in order, so short broker outages do not fail requests.
+    Layout:
+        <directory>/slot-<n>/               one slot per process, held with an exclusive flock
+        <directory>/slot-<n>/<segment>.log  records, rolled every TRANSACTION_OUTBOX__SEGMENT_BYTES
+        <directory>/slot-<n>/checkpoint     position of the first record not yet delivered
+    Record:
+        crc32 | key length | headers length | value length | key | headers | value
+    Requests wait for their record to be fsync'd, concurrent requests share a single fsync.
+    A slot left behind by a previous process is claimed, and drained, by the next one to start.
+    Slots above those of the running processes, left after scaling down, are drained by the drainers
+    of processes with a lower slot. Corrupt records are logged and skipped up to the next valid one.
+"""
+
+RECORD_HEADER = struct.Struct(">IIII")
+HEADER_NAME = struct.Struct(">H")
+HEADER_VALUE = struct.Struct(">I")
+CHECKPOINT = "checkpoint"
+SEGMENT_SUFFIX = ".log"
+
+
+@dataclass
+class OutboxRecord:
+    key: bytes
+    value: bytes
+    headers: list[tuple[str, bytes]]
+
+
+Position = tuple[int, int]
+
+
+def encode_headers(headers: list[tuple[str, bytes]]) -> bytes:
+    encoded = bytearray()
+    for name, value in headers:
+        name = name.encode("utf8")
+        encoded += HEADER_NAME.pack(len(name)) + name + HEADER_VALUE.pack(len(value)) + value
+    return bytes(encoded)
+
+
+def decode_headers(data: bytes) -> list[tuple[str, bytes]]:
+    headers = []
+    offset = 0
+    while offset < len(data):
+        (name_length,) = HEADER_NAME.unpack_from(data, offset)
+        start = offset + HEADER_NAME.size
+        offset = start + name_length
+        name = bytes(data[start:offset]).decode("utf8")
+        (value_length,) = HEADER_VALUE.unpack_from(data, offset)
+        start = offset + HEADER_VALUE.size
+        offset = start + value_length
+        headers.append((name, bytes(data[start:offset])))
+    return headers
+
+
+def encode_record(record: OutboxRecord) -> bytes:
+    headers = encode_headers(record.headers)
+    body = record.key + headers + record.value
+    return RECORD_HEADER.pack(zlib.crc32(body), len(record.key), len(headers), len(record.value)) + body
+
+
+def decode_record(buffer, offset: int, end: int) -> tuple[OutboxRecord, int] | None:
+    """Decode the record at ``offset``.
+
+    Returns:
+        tuple[OutboxRecord, int] | None: record and the offset of the next one, None if torn or corrupt
+    """
+    if end - offset < RECORD_HEADER.size:
+        return None
+    crc, key_length, headers_length, value_length = RECORD_HEADER.unpack_from(buffer, offset)
+    start = offset + RECORD_HEADER.size
+    stop = start + key_length + headers_length + value_length
+    if stop > end:
+        return None
+    body = buffer[start:stop]
+    if zlib.crc32(body) != crc:
+        return None
+    headers_end = key_length + headers_length
+    key = bytes(body[:key_length])
+    headers = decode_headers(body[key_length:headers_end])
+    value = bytes(body[headers_end:])
+    return OutboxRecord(key=key, value=value, headers=headers), stop
+
+
+def next_record(buffer, offset: int, end: int) -> int | None:
+    """Offset of the first valid record from ``offset``, None if there is none."""
+    for position in range(offset, end - RECORD_HEADER.size + 1):
+        if decode_record(buffer, position, end) is not None:
+            return position
+    return None
+
+
+def slot_index(path: Path) -> int:
+    return int(path.name.removeprefix("slot-"))
+
+
+def undelivered(path: Path) -> bool:
+    """Whether a slot has records after its checkpoint, without opening it."""
+    try:
+        checkpoint = json.loads((path / CHECKPOINT).read_text())
+        position = checkpoint["segment"], checkpoint["offset"]
+    except (FileNotFoundError, ValueError, KeyError):
+        position = 0, 0
+    for segment in path.glob(f"*{SEGMENT_SUFFIX}"):
+        size = segment.stat().st_size
+        if size and (int(segment.stem), size) > position:
+            return True
+    return False
+
+
+class Outbox:
+    """Segmented append-only event log."""
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, fsync: bool = True, slot: int | None = None) -> None:
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.path = self._claim_slot(Path(directory), slot)
+        self.slot = slot_index(self.path)
+
+        self._lock = Lock()
+        self._sync_lock = Lock()
+        self._checkpoint = self._read_checkpoint()
+        self._recover()
+
+        self._segment = max(self._segments(), default=0) + 1
+        self._file = open(self._segment_path(self._segment), "ab")
+        self._offset = 0
+        self._written = 0
+        self._synced = 0
+        self._delivered = 0
+        self._wakeup = asyncio.Event()
+        logger.info("Outbox %s opened at segment %s", self.path, self._segment)
+
+    def _claim_slot(self, directory: Path, slot: int | None = None) -> Path:
+        """Lock the lowest free slot, or ``slot``, raising BlockingIOError if it is held."""
+        directory.mkdir(parents=True, exist_ok=True)
+        index = slot or 0
+        while True:
+            path = directory / f"slot-{index}"
+            path.mkdir(exist_ok=True)
+            lock_file = open(path / ".lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                if slot is not None:
+                    raise
+                index += 1
+                continue
+            self._lock_file = lock_file
+            return path
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"{segment:016d}{SEGMENT_SUFFIX}"
+
+    def _segments(self) -> list[int]:
+        return sorted(int(p.stem) for p in self.path.glob(f"*{SEGMENT_SUFFIX}"))
+
+    def _read_checkpoint(self) -> Position:
+        try:
+            checkpoint = json.loads((self.path / CHECKPOINT).read_text())
+            return checkpoint["segment"], checkpoint["offset"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return 0, 0
+
+    def _recover(self) -> None:
+        """Truncate a record torn by a crash at the end of the last segment."""
+        segments = self._segments()
+        if not segments:
+            return
+        path = self._segment_path(segments[-1])
+        size = path.stat().st_size
+        offset = 0
+        for _, offset in self._scan(segments[-1], 0, size):
+            pass
+        if offset < size:
+            logger.warning("Outbox truncating torn record in %s at %s", path, offset)
+            os.truncate(path, offset)
+
+    def _scan(self, segment: int, offset: int, end: int):
+        if end <= offset:
+            return
+        with open(self._segment_path(segment), "rb") as file:
+            with mmap.mmap(file.fileno(), end, access=mmap.ACCESS_READ) as buffer:
+                while offset < end:
+                    decoded = decode_record(buffer, offset, end)
+                    if decoded is None:
+                        resumed = next_record(buffer, offset + 1, end)
+                        if resumed is None:
+                            return
+                        logger.error("Outbox skipping %s corrupt bytes in %s at %s", resumed - offset, self._segment_path(segment), offset)
+                        offset = resumed
+                        continue
+                    record, offset = decoded
+                    yield record, offset
+
+    def append(self, record: OutboxRecord) -> int:
+        """Append a record to the current segment.
+
+        Args:
+            record (OutboxRecord): record to be appended
+
+        Returns:
+            int: write sequence, to wait for with ``sync``
+        """
+        data = encode_record(record)
+        with self._lock:
+            if self._offset and self._offset + len(data) > self.segment_bytes:
+                self._roll()
+            self._file.write(data)
+            self._file.flush()
+            self._offset += len(data)
+            self._written += 1
+            written = self._written
+        self._wakeup.set()
+        return written
+
+    def _roll(self) -> None:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._synced = self._written
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), "ab")
+        self._offset = 0
+
+    def sync(self, written: int) -> None:
+        """fsync the current segment, unless a concurrent call already covered ``written``.
+
+        Args:
+            written (int): write sequence returned by ``append``
+        """
+        with self._sync_lock:
+            if self._synced >= written:
+                return
+            with self._lock:
+                target = self._written
+                fileno = self._file.fileno()
+            os.fsync(fileno)
+            self._synced = max(self._synced, target)
+
+    async def put(self, record: OutboxRecord) -> None:
+        """Append a record and wait until it is durable.
+
+        Args:
+            record (OutboxRecord): record to be appended
+        """
+        written = self.append(record)
+        if self.fsync:
+            await asyncio.to_thread(self.sync, written)
+
+    def read(self, max_records: int) -> tuple[list[OutboxRecord], Position]:
+        """Read undelivered records from the checkpoint.
+
+        Args:
+            max_records (int): maximum number of records to read
+
+        Returns:
+            tuple[list[OutboxRecord], Position]: records and the position following them
+        """
+        with self._lock:
+            current_segment, current_offset = self._segment, self._offset
+
+        records = []
+        segment, offset = self._checkpoint
+        for candidate in self._segments():
+            if candidate < segment:
+                continue
+            if candidate > segment:
+                segment, offset = candidate, 0
+            end = current_offset if segment == current_segment else self._segment_path(segment).stat().st_size
+            for record, offset in self._scan(segment, offset, end):
+                records.append(record)
+                if len(records) >= max_records:
+                    return records, (segment, offset)
+            if offset < end and segment != current_segment:
+                logger.error("Outbox dropping %s unreadable bytes at the end of %s", end - offset, self._segment_path(segment))
+        return records, (segment, offset)
+
+    def commit(self, position: Position, records: int = 0) -> None:
+        """Record that everything before ``position`` has been delivered, removing drained segments.
+
+        Args:
+            position (Position): position returned by ``read``
+            records (int, optional): number of records delivered. Defaults to 0.
+        """
+        checkpoint = self.path / CHECKPOINT
+        tmp = checkpoint.with_suffix(".tmp")
+        with open(tmp, "w") as file:
+            json.dump({"segment": position[0], "offset": position[1]}, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, checkpoint)
+        self._checkpoint = position
+        self._delivered += records
+
+        for segment in self._segments():
+            if segment >= position[0]:
+                break
+            self._segment_path(segment).unlink(missing_ok=True)
+
+    def backlog(self) -> int:
+        """Number of records appended by this process and not yet delivered."""
+        return max(self._written - self._delivered, 0)
+
+    async def wait(self, timeout: float) -> None:
+        """Wait for a new record, or the timeout."""
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+        self._lock_file.close()
+
+
+class OutboxDrainer:
+    """Replays outbox records to Kafka, in order, retrying with backoff while the broker is unavailable."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        producer,
+        batch_size: int = 500,
+        poll_interval_seconds: float = 1.0,
+        max_backoff_seconds: float = 30.0,
+    ) -> None:
+        self.outbox = outbox
+        self.producer = producer
+        self.batch_size = batch_size
+        self.poll_interval_seconds = poll_interval_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+
+    def drain_once(self) -> int:
+        """Deliver one batch of records.
+
+        A batch is only committed once all of its records are delivered, a failed batch is
+        re-sent from its start so the last event of every key is always the latest one.
+
+        Returns:
+            int: number of records delivered
+        """
+        records, position = self.outbox.read(self.batch_size)
+        if not records:
+            if position > self.outbox._checkpoint:
+                # Past unreadable bytes or empty segments, not read again on every poll
+                self.outbox.commit(position)
+            return 0
+        errors = self.producer.success_batch([(record.key, record.value, record.headers) for record in records])
+        failed = [error for error in errors if error is not None]
+        if failed:
+            raise RuntimeError(f"{len(failed)} of {len(records)} outbox records not delivered: {failed[0]}")
+        self.outbox.commit(position, len(records))
+        return len(records)
+
+    def drain_orphans(self) -> int:
+        """Deliver the records of unclaimed slots above the slot of this process.
+
+        Returns:
+            int: number of records delivered
+        """
+        delivered = 0
+        for path in self.outbox.path.parent.glob("slot-*"):
+            slot = slot_index(path)
+            if slot <= self.outbox.slot or not undelivered(path):
+                continue
+            try:
+                orphan = Outbox(str(path.parent), segment_bytes=self.outbox.segment_bytes, fsync=False, slot=slot)
+            except BlockingIOError:
+                # Claimed by a running process
+                continue
+            drained = 0
+            try:
+                drainer = OutboxDrainer(orphan, self.producer, batch_size=self.batch_size)
+                while count := drainer.drain_once():
+                    drained += count
+            finally:
+                orphan.close()
+            logger.info("Outbox drained %s records left in %s", drained, path)
+            delivered += drained
+        return delivered
+
+    async def run(self) -> None:
+        """Drain the outbox until cancelled."""
+        backoff = self.poll_interval_seconds
+        while True:
+            try:
+                delivered = await asyncio.to_thread(self.drain_once)
+            except Exception as exc:
+                logger.error("Error draining outbox, retrying in %ss: %s", backoff, exc)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff_seconds)
+                continue
+            backoff = self.poll_interval_seconds
+            if delivered:
+                logger.debug("Outbox delivered %s records", delivered)
+                continue
+            try:
+                if await asyncio.to_thread(self.drain_orphans):
+                    continue
+            except Exception as exc:
+                logger.error("Error draining unclaimed outbox slots: %s", exc)
+            await self.outbox.wait(self.poll_interval_seconds)
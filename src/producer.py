@@ -0,0 +1,450 @@
+import base64
+import json
+import logging
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, AnyStr
+
+from confluent_kafka import KafkaError, Message, Producer
+from esgf_core_utils.models.kafka.producer import KafkaProducer
+from esgf_core_utils.settings.kafka.producer import ProducerSettings as KafkaProducerSettings
+
+from metrics import KAFKA_ACK_SECONDS
+from settings import ProducerSettings, settings
+from tracing import span
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Event producers, selected with TRANSACTION_PRODUCER__BACKEND
+    kafka   the Kafka producer configured with KAFKA_PRODUCER_*
+    memory  a ring buffer of the last TRANSACTION_PRODUCER__MEMORY_CAPACITY messages
+    file    JSONL segments in TRANSACTION_PRODUCER__FILE_DIRECTORY, one series of segments per process
+    The memory and file backends deliver synchronously, after TRANSACTION_PRODUCER__LATENCY_SECONDS,
+    so benchmarks and tests run without a broker.
+    Every backend keeps the enqueue and delivery time of its last TRANSACTION_PRODUCER__TIMING_SAMPLES messages.
+"""
+
+Headers = list[tuple[str, bytes]]
+SEGMENT_SUFFIX = ".jsonl"
+
+
+@dataclass
+class DeliveryTiming:
+    key: bytes
+    enqueued: float
+    delivered: float
+    error: KafkaError | None = None
+
+    @property
+    def latency(self) -> float:
+        return self.delivered - self.enqueued
+
+
+@dataclass
+class ProducedMessage:
+    topic: str
+    key: bytes
+    value: bytes
+    headers: Headers
+    offset: int
+    timestamp: float
+
+
+def to_bytes(data: AnyStr | None) -> bytes:
+    if data is None:
+        return b""
+    return data.encode("utf8") if isinstance(data, str) else bytes(data)
+
+
+class EventProducer(KafkaProducer):
+    """
+    Kafka Producer with support for message headers
+    """
+
+    def __init__(self, timing_samples: int = 10000) -> None:
+        self.settings = KafkaProducerSettings()
+        self.timings: deque[DeliveryTiming] = deque(maxlen=timing_samples)
+        self._producer: Producer | None = None
+
+    @property
+    def producer(self) -> Producer:
+        """librdkafka client, created on first use.
+
+        The client threads do not survive a fork, so a preloading master (warmup.py)
+        must not create it: each worker creates its own.
+        """
+        if self._producer is None:
+            self._producer = Producer(self.settings.config.model_dump(by_alias=True, exclude_none=True))
+            logger.info("KafkaProducer initialised")
+        return self._producer
+
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be delivered."""
+        return len(self.producer)
+
+    def produce(
+        self,
+        topic: str,
+        key: AnyStr,
+        value: AnyStr,
+        headers: Headers | None = None,
+    ) -> list[tuple[KafkaError | None, Message]]:
+        """Publish message
+
+        Args:
+            topic (str): topic to post message to
+            key (AnyStr): message key
+            value (AnyStr): message
+            headers (Headers | None): message headers
+
+        Returns:
+            list[tuple[KafkaError, Message]]: delivery reports
+        """
+        delivery_reports = []
+        enqueued = time.perf_counter()
+
+        def delivery_report(err: KafkaError | None, msg: Message) -> None:
+            self.timings.append(DeliveryTiming(key=to_bytes(msg.key()), enqueued=enqueued, delivered=time.perf_counter(), error=err))
+            if err is not None:
+                logger.error("Delivery failed for message %s: %s", repr(msg.key()), err)
+            else:
+                KAFKA_ACK_SECONDS.observe(msg.latency() or 0.0)
+                logger.info(
+                    "Message %s successfully delivered to %s [%s] at offset %s",
+                    repr(msg.key()),
+                    msg.topic(),
+                    msg.partition(),
+                    msg.offset(),
+                )
+            delivery_reports.append((err, msg))
+
+        with span("kafka.delivery", topic=topic) as current:
+            self.producer.produce(topic=topic, key=key, value=value, headers=headers, callback=delivery_report)
+            self.producer.flush()
+            if current is not None:
+                for err, msg in delivery_reports:
+                    current.set_attributes({"delivered": err is None, "partition": msg.partition(), "offset": msg.offset()})
+        return delivery_reports
+
+    def success(
+        self,
+        key: AnyStr,
+        value: AnyStr,
+        headers: Headers | None = None,
+    ) -> list[tuple[KafkaError | None, Message]]:
+        """Post an message to the success event stream
+
+        Args:
+            key (AnyStr): message key
+            value (AnyStr): message
+            headers (Headers | None): message headers
+
+        Returns:
+            list[tuple[KafkaError, Message]]: delivery reports
+        """
+        return self.produce(topic=self.settings.success_topic, key=key, value=value, headers=headers)
+
+    def success_batch(
+        self,
+        messages: list[tuple[AnyStr, AnyStr, Headers | None]],
+        timeout: float = 30.0,
+    ) -> list[KafkaError | None]:
+        """Post messages to the success event stream, waiting once for all of them
+
+        Args:
+            messages (list[tuple[AnyStr, AnyStr, Headers | None]]): (key, value, headers) of each message
+            timeout (float): seconds to wait for delivery reports
+
+        Returns:
+            list[KafkaError | None]: delivery error of each message, None if delivered
+        """
+        # Messages without a delivery report after the flush are reported as timed out
+        errors: list[KafkaError | None] = [KafkaError(KafkaError._MSG_TIMED_OUT)] * len(messages)
+        enqueued = [0.0] * len(messages)
+
+        def delivery_report(index: int, err: KafkaError | None, msg: Message) -> None:
+            self.timings.append(DeliveryTiming(key=to_bytes(msg.key()), enqueued=enqueued[index], delivered=time.perf_counter(), error=err))
+            if err is not None:
+                logger.error("Delivery failed for message %s: %s", repr(msg.key()), err)
+            else:
+                KAFKA_ACK_SECONDS.observe(msg.latency() or 0.0)
+            errors[index] = err
+
+        for index, (key, value, headers) in enumerate(messages):
+            enqueued[index] = time.perf_counter()
+            while True:
+                try:
+                    self.producer.produce(
+                        topic=self.settings.success_topic,
+                        key=key,
+                        value=value,
+                        headers=headers,
+                        callback=lambda err, msg, index=index: delivery_report(index, err, msg),
+                    )
+                    break
+                except BufferError:
+                    self.producer.poll(1)
+        self.producer.flush(timeout)
+        return errors
+
+
+class LocalProducer:
+    """
+    Producer delivering to a local sink instead of Kafka
+    """
+
+    def __init__(self, topic: str, latency_seconds: float = 0.0, timing_samples: int = 10000) -> None:
+        self.topic = topic
+        self.latency_seconds = latency_seconds
+        self.timings: deque[DeliveryTiming] = deque(maxlen=timing_samples)
+        self.offset = 0
+        self.lock = Lock()
+
+    def write(self, messages: list[ProducedMessage]) -> None:
+        """Deliver messages to the sink, called with the lock held."""
+        raise NotImplementedError
+
+    def queue_depth(self) -> int:
+        """Number of messages waiting to be delivered, always 0 as delivery is synchronous."""
+        return 0
+
+    def produce_batch(self, topic: str, messages: list[tuple[AnyStr, AnyStr, Headers | None]]) -> list[ProducedMessage]:
+        enqueued = time.perf_counter()
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        timestamp = time.time()
+        with self.lock:
+            produced = []
+            for key, value, headers in messages:
+                produced.append(
+                    ProducedMessage(
+                        topic=topic,
+                        key=to_bytes(key),
+                        value=to_bytes(value),
+                        headers=list(headers or []),
+                        offset=self.offset,
+                        timestamp=timestamp,
+                    )
+                )
+                self.offset += 1
+            self.write(produced)
+        delivered = time.perf_counter()
+        for message in produced:
+            self.timings.append(DeliveryTiming(key=message.key, enqueued=enqueued, delivered=delivered))
+            KAFKA_ACK_SECONDS.observe(delivered - enqueued)
+        return produced
+
+    def produce(
+        self,
+        topic: str,
+        key: AnyStr,
+        value: AnyStr,
+        headers: Headers | None = None,
+    ) -> list[tuple[None, ProducedMessage]]:
+        """Publish message
+
+        Args:
+            topic (str): topic to post message to
+            key (AnyStr): message key
+            value (AnyStr): message
+            headers (Headers | None): message headers
+
+        Returns:
+            list[tuple[None, ProducedMessage]]: delivery reports
+        """
+        with span("kafka.delivery", topic=topic):
+            return [(None, message) for message in self.produce_batch(topic, [(key, value, headers)])]
+
+    def success(
+        self,
+        key: AnyStr,
+        value: AnyStr,
+        headers: Headers | None = None,
+    ) -> list[tuple[None, ProducedMessage]]:
+        """Post an message to the success event stream
+
+        Args:
+            key (AnyStr): message key
+            value (AnyStr): message
+            headers (Headers | None): message headers
+
+        Returns:
+            list[tuple[None, ProducedMessage]]: delivery reports
+        """
+        return self.produce(topic=self.topic, key=key, value=value, headers=headers)
+
+    def success_batch(
+        self,
+        messages: list[tuple[AnyStr, AnyStr, Headers | None]],
+        timeout: float = 30.0,
+    ) -> list[None]:
+        """Post messages to the success event stream
+
+        Args:
+            messages (list[tuple[AnyStr, AnyStr, Headers | None]]): (key, value, headers) of each message
+            timeout (float): unused, delivery is synchronous
+
+        Returns:
+            list[None]: delivery error of each message, always None
+        """
+        self.produce_batch(self.topic, messages)
+        return [None] * len(messages)
+
+
+class MemoryProducer(LocalProducer):
+    """
+    Producer keeping the last ``capacity`` messages in memory
+    """
+
+    def __init__(self, topic: str, capacity: int = 10000, latency_seconds: float = 0.0, timing_samples: int = 10000) -> None:
+        super().__init__(topic=topic, latency_seconds=latency_seconds, timing_samples=timing_samples)
+        self.buffer: deque[ProducedMessage] = deque(maxlen=capacity)
+        self.dropped = 0
+
+    def write(self, messages: list[ProducedMessage]) -> None:
+        self.dropped += max(0, len(self.buffer) + len(messages) - self.buffer.maxlen)
+        self.buffer.extend(messages)
+
+    def messages(self, topic: str | None = None) -> list[ProducedMessage]:
+        """Buffered messages, oldest first.
+
+        Args:
+            topic (str | None): only the messages of this topic
+
+        Returns:
+            list[ProducedMessage]: messages
+        """
+        with self.lock:
+            return [message for message in self.buffer if topic is None or message.topic == topic]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.buffer.clear()
+            self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self.buffer)
+
+
+def encode_bytes(data: bytes) -> Any:
+    """Text as a string, anything else, such as compressed values, as base64."""
+    try:
+        return data.decode("utf8")
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(data).decode("ascii")}
+
+
+def decode_bytes(data: Any) -> bytes:
+    if isinstance(data, dict):
+        return base64.b64decode(data["base64"])
+    return data.encode("utf8")
+
+
+class FileProducer(LocalProducer):
+    """
+    Producer appending messages to JSONL segments, ``<directory>/<pid>-<segment>.jsonl``
+    """
+
+    def __init__(
+        self,
+        topic: str,
+        directory: str,
+        segment_bytes: int = 64 * 1024 * 1024,
+        latency_seconds: float = 0.0,
+        timing_samples: int = 10000,
+    ) -> None:
+        super().__init__(topic=topic, latency_seconds=latency_seconds, timing_samples=timing_samples)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.segment = 0
+        self.file = None
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / f"{os.getpid()}-{segment:06d}{SEGMENT_SUFFIX}"
+
+    def write(self, messages: list[ProducedMessage]) -> None:
+        if self.file is None or self.file.tell() >= self.segment_bytes:
+            if self.file is not None:
+                self.file.close()
+                self.segment += 1
+            self.file = open(self.segment_path(self.segment), "ab")
+        lines = []
+        for message in messages:
+            record = {
+                "topic": message.topic,
+                "offset": message.offset,
+                "timestamp": message.timestamp,
+                "key": encode_bytes(message.key),
+                "headers": [[name, encode_bytes(value)] for name, value in message.headers],
+                "value": encode_bytes(message.value),
+            }
+            lines.append(json.dumps(record).encode("utf8"))
+        self.file.write(b"\n".join(lines) + b"\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_messages(directory: str) -> list[ProducedMessage]:
+    """Messages written by FileProducer to ``directory``, in file order.
+
+    Args:
+        directory (str): directory of the segments
+
+    Returns:
+        list[ProducedMessage]: messages
+    """
+    messages = []
+    for path in sorted(Path(directory).glob(f"*{SEGMENT_SUFFIX}")):
+        with open(path, "rb") as file:
+            for line in file:
+                record = json.loads(line)
+                messages.append(
+                    ProducedMessage(
+                        topic=record["topic"],
+                        key=decode_bytes(record["key"]),
+                        value=decode_bytes(record["value"]),
+                        headers=[(name, decode_bytes(value)) for name, value in record["headers"]],
+                        offset=record["offset"],
+                        timestamp=record["timestamp"],
+                    )
+                )
+    return messages
+
+
+def get_producer(producer_settings: ProducerSettings = settings.producer) -> EventProducer | LocalProducer:
+    """Producer of the configured backend.
+
+    Args:
+        producer_settings (ProducerSettings): producer settings
+
+    Returns:
+        EventProducer | LocalProducer: producer
+    """
+    if producer_settings.backend == "memory":
+        return MemoryProducer(
+            topic=producer_settings.topic,
+            capacity=producer_settings.memory_capacity,
+            latency_seconds=producer_settings.latency_seconds,
+            timing_samples=producer_settings.timing_samples,
+        )
+    if producer_settings.backend == "file":
+        return FileProducer(
+            topic=producer_settings.topic,
+            directory=producer_settings.file_directory,
+            segment_bytes=producer_settings.file_segment_bytes,
+            latency_seconds=producer_settings.latency_seconds,
+            timing_samples=producer_settings.timing_samples,
+        )
+    return EventProducer(timing_samples=producer_settings.timing_samples)
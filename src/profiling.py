@@ -0,0 +1,171 @@
+import asyncio
+import cProfile
+import hmac
+import itertools
+import logging
+import marshal
+import random
+import re
+import time
+import uuid
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import FileResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from codec import CodecJSONResponse
+from settings import ProfilingSettings, settings
+
+try:
+    from pyinstrument import Profiler
+except ImportError:  # pragma: no cover
+    Profiler = None
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+On-demand request profiling
+    Only installed when TRANSACTION_PROFILING__ENABLED is true, so it costs nothing otherwise.
+    A request is profiled when either:
+        - its X-Profile-Token header matches TRANSACTION_PROFILING__TOKEN
+        - it is a write request picked at random, TRANSACTION_PROFILING__SAMPLE_RATE of them
+    Profilers:
+        - pyinstrument, sampling and async aware, saved as an HTML flame graph (default if installed)
+        - cProfile, saved as pstats, which also records other requests running at the same time
+    One request is profiled at a time. Profiles are named after the request id, returned in
+    the X-Profile-Id header, and listed and downloaded, with the token, from /admin/profiles.
+"""
+
+TOKEN_HEADER = "x-profile-token"
+PROFILE_ID_HEADER = "X-Profile-Id"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+PROFILES_PATH = "/admin/profiles"
+SAFE_NAME = re.compile(r"^[0-9A-Za-z._-]{1,128}$")
+
+
+class ProfileStore:
+    """Directory of the most recent profiles."""
+
+    def __init__(self, directory: str, max_profiles: int) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_profiles = max_profiles
+
+    def save(self, request_id: str, suffix: str, data: bytes) -> str:
+        """Save a profile, removing the oldest ones over the limit.
+
+        Args:
+            request_id (str): request id
+            suffix (str): file suffix, .html or .pstats
+            data (bytes): profile
+
+        Returns:
+            str: name of the profile
+        """
+        if not SAFE_NAME.match(request_id):
+            request_id = uuid.uuid4().hex
+        now = time.time_ns()
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(now // 10**9))}.{now % 10**9:09d}-{request_id}{suffix}"
+        (self.directory / name).write_bytes(data)
+
+        for path in itertools.islice(self.paths(), self.max_profiles, None):
+            path.unlink(missing_ok=True)
+        return name
+
+    def paths(self) -> list[Path]:
+        """Profiles, newest first, names start with their UTC creation time."""
+        return sorted((p for p in self.directory.iterdir() if p.is_file()), reverse=True)
+
+    def list(self) -> list[dict]:
+        return [{"name": p.name, "size": p.stat().st_size, "modified": p.stat().st_mtime} for p in self.paths()]
+
+    def path(self, name: str) -> Path | None:
+        if not SAFE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+def has_token(request: Request, profiling: ProfilingSettings) -> bool:
+    token = request.headers.get(TOKEN_HEADER)
+    return bool(token and profiling.token and hmac.compare_digest(token, profiling.token.get_secret_value()))
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, store: ProfileStore) -> None:
+        super().__init__(app)
+        self.store = store
+        self.profiling = settings.profiling
+        self._active = False
+
+    def wanted(self, request: Request) -> bool:
+        if request.url.path.startswith(PROFILES_PATH):
+            return False
+        if has_token(request, self.profiling):
+            return True
+        return request.method in WRITE_METHODS and random.random() < self.profiling.sample_rate
+
+    def save_html(self, request_id: str, profiler: "Profiler") -> str:
+        """Render a pyinstrument profile as HTML and save it, in a thread."""
+        return self.store.save(request_id, ".html", profiler.output_html().encode())
+
+    def save_stats(self, request_id: str, profiler: cProfile.Profile) -> str:
+        """Save a cProfile profile, in a thread."""
+        # Same format as Profile.dump_stats, readable with pstats.Stats
+        profiler.create_stats()
+        return self.store.save(request_id, ".pstats", marshal.dumps(profiler.stats))
+
+    async def dispatch(self, request: Request, call_next):
+        if self._active or not self.wanted(request):
+            return await call_next(request)
+
+        request_id = request.headers.get("x-request-id", uuid.uuid4().hex)
+        self._active = True
+        try:
+            if Profiler is not None and self.profiling.profiler == "pyinstrument":
+                profiler = Profiler(interval=self.profiling.interval_seconds, async_mode="enabled")
+                profiler.start()
+                try:
+                    response = await call_next(request)
+                finally:
+                    profiler.stop()
+                name = await asyncio.to_thread(self.save_html, request_id, profiler)
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = await call_next(request)
+                finally:
+                    profiler.disable()
+                name = await asyncio.to_thread(self.save_stats, request_id, profiler)
+        finally:
+            self._active = False
+
+        logger.info("Profiled %s %s as %s", request.method, request.url.path, name)
+        response.headers[PROFILE_ID_HEADER] = name
+        return response
+
+
+router = APIRouter(prefix=PROFILES_PATH, include_in_schema=False)
+
+
+def require_token(request: Request) -> None:
+    if not has_token(request, settings.profiling):
+        raise HTTPException(status_code=403, detail="Forbidden - Invalid profiling token")
+
+
+@router.get("")
+async def list_profiles(request: Request):
+    require_token(request)
+    return CodecJSONResponse(content={"profiles": request.app.state.profile_store.list()})
+
+
+@router.get("/{name}")
+async def get_profile(name: str, request: Request):
+    require_token(request)
+    path = request.app.state.profile_store.path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=name)
@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Callable, TypeVar
+
+from esgf_core_utils.models.exceptions import RFC9457Exception
+from esgf_core_utils.models.kafka.events import Auth
+
+from settings import RateLimitSettings, settings
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Per-identity rate limiting and fair scheduling
+    Rate limiting:
+        A token bucket per requester (sub, or client_id if there is none), refilled at
+        TRANSACTION_RATE_LIMIT__RATE requests per second up to TRANSACTION_RATE_LIMIT__BURST.
+        Collections listed in TRANSACTION_RATE_LIMIT__COLLECTIONS get their own rate, burst
+        and buckets. Requests over the limit get a 429 with Retry-After.
+        Buckets are kept in memory, per process, or in a SQLite database shared by the workers
+        of a host (TRANSACTION_RATE_LIMIT__BACKEND=sqlite).
+    Fair scheduling:
+        With TRANSACTION_RATE_LIMIT__VALIDATION_WORKERS > 0, validation runs in that many threads
+        and waiting requests are served by start-time fair queueing across requesters, weighted by
+        TRANSACTION_RATE_LIMIT__WEIGHTS and costed by body size, so a small retraction does not
+        wait behind a bulk publisher's backlog.
+"""
+
+T = TypeVar("T")
+
+
+class RateLimitExceededException(RFC9457Exception):
+    """
+    Requester is over its rate limit
+    """
+
+    def __init__(self, retry_after: float, instance: str) -> None:
+        self.status_code = 429
+        self.type = "https://esgf.io/publication/errors/rate-limit-exceeded"
+        self.title = "Rate limit exceeded"
+        self.detail = f"Too many requests from this requester -- please retry in {retry_after:.0f} seconds."
+        self.instance = instance
+        self.headers = {"Retry-After": str(max(1, round(retry_after)))}
+
+
+def refill(tokens: float, updated: float, rate: float, burst: float, now: float, cost: float) -> tuple[float, float]:
+    """Take ``cost`` tokens from a bucket.
+
+    Args:
+        tokens (float): tokens left at ``updated``
+        updated (float): last update time
+        rate (float): tokens added per second
+        burst (float): bucket capacity
+        now (float): current time
+        cost (float): tokens to take
+
+    Returns:
+        tuple[float, float]: tokens left, and seconds to wait, 0 if the tokens were taken
+    """
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBackend:
+    """In-process token buckets."""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 10000) -> None:
+        self._max_entries = max_entries
+        # tokens, updated, rate and burst of each bucket, least recently used first
+        self._buckets: dict[str, tuple[float, float, float, float]] = {}
+        self._lock = Lock()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _, _ = self._buckets.pop(key, (burst, now, rate, burst))
+            tokens, wait = refill(tokens, updated, rate, burst, now, cost)
+            self._buckets[key] = (tokens, now, rate, burst)
+            if len(self._buckets) > self._max_entries:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float) -> None:
+        """Drop the full buckets, then the least recently used ones, down to three quarters of ``max_entries``."""
+        # Full buckets are equivalent to missing ones
+        self._buckets = {k: b for k, b in self._buckets.items() if b[0] + (now - b[1]) * b[2] < b[3]}
+        for key in list(itertools.islice(self._buckets, max(len(self._buckets) - self._max_entries * 3 // 4, 0))):
+            del self._buckets[key]
+
+
+class SQLiteBackend:
+    """Token buckets in a SQLite database, shared by processes on the same host."""
+
+    # Waits up to the busy timeout for the write lock held by another worker
+    blocking = True
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._connection_pid: int | None = None
+        self._lock = Lock()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # A SQLite connection must not be used across a fork, each process opens its own
+        if self._connection_pid != os.getpid():
+            self._sqlite = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            self._sqlite.execute("PRAGMA journal_mode=WAL")
+            self._sqlite.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+            self._connection_pid = os.getpid()
+        return self._sqlite
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0) -> float:
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._connection.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens, updated = row if row else (burst, now)
+                tokens, wait = refill(tokens, updated, rate, burst, now, cost)
+                self._connection.execute(
+                    "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (key, tokens, now),
+                )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return wait
+
+
+def requester(auth: Auth) -> str:
+    """Rate limiting identity of a requester."""
+    requester_data = auth.requester_data
+    return requester_data.sub or requester_data.client_id
+
+
+class RateLimiter:
+    """Token bucket rate limiter keyed by requester, with per-collection overrides."""
+
+    def __init__(self, rate_limit: RateLimitSettings, backend: MemoryBackend | SQLiteBackend) -> None:
+        self.rate_limit = rate_limit
+        self.backend = backend
+
+    async def check(self, auth: Auth, collection_id: str, instance: str) -> None:
+        """Take a token for a request, in a thread if the backend blocks.
+
+        Args:
+            auth (Auth): authorized requester
+            collection_id (str): ID of Item's Collection
+            instance (str): error instance
+
+        Raises:
+            RateLimitExceededException: requester is over its rate limit
+        """
+        identity = requester(auth)
+        override = self.rate_limit.collections.get(collection_id)
+        if override:
+            key, rate, burst = f"{collection_id}:{identity}", override.rate, override.burst
+        else:
+            key, rate, burst = identity, self.rate_limit.rate, self.rate_limit.burst
+
+        if self.backend.blocking:
+            wait = await asyncio.to_thread(self.backend.take, key, rate=rate, burst=burst)
+        else:
+            wait = self.backend.take(key, rate=rate, burst=burst)
+        if wait > 0:
+            logger.warning("Rate limit exceeded for %s on %s", identity, collection_id)
+            raise RateLimitExceededException(retry_after=wait, instance=instance)
+
+
+class FairScheduler:
+    """Start-time fair queueing of blocking work across flows, run in a bounded number of threads."""
+
+    def __init__(self, workers: int, weights: dict[str, float] | None = None) -> None:
+        self.workers = workers
+        self.weights = weights or {}
+        self._virtual_time = 0.0
+        self._finish: dict[str, float] = {}
+        self._queue: list[tuple[float, int, asyncio.Future]] = []
+        self._running = 0
+        self._sequence = itertools.count()
+
+    async def run(self, flow: str, cost: float, func: Callable[..., T], *args, **kwargs) -> T:
+        """Run ``func`` in a thread once it is ``flow``'s turn.
+
+        Args:
+            flow (str): flow to account the work to, the requester
+            cost (float): cost of the work, the body size
+            func (Callable[..., T]): blocking function
+
+        Returns:
+            T: result of ``func``
+        """
+        start = max(self._virtual_time, self._finish.get(flow, 0.0))
+        self._finish[flow] = start + max(cost, 1.0) / self.weights.get(flow, 1.0)
+        if len(self._finish) > 10000:
+            self._finish = {f: finish for f, finish in self._finish.items() if finish > self._virtual_time}
+
+        if self._running < self.workers and not self._queue:
+            self._running += 1
+            self._virtual_time = start
+        else:
+            ready = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._queue, (start, next(self._sequence), ready))
+            try:
+                await ready
+            except asyncio.CancelledError:
+                if ready.done() and not ready.cancelled():
+                    self._release()
+                raise
+
+        try:
+            return await asyncio.to_thread(func, *args, **kwargs)
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        """Hand the thread over to the waiting work with the smallest start tag."""
+        while self._queue:
+            start, _, ready = heapq.heappop(self._queue)
+            if ready.cancelled():
+                continue
+            self._virtual_time = start
+            ready.set_result(None)
+            return
+        self._running -= 1
+
+
+def get_rate_limiter(rate_limit: RateLimitSettings) -> RateLimiter | None:
+    if not rate_limit.enabled:
+        return None
+    if rate_limit.backend == "sqlite":
+        return RateLimiter(rate_limit, SQLiteBackend(rate_limit.sqlite_path))
+    return RateLimiter(rate_limit, MemoryBackend())
+
+
+def get_scheduler(rate_limit: RateLimitSettings) -> FairScheduler | None:
+    if rate_limit.validation_workers <= 0:
+        return None
+    return FairScheduler(workers=rate_limit.validation_workers, weights=rate_limit.weights)
+
+
+rate_limiter = get_rate_limiter(settings.rate_limit)
+scheduler = get_scheduler(settings.rate_limit)
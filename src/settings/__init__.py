@@ -1,95 +1,177 @@
 import os
 from typing import Literal
-import re
+from pydantic import BaseModel, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# Defined with the validation, which publishers import without the settings
+from validation import DEFAULT_EXTENSIONS, VERSION_REGEX  # noqa: F401
+
 if os.environ.get("TRANSACTION_AUTHORIZER") == "egi":
     from settings.ceda import CEDAClientSettings as ClientSettings
 else:
     from settings.globus import GlobusClientSettings as ClientSettings
 
-DEFAULT_EXTENSIONS = {
-    "CMIP6": {
-        "CMIP6": {
-            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip6\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://esgf.github.io/stac-transaction-api/cmip6/v3.0.4/schema.json",
-        },
-        "alternate_assets": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
-        },
-        "file": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
-        },
-    },
-    "CMIP6Plus": {
-        "CMIP6Plus": {
-            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip6plus\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://esgf.github.io/stac-transaction-api/cmip6plus/v1.0.4/schema.json",
-        },
-        "alternate_assets": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
-        },
-        "file": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
-        },
-    },
-    "CMIP7": {
-        "CMIP7": {
-            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip7\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://esgf.github.io/stac-transaction-api/cmip7/v1.0.0/schema.json",
-        },
-        "alternate_assets": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
-        },
-        "file": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
-        },
-    },
-    "CORDEX-CMIP6": {
-        "CORDEX-CMIP6": {
-            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cordex-cmip6\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://esgf.github.io/stac-transaction-api/cordex-cmip6/v3.1.2/schema.json",
-        },
-        "alternate_assets": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
-        },
-        "file": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
-        },
-    },
-    "obs4MIPs": {
-        "obs4MIPs": {
-            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/obs4mips\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://esgf.github.io/stac-transaction-api/obs4mips/v1.0.0/schema.json",
-        },
-        "alternate_assets": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
-            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
-        },
-        "file": {
-            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
-            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
-        },
-    },
-}
-
-VERSION_REGEX = re.compile(
-    r"/v("
-    r"(?P<major>0|[1-9]\d*)\."
-    r"(?P<minor>0|[1-9]\d*)\."
-    r"(?P<patch>0|[1-9]\d*)"
-    r"(?:-[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?"
-    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?"
-    r")/"
-)
+
+class AdmissionSettings(BaseModel):
+    """
+    Admission control settings
+    """
+
+    max_in_flight_requests: int = 256
+    max_in_flight_bytes: int = 256 * 1024 * 1024
+    max_producer_queue: int = 50000
+    retry_after_seconds: int = 1
+
+
+class BootstrapSettings(BaseModel):
+    """
+    Startup loading of the access control policy and secrets
+    """
+
+    secrets: bool = False
+    secrets_endpoint_url: str | None = None
+    cache_path: str | None = "/tmp/stac-transaction-api-bootstrap.json"
+    cache_ttl_seconds: int = 300
+
+
+class CaptureSettings(BaseModel):
+    """
+    Traffic capture settings, for test/replay.py
+    """
+
+    enabled: bool = False
+    directory: str = "/tmp/stac-transaction-api-capture"
+    segment_bytes: int = 64 * 1024 * 1024
+    max_segments: int = 10
+    sample_rate: float = 1.0
+    max_body_bytes: int = 1024 * 1024
+    methods: list[str] = ["POST", "PUT", "PATCH", "DELETE"]
+
+
+class CompressionSettings(BaseModel):
+    """
+    Kafka event value compression settings
+    """
+
+    algorithm: Literal["none", "zstd"] = "none"
+    level: int = 3
+    dictionary_path: str | None = None
+
+
+class IdempotencySettings(BaseModel):
+    """
+    Idempotent publishing settings
+    """
+
+    enabled: bool = True
+    ttl_seconds: int = 600
+    max_entries: int = 10000
+
+
+class LoggingSettings(BaseModel):
+    """
+    Logging settings, records are written by a listener thread
+    """
+
+    queue: bool = True
+    queue_size: int = 10000
+    format: Literal["text", "json"] = "text"
+    max_field_chars: int = 2048
+    sample_rates: dict[str, float] = {}
+
+
+class OutboxSettings(BaseModel):
+    """
+    Durable event outbox settings
+    """
+
+    enabled: bool = False
+    directory: str = "/var/spool/stac-transaction-api"
+    segment_bytes: int = 64 * 1024 * 1024
+    fsync: bool = True
+    batch_size: int = 500
+    poll_interval_seconds: float = 1.0
+    max_backoff_seconds: float = 30.0
+
+
+class PatchCoalescingSettings(BaseModel):
+    """
+    PATCH coalescing settings, disabled with a window of 0 seconds
+    """
+
+    window_seconds: float = 0.0
+    max_patches: int = 100
+
+
+class ProducerSettings(BaseModel):
+    """
+    Event producer settings, the memory and file backends stand in for Kafka
+    """
+
+    backend: Literal["kafka", "memory", "file"] = "kafka"
+    topic: str = "esgf.local"
+    latency_seconds: float = 0.0
+    memory_capacity: int = 10000
+    file_directory: str = "/tmp/stac-transaction-api-events"
+    file_segment_bytes: int = 64 * 1024 * 1024
+    timing_samples: int = 10000
+
+
+class ProfilingSettings(BaseModel):
+    """
+    On-demand request profiling settings
+    """
+
+    enabled: bool = False
+    token: SecretStr | None = None
+    sample_rate: float = 0.0
+    profiler: Literal["pyinstrument", "cprofile"] = "pyinstrument"
+    interval_seconds: float = 0.001
+    directory: str = "/tmp/stac-transaction-api-profiles"
+    max_profiles: int = 100
+
+
+class RateLimitRule(BaseModel):
+    """
+    Token bucket rate and capacity
+    """
+
+    rate: float
+    burst: float
+
+
+class RateLimitSettings(BaseModel):
+    """
+    Per-requester rate limiting and validation scheduling settings
+    """
+
+    enabled: bool = False
+    rate: float = 20.0
+    burst: float = 100.0
+    collections: dict[str, RateLimitRule] = {}
+    backend: Literal["memory", "sqlite"] = "memory"
+    sqlite_path: str = "/tmp/stac-transaction-api-rate-limit.sqlite"
+    validation_workers: int = 0
+    weights: dict[str, float] = {}
+
+
+class TracingSettings(BaseModel):
+    """
+    OpenTelemetry tracing settings
+    """
+
+    exporter: Literal["none", "console", "file", "otlp"] = "none"
+    service_name: str = "stac-transaction-api"
+    file_path: str = "spans.jsonl"
+
+
+class WarmupSettings(BaseModel):
+    """
+    Warm-up settings, of the validators and the publication pipeline
+    """
+
+    enabled: bool = False
+    collections: list[str] = []
 
 
 class Settings(BaseSettings):
@@ -104,9 +186,25 @@ class Settings(BaseSettings):
         extra="ignore",
     )
 
+    admission: AdmissionSettings = AdmissionSettings()
     authorizer: Literal["egi", "globus"]
+    bootstrap: BootstrapSettings = BootstrapSettings()
+    capture: CaptureSettings = CaptureSettings()
     client: ClientSettings
+    codec: Literal["json", "orjson", "msgspec"] = "json"
+    compression: CompressionSettings = CompressionSettings()
     debug: bool = False
+    idempotency: IdempotencySettings = IdempotencySettings()
+    logging: LoggingSettings = LoggingSettings()
+    metrics: bool = True
+    outbox: OutboxSettings = OutboxSettings()
+    patch_coalescing: PatchCoalescingSettings = PatchCoalescingSettings()
+    producer: ProducerSettings = ProducerSettings()
+    profiling: ProfilingSettings = ProfilingSettings()
+    rate_limit: RateLimitSettings = RateLimitSettings()
+    schema_directory: str | None = None
+    tracing: TracingSettings = TracingSettings()
+    warmup: WarmupSettings = WarmupSettings()
 
 
 settings = Settings()
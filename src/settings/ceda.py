@@ -15,3 +15,8 @@ class CEDAClientSettings(BaseModel):
         r"(\:institution\:(?P<institution>[^:]*))?\:role=(?P<role>[^:]*)#aai\.egi\.eu"
     )
     scope: str = "offline_access entitlements"
+
+    def initialize(self) -> None:
+        """
+        Nothing to load, EGI tokens are introspected per request.
+        """
@@ -1,10 +1,7 @@
 import json
-from typing import Any, Self
+from typing import Any
 
-import boto3
-import urllib3
-from globus_sdk import ConfidentialAppAuthClient
-from pydantic import BaseModel, model_validator
+from pydantic import BaseModel
 
 
 class GlobusClientSettings(BaseModel):
@@ -17,14 +14,16 @@ class GlobusClientSettings(BaseModel):
     issuer: str
     scope_string: str
 
-    access_control_policy: dict
-    confidential_client: Any
+    # Loaded by initialize(), at startup, so importing settings does not wait for the network
+    access_control_policy: dict | None = None
+    confidential_client: Any = None
 
     policy_path: str
     secret_name: str = "transaction-api/integration"
     region: str = "us-east-1"
     authorizer_cache_ttl_seconds: int = 300
 
+    @staticmethod
     def load_access_control_policy(policy_path: str) -> dict:
         """load access control policy
 
@@ -34,6 +33,8 @@ class GlobusClientSettings(BaseModel):
         Returns:
             dict: data with access control policy
         """
+        import urllib3
+
         parsed = urllib3.util.parse_url(policy_path)
         if parsed.scheme == "file":
             with open(parsed.path) as file:
@@ -42,44 +43,23 @@ class GlobusClientSettings(BaseModel):
         else:
             http = urllib3.PoolManager()
             response = http.request("GET", policy_path)
-            if response.status == 200:
-                print("Access Control Policy loaded")
-                return json.loads(response.data.decode("utf-8"))
-
-    def load_secrets(data: dict) -> dict:
-        """load secrets from AWS
-
-        Args:
-            data (dict): inital data
-
-        Returns:
-            dict: data with secrets
-        """
-        try:
-            session = boto3.session.Session()
-            client = session.client("secretsmanager", region_name=data["region"])
-            response = client.get_secret_value(SecretId=data["secret_name"])
-            secrets = json.loads(response["SecretString"])
-        except Exception as e:
-            print(f"Error loading secrets: {e}")
-            secrets = {}
-
-        for key, value in secrets.items():
-            data[key] = value
-
-        return data
+            if response.status != 200:
+                raise RuntimeError(f"Access Control Policy could not be loaded from {policy_path}: HTTP {response.status}")
+            print("Access Control Policy loaded")
+            return json.loads(response.data.decode("utf-8"))
 
-    @model_validator(mode="before")
-    @classmethod
-    def pre_load(self, data: dict) -> Self:
+    def initialize(self) -> None:
         """
-        Load the access control policy, secrets, and confidential_client.
+        Load the access control policy and create the confidential_client, unless already set,
+        by bootstrap.py for the policy.
         """
-        data["access_control_policy"] = self.load_access_control_policy(data["policy_path"])
+        if self.access_control_policy is None:
+            self.access_control_policy = self.load_access_control_policy(self.policy_path)
 
-        data["confidential_client"] = ConfidentialAppAuthClient(
-            client_id=data["client_id"],
-            client_secret=data["client_secret"],
-        )
+        if self.confidential_client is None:
+            from globus_sdk import ConfidentialAppAuthClient
 
-        return data
+            self.confidential_client = ConfidentialAppAuthClient(
+                client_id=self.client_id,
+                client_secret=self.client_secret,
+            )
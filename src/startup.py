@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from esgf_core_utils.models.exceptions import RFC9457Exception
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from bootstrap import initialize_client
+from codec import CodecJSONResponse
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Deferred startup
+    Importing the API neither waits for the network nor imports the modules only needed to serve
+    requests. Once the server is listening, these steps run in the background, concurrently:
+        - bootstrap.initialize_client(): access control policy, secrets and Globus confidential client
+        - import of LAZY_MODULES
+    Requests wait for startup to finish, except the health check and metrics, so the container
+    passes its health check sooner. If startup fails, requests and the health check get a 503.
+"""
+
+LAZY_MODULES = ["globus_sdk", "httpx", "jsonschema", "shapely.geometry"]
+BYPASS_PATHS = ["/healthcheck", "/metrics"]
+
+
+class StartupFailedException(RFC9457Exception):
+    """
+    Startup failed
+    """
+
+    def __init__(self, instance: str) -> None:
+        self.status_code = 503
+        self.type = "https://esgf.io/publication/errors/startup-failed"
+        self.title = "The API failed to start"
+        self.detail = "The API could not load its configuration -- please try again later."
+        self.instance = instance
+
+
+def import_lazy_modules() -> None:
+    for module in LAZY_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            # Optional for one of the authorizers
+            logger.debug("Module %s not installed", module)
+
+
+class Startup:
+    """
+    Startup steps run concurrently in background threads, once
+    """
+
+    def __init__(self, steps: list[Callable[[], None]]) -> None:
+        self.steps = steps
+        self.future: Future | None = None
+        self.lock = threading.Lock()
+
+    def start(self) -> Future:
+        """Start the steps, unless already started.
+
+        Returns:
+            Future: done when every step has finished
+        """
+        with self.lock:
+            if self.future is None:
+                self.future = Future()
+                threading.Thread(target=self.run, name="startup", daemon=True).start()
+        return self.future
+
+    def run(self) -> None:
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.steps), thread_name_prefix="startup") as executor:
+                for future in [executor.submit(step) for step in self.steps]:
+                    future.result()
+        except Exception as exc:
+            logger.exception("Startup failed")
+            self.future.set_exception(exc)
+        else:
+            logger.info("Startup finished in %.3fs", time.perf_counter() - started)
+            self.future.set_result(None)
+
+    async def wait(self) -> None:
+        """Wait for the steps, starting them if the lifespan did not."""
+        await asyncio.wrap_future(self.start())
+
+    @property
+    def ready(self) -> bool:
+        return self.future is not None and self.future.done() and self.future.exception() is None
+
+    @property
+    def failed(self) -> bool:
+        return self.future is not None and self.future.done() and self.future.exception() is not None
+
+
+class StartupMiddleware(BaseHTTPMiddleware):
+    def __init__(self, app, startup: Startup) -> None:
+        super().__init__(app)
+        self.startup = startup
+
+    async def dispatch(self, request: Request, call_next):
+        if request.url.path in BYPASS_PATHS:
+            return await call_next(request)
+
+        try:
+            await self.startup.wait()
+        except Exception:
+            exc = StartupFailedException(instance=request.headers.get("x-request-id", ""))
+            return CodecJSONResponse(
+                status_code=exc.status_code,
+                content={
+                    "status_code": exc.status_code,
+                    "type": exc.type,
+                    "title": exc.title,
+                    "detail": exc.detail,
+                    "instance": exc.instance,
+                },
+            )
+        return await call_next(request)
+
+
+startup = Startup([initialize_client, import_lazy_modules])
@@ -0,0 +1,99 @@
+import asyncio
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import httpx
+from esgf_core_utils.models.kafka.events import Auth, Data, KafkaEvent, Metadata, PatchPayload, Publisher, RequesterData
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from admission import AdmissionController, ServiceOverloadedException, TooManyRequestsException
+from client import TransactionClient
+from producer import MemoryProducer
+from settings import AdmissionSettings, settings
+
+
+def event(item_id: str) -> KafkaEvent:
+    metadata = Metadata(
+        auth=Auth(requester_data=RequesterData(client_id="client", sub="publisher", iss="issuer")),
+        event_id=item_id,
+        publisher=Publisher(package="esgcet", version="5.3.0"),
+        request_id=item_id,
+        time=datetime.now().isoformat(),
+        schema_version="1.0.0",
+    )
+    payload = PatchPayload(method="PATCH", collection_id="CMIP6", item_id=item_id, patch=[])
+    return KafkaEvent(metadata=metadata, data=Data(type="STAC", payload=payload))
+
+
+class TestAdmission(unittest.TestCase):
+    def setUp(self):
+        limits = AdmissionSettings(max_in_flight_requests=2, max_in_flight_bytes=100, max_producer_queue=10, retry_after_seconds=5)
+        patcher = mock.patch.object(settings, "admission", limits)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_admission__limits(self):
+        controller = AdmissionController(FastAPI(), backlog=lambda: 0)
+        controller.admit(1000, instance="")
+
+        controller.in_flight_bytes = 60
+        controller.admit(40, instance="")
+        with self.assertRaises(TooManyRequestsException):
+            controller.admit(41, instance="")
+
+        controller.in_flight_requests = 2
+        with self.assertRaises(TooManyRequestsException):
+            controller.admit(0, instance="")
+
+        controller = AdmissionController(FastAPI(), backlog=lambda: 10)
+        with self.assertRaises(ServiceOverloadedException):
+            controller.admit(0, instance="")
+
+    def test_admission__retry_after(self):
+        app = FastAPI()
+
+        @app.post("/items")
+        async def create():
+            return {}
+
+        app.add_middleware(AdmissionController, backlog=lambda: 10)
+        client = TestClient(app)
+
+        response = client.post("/items", json={}, headers={"x-request-id": "r"})
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "5"
+        assert response.json()["instance"] == "r"
+        assert client.get("/items").status_code == 405
+
+    def test_admission__slow_delivery(self):
+        limits = AdmissionSettings(max_in_flight_requests=100, max_producer_queue=10, retry_after_seconds=5)
+        patcher = mock.patch.object(settings, "admission", limits)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        core_client = TransactionClient()
+        core_client.producer = MemoryProducer(topic="esgf.test", latency_seconds=0.2)
+        app = FastAPI()
+
+        @app.patch("/items/{item_id}")
+        async def update(item_id: str):
+            await core_client.publish(key=item_id, event=event(item_id), request_id=item_id, event_id=item_id)
+            return {}
+
+        app.add_middleware(AdmissionController, backlog=core_client.event_backlog)
+
+        async def main():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                delivering = [asyncio.create_task(client.patch(f"/items/item{i}")) for i in range(10)]
+                await asyncio.sleep(0.05)
+                rejected = [await client.patch(f"/items/late{i}") for i in range(5)]
+                return await asyncio.gather(*delivering) + rejected
+
+        statuses = [response.status_code for response in asyncio.run(main())]
+
+        # Produces wait for delivery in threads, those beyond the limit are rejected
+        assert statuses.count(200) == 10 and statuses.count(503) == 5
+        assert len(core_client.producer) == 10
+        assert core_client.event_backlog() == 0
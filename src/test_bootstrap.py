@@ -0,0 +1,99 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from bootstrap import BootstrapCache, initialize_client, load
+from settings import BootstrapSettings
+from settings.globus import GlobusClientSettings
+
+SECRETS = {"client_secret": "from-secrets-manager"}
+
+
+class SecretsManagerHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the GetSecretValue action of AWS Secrets Manager"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["content-length"])))
+        self.server.requests.append(request["SecretId"])
+        assert self.headers["x-amz-target"] == "secretsmanager.GetSecretValue"
+        body = json.dumps({"Name": request["SecretId"], "SecretString": json.dumps(SECRETS)}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-amz-json-1.1")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class TestBootstrap(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.policy_path = os.path.join(directory.name, "access_control_policy.json")
+        with open(self.policy_path, "w") as file:
+            json.dump({"project": {"CMIP6": []}}, file)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SecretsManagerHandler)
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.shutdown)
+
+        patcher = mock.patch.dict(os.environ, {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test"})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.bootstrap = BootstrapSettings(
+            secrets=True,
+            secrets_endpoint_url=f"http://127.0.0.1:{self.server.server_address[1]}",
+            cache_path=os.path.join(directory.name, "bootstrap.json"),
+            cache_ttl_seconds=300,
+        )
+
+    def client_settings(self) -> GlobusClientSettings:
+        return GlobusClientSettings(
+            client_id="client",
+            client_secret="from-environment",
+            issuer="https://auth.globus.org",
+            scope_string="scope",
+            policy_path=f"file://{self.policy_path}",
+            confidential_client=object(),
+        )
+
+    def test_bootstrap__cached_across_processes(self):
+        client_settings = self.client_settings()
+        initialize_client(client_settings, self.bootstrap)
+        assert client_settings.client_secret == "from-secrets-manager"
+        assert client_settings.access_control_policy == {"project": {"CMIP6": []}}
+
+        # Another worker reads the cache
+        assert load(self.client_settings(), self.bootstrap)["secrets"] == SECRETS
+        assert self.server.requests == ["transaction-api/integration"]
+        assert oct(os.stat(self.bootstrap.cache_path).st_mode & 0o777) == "0o600"
+
+    def test_bootstrap__last_known_good(self):
+        load(self.client_settings(), self.bootstrap)
+        os.remove(self.policy_path)
+
+        expired = self.bootstrap.model_copy(update={"cache_ttl_seconds": 0})
+        assert load(self.client_settings(), expired)["access_control_policy"] == {"project": {"CMIP6": []}}
+
+        with self.assertRaises(FileNotFoundError):
+            load(self.client_settings(), expired.model_copy(update={"cache_path": None}))
+
+    def test_bootstrap__integrity(self):
+        load(self.client_settings(), self.bootstrap)
+        with open(self.bootstrap.cache_path) as file:
+            cached = json.load(file)
+        cached["data"]["secrets"]["client_secret"] = "tampered"
+        with open(self.bootstrap.cache_path, "w") as file:
+            json.dump(cached, file)
+
+        assert BootstrapCache(self.bootstrap.cache_path).read(cached["key"]) is None
+        assert load(self.client_settings(), self.bootstrap)["secrets"] == SECRETS
+        assert len(self.server.requests) == 2
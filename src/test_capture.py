@@ -0,0 +1,65 @@
+import json
+import tempfile
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import capture
+from settings import CaptureSettings
+
+ITEM = {"type": "Feature", "id": "CMIP6.test", "properties": {"title": "Ünïcödé"}}
+
+
+class TestCapture(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def client(self, **kwargs) -> TestClient:
+        app = FastAPI()
+
+        @app.post("/collections/{collection_id}/items")
+        async def create(request: Request):
+            return await request.json()
+
+        @app.patch("/collections/{collection_id}/items/{item_id}")
+        async def rejected():
+            # Answered without reading the body, as the admission controller does
+            return JSONResponse({}, status_code=429)
+
+        @app.get("/collections")
+        async def collections():
+            return []
+
+        app.add_middleware(capture.CaptureMiddleware, capture_settings=CaptureSettings(enabled=True, directory=self.directory, **kwargs))
+        return TestClient(app)
+
+    def test_capture__sanitized(self):
+        client = self.client()
+        headers = {"Authorization": "Bearer secret-token", "X-Profile-Token": "profile", "X-Request-Id": "r1"}
+        assert client.post("/collections/CMIP6/items", json=ITEM, headers=headers).json() == ITEM
+        client.patch("/collections/CMIP6/items/CMIP6.test", json=[{"op": "remove", "path": "/a"}], headers=headers)
+        client.get("/collections", headers=headers)
+
+        records = capture.read_captures(self.directory)
+        assert [(r["method"], r["status"]) for r in records] == [("POST", 200), ("PATCH", 429)]
+        assert json.loads(capture.capture_body(records[0])) == ITEM
+        # The body of a request answered without reading it is recorded too
+        assert json.loads(capture.capture_body(records[1])) == [{"op": "remove", "path": "/a"}]
+        assert records[0]["headers"]["x-request-id"] == "r1"
+        assert records[0]["requester"] == records[1]["requester"]
+        for record in records:
+            assert "secret-token" not in json.dumps(record)
+            assert "authorization" not in record["headers"] and "x-profile-token" not in record["headers"]
+
+    def test_capture__truncated_and_rotated(self):
+        client = self.client(max_body_bytes=10, segment_bytes=1, max_segments=2)
+        for _ in range(4):
+            assert client.post("/collections/CMIP6/items", json=ITEM).json() == ITEM
+
+        records = capture.read_captures(self.directory)
+        assert len(records) == 2
+        assert records[0]["body_truncated"] and len(capture.capture_body(records[0])) == 10
@@ -0,0 +1,116 @@
+import asyncio
+import unittest
+from datetime import datetime
+
+from esgf_core_utils.models.exceptions import UnknownException
+from esgf_core_utils.models.kafka.events import Auth, Metadata, Publisher, RequesterData
+from stac_fastapi.extensions.transaction.request import PartialItem
+
+from coalesce import PatchCoalescer, patch_adapter
+
+
+def metadata(request_id: str) -> Metadata:
+    return Metadata(
+        auth=Auth(requester_data=RequesterData(client_id="client", sub="publisher", iss="issuer")),
+        event_id=f"event-{request_id}",
+        publisher=Publisher(package="esgcet", version="5.3.0"),
+        request_id=request_id,
+        time=datetime.now().isoformat(),
+        schema_version="1.0.0",
+    )
+
+
+def merge_patch(**properties) -> PartialItem:
+    return PartialItem.model_validate({"properties": properties})
+
+
+def json_patch(path: str) -> list:
+    return patch_adapter.validate_python([{"op": "add", "path": path, "value": True}])
+
+
+class Producer:
+    """Records the produced events, slowly."""
+
+    def __init__(self, delay: float = 0.0, exception: Exception | None = None) -> None:
+        self.delay = delay
+        self.exception = exception
+        self.events = []
+
+    async def __call__(self, key, event, request_id, event_id) -> None:
+        self.events.append(event)
+        await asyncio.sleep(self.delay)
+        if self.exception:
+            raise self.exception
+
+
+class TestCoalesce(unittest.TestCase):
+    def run_submits(self, coalescer: PatchCoalescer, *submits, timeout: float = 2.0) -> list:
+        async def main():
+            tasks = []
+            for patch, request_id in submits:
+                tasks.append(asyncio.create_task(coalescer.submit("CMIP6", "item", patch, metadata(request_id))))
+                await asyncio.sleep(0)
+            return await asyncio.wait_for(asyncio.gather(*tasks, return_exceptions=True), timeout)
+
+        return asyncio.run(main())
+
+    def test_coalesce__merged(self):
+        publish = Producer()
+        coalescer = PatchCoalescer(window_seconds=0.01, max_patches=100, publish=publish)
+
+        results = self.run_submits(coalescer, (merge_patch(retracted=True, version="1"), "r1"), (merge_patch(version="2"), "r2"))
+
+        assert results == [None, None]
+        assert len(publish.events) == 1
+        event = publish.events[0]
+        assert event.metadata.request_ids == ["r1", "r2"]
+        assert event.data.payload.patch.properties == {"retracted": True, "version": "2"}
+
+    def test_coalesce__window(self):
+        publish = Producer()
+        coalescer = PatchCoalescer(window_seconds=0.05, max_patches=100, publish=publish)
+
+        async def main():
+            task = asyncio.create_task(coalescer.submit("CMIP6", "item", merge_patch(retracted=True), metadata("r1")))
+            await asyncio.sleep(0.01)
+            assert not task.done() and publish.events == []
+            await asyncio.wait_for(task, 1.0)
+
+        asyncio.run(main())
+        assert len(publish.events) == 1
+
+    def test_coalesce__max_patches(self):
+        publish = Producer()
+        coalescer = PatchCoalescer(window_seconds=60, max_patches=2, publish=publish)
+
+        # Produced once full, long before the window ends
+        results = self.run_submits(coalescer, (json_patch("/properties/a"), "r1"), (json_patch("/properties/b"), "r2"), timeout=1.0)
+
+        assert results == [None, None]
+        assert [event.metadata.request_ids for event in publish.events] == [["r1", "r2"]]
+
+    def test_coalesce__failure(self):
+        publish = Producer(exception=UnknownException(instance="r1"))
+        coalescer = PatchCoalescer(window_seconds=0.01, max_patches=100, publish=publish)
+
+        results = self.run_submits(coalescer, (merge_patch(a=1), "r1"), (merge_patch(b=2), "r2"))
+
+        assert len(publish.events) == 1
+        assert [type(result) for result in results] == [UnknownException, UnknownException]
+
+    def test_coalesce__concurrent(self):
+        publish = Producer(delay=0.05)
+        coalescer = PatchCoalescer(window_seconds=0.1, max_patches=100, publish=publish)
+
+        async def main():
+            first = asyncio.create_task(coalescer.submit("CMIP6", "item", merge_patch(a=1), metadata("r1")))
+            await asyncio.sleep(0)
+            # Incompatible, produces the first batch, while a request starts the next batch
+            second = asyncio.create_task(coalescer.submit("CMIP6", "item", json_patch("/properties/b"), metadata("r2")))
+            await asyncio.sleep(0.01)
+            third = asyncio.create_task(coalescer.submit("CMIP6", "item", json_patch("/properties/c"), metadata("r3")))
+            await asyncio.wait_for(asyncio.gather(first, second, third), 2.0)
+            await coalescer.flush_all()
+
+        asyncio.run(main())
+        assert sorted(event.metadata.request_ids for event in publish.events) == [["r1"], ["r3", "r2"]]
@@ -0,0 +1,52 @@
+import json
+import unittest
+
+from esgf_core_utils.models.kafka.events import CreatePayload
+from stac_pydantic.item import Item
+
+from codec import CODECS, get_codec
+
+ITEM = {
+    "type": "Feature",
+    "stac_version": "1.0.0",
+    "id": "CMIP6.test",
+    "collection": "CMIP6",
+    "geometry": {"type": "Point", "coordinates": [0.0, 0.0]},
+    "bbox": [0.0, 0.0, 0.0, 0.0],
+    "properties": {"datetime": "2000-01-01T00:00:00Z", "title": "Ünïcödé"},
+    "links": [],
+    "assets": {},
+}
+
+
+class TestCodec(unittest.TestCase):
+    def test_codec__round_trip(self):
+        for name in CODECS:
+            try:
+                codec = get_codec(name)
+            except ImportError:
+                continue
+            with self.subTest(codec=name):
+                assert codec.loads(codec.dumps(ITEM)) == ITEM
+                assert json.loads(codec.dumps(ITEM)) == ITEM
+
+    def test_codec__invalid_json(self):
+        for name in CODECS:
+            try:
+                codec = get_codec(name)
+            except ImportError:
+                continue
+            with self.subTest(codec=name):
+                with self.assertRaises(json.JSONDecodeError):
+                    codec.loads(b'{"type": ')
+
+    def test_codec__model(self):
+        codec = get_codec("json")
+        item = Item.model_validate(ITEM)
+        payload = CreatePayload(method="POST", collection_id="CMIP6", item=item.model_dump())
+
+        assert codec.encode_event(payload) == payload.model_dump_json().encode("utf8")
+
+    def test_codec__unknown(self):
+        with self.assertRaises(ValueError):
+            get_codec("pickle")
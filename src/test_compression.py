@@ -0,0 +1,60 @@
+import json
+import os
+import tempfile
+import unittest
+
+from compression import CONTENT_ENCODING_HEADER, DICTIONARY_ID_HEADER, Compressor, ZstdCompressor, decompress
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+VALUE = json.dumps(
+    {
+        "assets": {
+            f"data{i:04}": {
+                "href": f"https://esgf-node.example.org/thredds/fileServer/CMIP6/file_{i}.nc",
+                "type": "application/netcdf",
+                "roles": ["data"],
+                "alternate:name": "esgf-node.example.org",
+            }
+            for i in range(200)
+        }
+    }
+).encode("utf8")
+
+
+class TestCompression(unittest.TestCase):
+    def test_compression__identity(self):
+        value, headers = Compressor().compress(VALUE)
+
+        assert value == VALUE
+        assert headers == []
+        assert decompress(value, headers) == VALUE
+
+    @unittest.skipUnless(zstandard, "zstandard not installed")
+    def test_compression__zstd(self):
+        value, headers = ZstdCompressor().compress(VALUE)
+
+        assert len(value) < len(VALUE)
+        assert dict(headers) == {CONTENT_ENCODING_HEADER: b"zstd"}
+        assert decompress(value, headers) == VALUE
+
+    @unittest.skipUnless(zstandard, "zstandard not installed")
+    def test_compression__zstd_dictionary(self):
+        chunks = [VALUE[start:] for start in range(0, 20000, 100)]
+        samples = [json.dumps({"id": i, "value": chunk[:400].decode()}).encode() for i, chunk in enumerate(chunks)]
+        dictionary = zstandard.train_dictionary(4096, samples)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            dictionary_path = os.path.join(tmp, "stac-item.zstd-dict")
+            with open(dictionary_path, "wb") as f:
+                f.write(dictionary.as_bytes())
+
+            value, headers = ZstdCompressor(dictionary_path=dictionary_path).compress(VALUE)
+
+        assert dict(headers)[DICTIONARY_ID_HEADER] == str(dictionary.dict_id()).encode()
+        assert decompress(value, headers, {dictionary.dict_id(): dictionary.as_bytes()}) == VALUE
+        with self.assertRaises(ValueError):
+            decompress(value, headers)
@@ -0,0 +1,50 @@
+import json
+import unittest
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+import api
+from startup import Startup
+
+
+def fail() -> None:
+    raise RuntimeError("policy unavailable")
+
+
+class TestFastLane(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(api.app)
+
+    def test_fastlane__healthcheck(self):
+        response = self.client.get("/healthcheck")
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "no-store"
+        assert json.loads(response.content) == {"healthcheck": True}
+
+        failed = Startup([fail])
+        failed.start().exception()
+        with mock.patch.object(api, "startup", failed):
+            assert self.client.get("/healthcheck").status_code == 503
+
+    def test_fastlane__openapi(self):
+        response = self.client.get("/openapi.json")
+        assert response.status_code == 200
+        assert "/collections/{collection_id}/items" in response.json()["paths"]
+
+        etag = response.headers["etag"]
+        not_modified = self.client.get("/openapi.json", headers={"If-None-Match": etag})
+        assert not_modified.status_code == 304
+        assert not_modified.content == b""
+
+        head = self.client.head("/openapi.json")
+        assert head.headers["etag"] == etag
+        assert head.content == b""
+
+    def test_fastlane__no_authorization(self):
+        # Served without an Authorization header, before the authorizer
+        assert self.client.get("/favicon.ico").status_code == 404
+        assert self.client.get("/openapi.json").status_code == 200
+
+    def test_fastlane__other_methods(self):
+        assert self.client.post("/healthcheck").status_code == 405
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+from fastapi import Response
+
+from idempotency import IdempotencyKeyReusedException, IdempotencyStore, request_key
+
+
+def lookup(store: IdempotencyStore, key) -> Response | None:
+    return asyncio.run(store.lookup(key, instance=""))
+
+
+class TestIdempotency(unittest.TestCase):
+    def test_idempotency__duplicate_body(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        key = request_key("POST", "CMIP6", "item", b'{"id": "item"}')
+
+        assert lookup(store, key) is None
+        store.record(key, Response(status_code=202, content="Item queued for publication"))
+
+        duplicate = lookup(store, request_key("POST", "CMIP6", "item", b'{"id": "item"}'))
+        assert duplicate.status_code == 202
+        assert duplicate.body == b"Item queued for publication"
+        assert duplicate.headers["Idempotent-Replayed"] == "true"
+
+    def test_idempotency__later_change(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        retract = request_key("PATCH", "CMIP6", "item", b'{"properties": {"retracted": true}}')
+        restore = request_key("PATCH", "CMIP6", "item", b'{"properties": {"retracted": false}}')
+
+        store.record(retract, Response(status_code=202))
+        store.record(restore, Response(status_code=202))
+
+        assert lookup(store, retract) is None
+
+    def test_idempotency__key_reused(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        store.record(request_key("POST", "CMIP6", "item", b"{}", idempotency_key="k"), Response(status_code=202))
+
+        with self.assertRaises(IdempotencyKeyReusedException):
+            lookup(store, request_key("POST", "CMIP6", "item", b"[]", idempotency_key="k"))
+
+    def test_idempotency__bounded(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=2)
+        keys = [request_key("POST", "CMIP6", f"item{i}", b"{}") for i in range(3)]
+        for key in keys:
+            store.record(key, Response(status_code=202))
+
+        assert lookup(store, keys[0]) is None
+        assert lookup(store, keys[2]) is not None
+
+    def test_idempotency__concurrent(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        key = request_key("POST", "CMIP6", "item", b"{}", idempotency_key="k")
+
+        async def main():
+            assert await store.lookup(key, instance="") is None
+            retry = asyncio.create_task(store.lookup(key, instance=""))
+            await asyncio.sleep(0.01)
+            # Waits for the original request instead of publishing again
+            assert not retry.done()
+            with self.assertRaises(IdempotencyKeyReusedException):
+                await store.lookup(request_key("POST", "CMIP6", "item", b"[]", idempotency_key="k"), instance="")
+
+            store.record(key, Response(status_code=202))
+            assert (await retry).headers["Idempotent-Replayed"] == "true"
+
+        asyncio.run(main())
+
+    def test_idempotency__original_failed(self):
+        store = IdempotencyStore(ttl_seconds=60, max_entries=10)
+        key = request_key("PATCH", "CMIP6", "item", b"{}")
+
+        async def main():
+            assert await store.lookup(key, instance="") is None
+            retry = asyncio.create_task(store.lookup(key, instance=""))
+            await asyncio.sleep(0.01)
+            store.release(key)
+            # Reserved by the retry, which is handled as a new request
+            assert await retry is None
+            late = asyncio.create_task(store.lookup(key, instance=""))
+            await asyncio.sleep(0.01)
+            assert not late.done()
+            store.release(key)
+            assert await late is None
+
+        asyncio.run(main())
@@ -0,0 +1,100 @@
+import io
+import json
+import logging
+import threading
+import time
+import unittest
+
+import logs
+import metrics
+from settings import LoggingSettings
+
+
+class ThreadFormatter(logging.Formatter):
+    """Records the threads formatting messages."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.threads = set()
+
+    def format(self, record):
+        self.threads.add(threading.current_thread())
+        return super().format(record)
+
+
+class TestLogs(unittest.TestCase):
+    def setUp(self):
+        self.name = f"test.logs.{self._testMethodName}"
+        self.stream = io.StringIO()
+        handler = logging.StreamHandler(self.stream)
+        self.formatter = ThreadFormatter()
+        handler.setFormatter(self.formatter)
+        self.logger = logging.getLogger(self.name)
+        self.logger.handlers = [handler]
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.addCleanup(logs.pipelines.pop, self.name, None)
+
+    def lines(self) -> list[str]:
+        logs.pipelines[self.name].stop()
+        return self.stream.getvalue().splitlines()
+
+    def test_logs__queued_and_truncated(self):
+        logs.configure(LoggingSettings(max_field_chars=100), names=(self.name,))
+        assert isinstance(self.logger.handlers[0], logs.PipelineHandler)
+
+        self.logger.info("PATCH BODY: %s", {"properties": "x" * 100 * 1024})
+        self.logger.info("Token info: %(sub)s", {"sub": "publisher"})
+        lines = self.lines()
+
+        # Formatted by the listener, not the thread logging
+        assert threading.current_thread() not in self.formatter.threads
+        assert lines[0].endswith("more characters)") and len(lines[0]) < 200
+        assert lines[1] == "Token info: publisher"
+
+    def test_logs__sampled_json(self):
+        logging_settings = LoggingSettings(format="json", sample_rates={self.name: 0.0})
+        logs.configure(logging_settings, names=(self.name,))
+        # Configured again, e.g. in a gunicorn worker, without adding filters twice
+        logs.configure(logging_settings, names=(self.name,))
+        assert len(self.logger.handlers[0].filters) == 1
+
+        self.logger.info("Sampled out")
+        try:
+            raise ValueError("failed")
+        except ValueError:
+            self.logger.exception("Kept")
+        records = [json.loads(line) for line in self.lines()]
+
+        assert [(r["level"], r["logger"], r["message"]) for r in records] == [("ERROR", self.name, "Kept")]
+        assert "ValueError: failed" in records[0]["exception"]
+
+    def test_logs__dropped(self):
+        logs.configure(LoggingSettings(queue_size=2), names=(self.name,))
+        pipeline = logs.pipelines[self.name]
+        handler = pipeline.handlers[0]
+        released = threading.Event()
+        emit = handler.emit
+
+        def blocking_emit(record):
+            released.wait(5)
+            emit(record)
+
+        handler.emit = blocking_emit
+
+        # The listener blocks on the first record, the next two fill the queue
+        self.logger.info("first")
+        while not pipeline.queue.empty():
+            time.sleep(0.001)
+        for i in range(4):
+            self.logger.info("record %d", i)
+        assert pipeline.dropped == 2
+        if metrics.enabled:
+            assert metrics.prometheus_client.REGISTRY.get_sample_value("transaction_log_records_dropped_total", {"logger": self.name}) == 2
+
+        released.set()
+        pipeline.queue.join()
+        self.logger.info("last")
+        pipeline.queue.join()
+
+        assert self.lines() == ["first", "record 0", "record 1", "2 log records dropped, the logging queue was full", "last"]
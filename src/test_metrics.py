@@ -0,0 +1,47 @@
+import asyncio
+import unittest
+
+import metrics
+
+
+@unittest.skipUnless(metrics.enabled, "prometheus_client not installed")
+class TestMetrics(unittest.TestCase):
+    def sample(self, name, labels):
+        return metrics.prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_metrics__stage_labels(self):
+        labels = {"stage": "geometry", "collection": "CMIP6", "operation": "PATCH"}
+        before = self.sample("transaction_stage_seconds_count", labels)
+
+        async def request():
+            metrics.set_request_labels("CMIP6", "PATCH")
+            with metrics.stage("geometry"):
+                pass
+
+        asyncio.run(request())
+        with metrics.stage("geometry"):
+            pass
+
+        assert self.sample("transaction_stage_seconds_count", labels) == before + 1
+
+    def test_metrics__unknown_collection(self):
+        async def request(collection_id):
+            metrics.set_request_labels(collection_id, "POST")
+            with metrics.stage("authorize"):
+                pass
+
+        labels = {"stage": "authorize", "collection": "other", "operation": "POST"}
+        before = self.sample("transaction_stage_seconds_count", labels)
+        for i in range(3):
+            asyncio.run(request(f"unknown-{i}"))
+
+        # One series, whatever the collections in the URLs
+        assert self.sample("transaction_stage_seconds_count", labels) == before + 3
+        assert self.sample("transaction_stage_seconds_count", {**labels, "collection": "unknown-0"}) == 0
+
+    def test_metrics__response(self):
+        metrics.AUTH_CACHE.labels("hit").inc()
+        response = metrics.metrics_response()
+
+        assert response.media_type.startswith("text/plain")
+        assert b'transaction_auth_cache_total{result="hit"}' in response.body
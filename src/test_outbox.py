@@ -0,0 +1,164 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from confluent_kafka import KafkaError
+
+from outbox import Outbox, OutboxDrainer, OutboxRecord, undelivered
+
+
+class StubProducer:
+    def __init__(self):
+        self.sent = []
+        self.fail = False
+
+    def success_batch(self, messages):
+        if self.fail:
+            return [KafkaError(KafkaError._TRANSPORT)] * len(messages)
+        self.sent.extend(messages)
+        return [None] * len(messages)
+
+
+def record(i: int) -> OutboxRecord:
+    return OutboxRecord(key=f"item{i % 2}".encode(), value=f'{{"i": {i}}}'.encode(), headers=[("content-encoding", b"zstd")])
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def corrupt_tail(self, slot: int) -> None:
+        """Leave ``slot`` with a closed segment ending in a corrupt record, followed by an empty segment."""
+        outbox = Outbox(self.directory.name, slot=slot)
+        outbox.append(record(0))
+        outbox.close()
+        Outbox(self.directory.name, slot=slot).close()
+
+        segment = sorted(outbox.path.glob("*.log"))[0]
+        data = bytearray(segment.read_bytes())
+        data[-2] ^= 0xFF
+        segment.write_bytes(bytes(data))
+
+    def test_outbox__drain_in_order(self):
+        outbox = Outbox(self.directory.name, segment_bytes=256)
+        for i in range(10):
+            asyncio.run(outbox.put(record(i)))
+        producer = StubProducer()
+        drainer = OutboxDrainer(outbox, producer, batch_size=4)
+
+        producer.fail = True
+        with self.assertRaises(RuntimeError):
+            drainer.drain_once()
+        assert outbox.backlog() == 10
+        producer.fail = False
+        while drainer.drain_once():
+            pass
+        assert outbox.backlog() == 0
+
+        assert [value for _, value, _ in producer.sent] == [record(i).value for i in range(10)]
+        assert producer.sent[0][2] == [("content-encoding", b"zstd")]
+        assert len(list(outbox.path.glob("*.log"))) == 1
+        outbox.close()
+
+    def test_outbox__resume_after_restart(self):
+        outbox = Outbox(self.directory.name)
+        for i in range(3):
+            outbox.append(record(i))
+        producer = StubProducer()
+        OutboxDrainer(outbox, producer, batch_size=1).drain_once()
+        outbox.close()
+
+        # Simulate a crash in the middle of a write
+        segment = sorted(outbox.path.glob("*.log"))[-1]
+        with open(segment, "ab") as file:
+            file.write(b"\x00\x01torn")
+
+        outbox = Outbox(self.directory.name)
+        assert outbox.path == segment.parent
+        while OutboxDrainer(outbox, producer).drain_once():
+            pass
+
+        assert [value for _, value, _ in producer.sent] == [record(i).value for i in range(3)]
+        outbox.close()
+
+    def test_outbox__one_slot_per_process(self):
+        first = Outbox(self.directory.name)
+        second = Outbox(self.directory.name)
+
+        assert first.path != second.path
+        assert sorted(os.listdir(self.directory.name)) == ["slot-0", "slot-1"]
+        first.close()
+        second.close()
+
+    def test_outbox__unclaimed_slots_drained(self):
+        # Three processes, scaled down to one
+        outboxes = [Outbox(self.directory.name) for _ in range(3)]
+        for i, outbox in enumerate(outboxes):
+            outbox.append(record(i))
+        for outbox in outboxes[1:]:
+            outbox.close()
+        busy = Outbox(self.directory.name, slot=1)
+
+        producer = StubProducer()
+        drainer = OutboxDrainer(outboxes[0], producer)
+        assert drainer.drain_once() == 1
+        # Slot 1 is held by a running process, slot 2 is not
+        assert drainer.drain_orphans() == 1
+        assert drainer.drain_orphans() == 0
+        assert [value for _, value, _ in producer.sent] == [record(0).value, record(2).value]
+        busy.close()
+        outboxes[0].close()
+
+    def test_outbox__corrupt_record_skipped(self):
+        outbox = Outbox(self.directory.name)
+        for i in range(3):
+            outbox.append(record(i))
+        outbox.close()
+
+        segment = sorted(outbox.path.glob("*.log"))[-1]
+        data = bytearray(segment.read_bytes())
+        # Flip a byte of the value of the second record
+        data[2 * len(data) // 3 - 2] ^= 0xFF
+        segment.write_bytes(bytes(data))
+
+        outbox = Outbox(self.directory.name)
+        producer = StubProducer()
+        with self.assertLogs("uvicorn.error", "ERROR") as logs:
+            while OutboxDrainer(outbox, producer).drain_once():
+                pass
+
+        assert [value for _, value, _ in producer.sent] == [record(0).value, record(2).value]
+        assert "corrupt bytes" in logs.output[0]
+        outbox.close()
+
+    def test_outbox__corrupt_tail_committed(self):
+        self.corrupt_tail(0)
+        outbox = Outbox(self.directory.name)
+        drainer = OutboxDrainer(outbox, StubProducer())
+
+        with self.assertLogs("uvicorn.error", "ERROR") as logs:
+            assert drainer.drain_once() == 0
+        assert "unreadable bytes" in logs.output[0]
+        # Committed past the unreadable bytes, not read again on every poll
+        with self.assertNoLogs("uvicorn.error", "ERROR"):
+            assert drainer.drain_once() == 0
+        assert [path.name for path in outbox.path.glob("*.log")] == [f"{outbox._segment:016d}.log"]
+        outbox.close()
+
+    def test_outbox__corrupt_tail_in_unclaimed_slot(self):
+        outbox = Outbox(self.directory.name)
+        self.corrupt_tail(1)
+        orphan = outbox.path.parent / "slot-1"
+        drainer = OutboxDrainer(outbox, StubProducer())
+
+        with self.assertLogs("uvicorn.error", "ERROR"):
+            assert drainer.drain_orphans() == 0
+        assert not undelivered(orphan)
+        segments = sorted(orphan.glob("*.log"))
+        # Not opened again, no segment added
+        with self.assertNoLogs("uvicorn.error", "ERROR"):
+            assert drainer.drain_orphans() == 0
+        assert sorted(orphan.glob("*.log")) == segments
+        outbox.close()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+from producer import FileProducer, MemoryProducer, get_producer, read_messages
+from settings import ProducerSettings
+
+COMPRESSED = b"(\xb5/\xfd\x00\x00"
+
+
+class TestProducer(unittest.TestCase):
+    def test_memory_producer__ring_buffer(self):
+        producer = MemoryProducer(topic="esgf.test", capacity=3, timing_samples=2)
+        for i in range(4):
+            producer.success(key=f"item{i}", value=f'{{"i": {i}}}', headers=[("x-request-id", b"r")])
+        assert producer.success_batch([("item4", b"{}", None)]) == [None]
+
+        assert len(producer) == 3
+        assert producer.dropped == 2
+        assert [message.offset for message in producer.messages()] == [2, 3, 4]
+        assert producer.messages()[0].key == b"item2"
+        assert producer.messages()[0].headers == [("x-request-id", b"r")]
+        assert producer.messages(topic="other") == []
+        assert [timing.key for timing in producer.timings] == [b"item3", b"item4"]
+        assert all(timing.latency >= 0 for timing in producer.timings)
+
+        producer.clear()
+        assert len(producer) == 0
+
+    def test_file_producer__round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            producer = FileProducer(topic="esgf.test", directory=directory, segment_bytes=200)
+            producer.success(key="item0", value=b'{"i": 0}')
+            producer.success_batch([("item1", COMPRESSED, [("content-encoding", b"zstd")]), ("item2", b'{"i": 2}', None)])
+            producer.close()
+
+            messages = read_messages(directory)
+            assert [message.offset for message in messages] == [0, 1, 2]
+            assert messages[1].value == COMPRESSED
+            assert messages[1].headers == [("content-encoding", b"zstd")]
+            assert messages[2].key == b"item2"
+            assert len(producer.timings) == 3
+
+    def test_get_producer(self):
+        with tempfile.TemporaryDirectory() as directory:
+            assert isinstance(get_producer(ProducerSettings(backend="memory")), MemoryProducer)
+            assert isinstance(get_producer(ProducerSettings(backend="file", file_directory=directory)), FileProducer)
+            assert get_producer(ProducerSettings(backend="memory", topic="esgf.test")).queue_depth() == 0
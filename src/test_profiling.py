@@ -0,0 +1,57 @@
+import pstats
+import tempfile
+import unittest
+from unittest import mock
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import profiling
+from settings import ProfilingSettings, settings
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.object(
+            settings,
+            "profiling",
+            ProfilingSettings(enabled=True, token="secret", profiler="cprofile", directory=directory.name, max_profiles=2),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        app = FastAPI()
+
+        @app.post("/items")
+        async def create():
+            return {}
+
+        app.state.profile_store = profiling.ProfileStore(directory.name, max_profiles=2)
+        app.add_middleware(profiling.ProfilingMiddleware, store=app.state.profile_store)
+        app.include_router(profiling.router)
+        self.client = TestClient(app)
+
+    def test_profiling__token(self):
+        assert "X-Profile-Id" not in self.client.post("/items").headers
+        assert "X-Profile-Id" not in self.client.post("/items", headers={"X-Profile-Token": "wrong"}).headers
+
+        names = [
+            self.client.post("/items", headers={"X-Profile-Token": "secret", "X-Request-Id": f"request-{i}"}).headers["X-Profile-Id"]
+            for i in range(3)
+        ]
+        assert names[2].endswith("-request-2.pstats")
+
+        assert self.client.get("/admin/profiles").status_code == 403
+        profiles = self.client.get("/admin/profiles", headers={"X-Profile-Token": "secret"}).json()["profiles"]
+        assert len(profiles) == 2
+
+        response = self.client.get(f"/admin/profiles/{names[2]}", headers={"X-Profile-Token": "secret"})
+        assert response.status_code == 200
+        with tempfile.NamedTemporaryFile() as file:
+            file.write(response.content)
+            file.flush()
+            assert pstats.Stats(file.name).total_calls > 0
+
+        assert self.client.get("/admin/profiles/..%2Fsecret", headers={"X-Profile-Token": "secret"}).status_code == 404
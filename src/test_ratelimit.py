@@ -0,0 +1,106 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from esgf_core_utils.models.kafka.events import Auth, RequesterData
+
+from ratelimit import FairScheduler, MemoryBackend, RateLimiter, RateLimitExceededException, SQLiteBackend, refill
+from settings import RateLimitRule, RateLimitSettings
+
+
+def auth(sub: str) -> Auth:
+    return Auth(requester_data=RequesterData(client_id="client", sub=sub, iss="issuer"))
+
+
+class TestRateLimit(unittest.TestCase):
+    def test_rate_limit__refill(self):
+        assert refill(0.0, 0.0, rate=2.0, burst=10.0, now=1.0, cost=1.0) == (1.0, 0.0)
+        assert refill(0.0, 0.0, rate=2.0, burst=10.0, now=100.0, cost=1.0) == (9.0, 0.0)
+        assert refill(0.0, 0.0, rate=2.0, burst=10.0, now=0.0, cost=1.0) == (0.0, 0.5)
+
+    def test_rate_limit__per_requester_and_collection(self):
+        rate_limit = RateLimitSettings(enabled=True, rate=0.001, burst=2, collections={"CMIP7": RateLimitRule(rate=0.001, burst=1)})
+        limiter = RateLimiter(rate_limit, MemoryBackend())
+
+        asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP6", instance=""))
+        asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP6", instance=""))
+        with self.assertRaises(RateLimitExceededException) as context:
+            asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP6", instance=""))
+        assert int(context.exception.headers["Retry-After"]) > 0
+
+        asyncio.run(limiter.check(auth("interactive"), collection_id="CMIP6", instance=""))
+        asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP7", instance=""))
+        with self.assertRaises(RateLimitExceededException):
+            asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP7", instance=""))
+
+    def test_rate_limit__memory_pruned(self):
+        backend = MemoryBackend(max_entries=4)
+        for key in ("a", "b", "c"):
+            backend.take(key, rate=0.001, burst=2)
+        # A collection override with a larger burst, partly drained
+        waits = [backend.take("CMIP7:bulk", rate=0.001, burst=100) for _ in range(50)]
+        backend.take("d", rate=0.001, burst=2)
+
+        # Pruned with the rate and burst of each bucket, the least recently used first
+        assert list(backend._buckets) == ["c", "CMIP7:bulk", "d"]
+        waits += [backend.take("CMIP7:bulk", rate=0.001, burst=100) for _ in range(51)]
+        assert waits[:100] == [0.0] * 100
+        assert waits[100] > 0
+
+    def test_rate_limit__sqlite_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "buckets.sqlite")
+            workers = [SQLiteBackend(path), SQLiteBackend(path)]
+            waits = [workers[i % 2].take("sub", rate=0.001, burst=3) for i in range(4)]
+
+        assert waits[:3] == [0.0, 0.0, 0.0]
+        assert waits[3] > 0
+
+    def test_rate_limit__sqlite_off_the_event_loop(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "buckets.sqlite")
+            limiter = RateLimiter(RateLimitSettings(enabled=True, backend="sqlite", rate=0.001, burst=2), SQLiteBackend(path))
+            asyncio.run(limiter.check(auth("bulk"), collection_id="CMIP6", instance=""))
+            # Another worker holds the write lock of the database
+            holder = sqlite3.connect(path, isolation_level=None)
+            holder.execute("BEGIN IMMEDIATE")
+
+            async def main():
+                check = asyncio.create_task(limiter.check(auth("bulk"), collection_id="CMIP6", instance=""))
+                ticks = 0
+                while not check.done() and ticks < 10:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+                # The event loop kept running while the check waited for the lock
+                assert ticks == 10
+                holder.execute("COMMIT")
+                await check
+
+            asyncio.run(main())
+            holder.close()
+
+    def test_rate_limit__fair_scheduler(self):
+        order = []
+        release = threading.Event()
+
+        def work(name):
+            if name == "first":
+                release.wait(5)
+            order.append(name)
+
+        async def main():
+            scheduler = FairScheduler(workers=1)
+            first = asyncio.create_task(scheduler.run("bulk", 1000, work, "first"))
+            await asyncio.sleep(0.01)
+            tasks = [asyncio.create_task(scheduler.run("bulk", 1000, work, f"bulk{i}")) for i in range(3)]
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(scheduler.run("interactive", 100, work, "retraction")))
+            await asyncio.sleep(0.01)
+            release.set()
+            await asyncio.gather(first, *tasks)
+
+        asyncio.run(main())
+        assert order == ["first", "retraction", "bulk0", "bulk1", "bulk2"]
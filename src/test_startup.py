@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from startup import Startup, StartupMiddleware
+
+
+class TestStartup(unittest.TestCase):
+    def test_startup__concurrent_steps(self):
+        barrier = threading.Barrier(2, timeout=5)
+        startup = Startup([barrier.wait, barrier.wait])
+
+        # Both steps must run at the same time to pass the barrier
+        asyncio.run(startup.wait())
+        assert startup.start() is startup.future
+        assert not startup.failed
+
+    def test_startup__failed(self):
+        def fail():
+            raise RuntimeError("Access Control Policy could not be loaded")
+
+        startup = Startup([fail])
+        app = FastAPI()
+
+        @app.get("/healthcheck")
+        async def healthcheck():
+            return {"healthcheck": not startup.failed}
+
+        @app.post("/items")
+        async def create():
+            return {}
+
+        app.add_middleware(StartupMiddleware, startup=startup)
+        client = TestClient(app)
+
+        response = client.post("/items", headers={"X-Request-Id": "request"})
+        assert response.status_code == 503
+        assert response.json()["instance"] == "request"
+        assert startup.failed
+        assert client.get("/healthcheck").json() == {"healthcheck": False}
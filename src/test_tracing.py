@@ -0,0 +1,44 @@
+import unittest
+
+import tracing
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+except ImportError:
+    TracerProvider = None
+
+exporter = None
+if TracerProvider is not None:
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+
+
+@unittest.skipUnless(TracerProvider, "opentelemetry-sdk not installed")
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        exporter.clear()
+
+    def test_tracing__continues_incoming_trace(self):
+        traceparent = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+
+        with tracing.server_span("GlobusAuthorizer.dispatch", {"traceparent": traceparent}):
+            with tracing.span("authorize", collection_id="CMIP6"):
+                pass
+
+        authorize, dispatch = exporter.get_finished_spans()
+        assert format(dispatch.context.trace_id, "032x") == "0af7651916cd43dd8448eb211c80319c"
+        assert authorize.parent.span_id == dispatch.context.span_id
+        assert authorize.attributes["collection_id"] == "CMIP6"
+
+    def test_tracing__message_headers(self):
+        with tracing.span("kafka.produce") as current:
+            headers = dict(tracing.message_headers("request"))
+
+        assert headers["x-request-id"] == b"request"
+        trace_id = format(current.get_span_context().trace_id, "032x")
+        assert headers["traceparent"].decode().split("-")[1] == trace_id
@@ -0,0 +1,108 @@
+import copy
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from esgf_core_utils.models.exceptions import STACValidationException
+from stac_pydantic.item import Item
+
+import utils
+from settings import settings
+from validation import ValidationError, prevalidate_patch, prevalidate_post
+
+SCHEMA_DIRECTORY = str(Path(__file__).parent.parent / "benchmarks" / "schemas")
+ITEM_ID = "CMIP6.AerChemMIP.EC-Earth-Consortium.EC-Earth3-AerChem.hist-piAer.r1i1p1f1.AERday.maxpblz.gn.v20201006"
+ITEM = {
+    "type": "Feature",
+    "stac_version": "1.0.0",
+    "stac_extensions": [
+        "https://esgf.github.io/stac-transaction-api/cmip6/v3.0.4/schema.json",
+        "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+    ],
+    "id": ITEM_ID,
+    "collection": "CMIP6",
+    "geometry": {"type": "Polygon", "coordinates": [[[-180.0, -90.0], [180.0, -90.0], [180.0, 90.0], [-180.0, 90.0], [-180.0, -90.0]]]},
+    "bbox": [-180.0, -90.0, 180.0, 90.0],
+    "properties": {
+        "datetime": None,
+        "start_datetime": "1850-01-01T12:00:00Z",
+        "end_datetime": "2014-12-31T12:00:00Z",
+        "project": "CMIP6",
+        "cmip6:mip_era": "CMIP6",
+        "cmip6:version": "v20201006",
+        "cmip6:activity_id": ["AerChemMIP"],
+        "cmip6:experiment_id": "hist-piAer",
+        "cmip6:frequency": "day",
+        "cmip6:grid_label": "gn",
+        "cmip6:institution_id": "EC-Earth-Consortium",
+        "cmip6:nominal_resolution": "250 km",
+        "cmip6:product": "model-output",
+        "cmip6:realm": ["aerosol"],
+        "cmip6:source_id": "EC-Earth3-AerChem",
+        "cmip6:source_type": ["AOGCM", "AER", "CHEM"],
+        "cmip6:sub_experiment_id": "none",
+        "cmip6:table_id": "AERday",
+        "cmip6:variable_id": "maxpblz",
+        "cmip6:variant_label": "r1i1p1f1",
+    },
+    "links": [],
+    "assets": {
+        "data0000": {
+            "href": "https://esgf.example.org/maxpblz_AERday_EC-Earth3-AerChem_hist-piAer_r1i1p1f1_gn_18500101-18501231.nc",
+            "description": "HTTPServer Link",
+            "type": "application/netcdf",
+            "roles": ["data"],
+            "alternate:name": "esgf.example.org",
+            "file:size": 1000000,
+            "file:checksum": "1220" + "0" * 64,
+        }
+    },
+}
+
+
+def invalid_item() -> dict:
+    item = copy.deepcopy(ITEM)
+    item["properties"]["cmip6:frequency"] = 5.4
+    return item
+
+
+class TestPrevalidation(unittest.TestCase):
+    def test_import__without_settings(self):
+        env = {k: v for k, v in os.environ.items() if not k.startswith("TRANSACTION_")}
+        code = "import sys; sys.modules['settings'] = None; import validation"
+        subprocess.run([sys.executable, "-c", code], cwd=Path(__file__).parent, env=env, check=True)
+
+    def test_prevalidate_post__valid(self):
+        item = prevalidate_post(ITEM, schema_directory=SCHEMA_DIRECTORY)
+        assert isinstance(item, Item)
+        assert item.id == ITEM_ID
+
+    def test_prevalidate_post__wrong_type(self):
+        with self.assertRaises(ValidationError) as ctx:
+            prevalidate_post(invalid_item(), schema_directory=SCHEMA_DIRECTORY)
+        assert ctx.exception.item_id == ITEM_ID
+        assert "/properties/cmip6:frequency" in ctx.exception.errors[0]
+
+    def test_prevalidate_post__unexpected_extension(self):
+        item = copy.deepcopy(ITEM)
+        item["stac_extensions"].append("https://example.org/v1.0.0/schema.json")
+        with self.assertRaises(ValidationError):
+            prevalidate_post(item, schema_directory=SCHEMA_DIRECTORY)
+
+    def test_prevalidate_patch(self):
+        retraction = [{"op": "add", "path": "/properties/retracted", "value": True}]
+        assert prevalidate_patch("CMIP6", ITEM_ID, retraction, SCHEMA_DIRECTORY).properties == {"retracted": True}
+        with self.assertRaises(ValidationError):
+            prevalidate_patch("CMIP6", ITEM_ID, [{"op": "move", "from": "/properties/a", "path": "/properties/b"}], SCHEMA_DIRECTORY)
+
+    def test_server__same_decision(self):
+        with mock.patch.object(settings, "schema_directory", SCHEMA_DIRECTORY):
+            item = Item.model_validate(ITEM)
+            utils.validate_post(item_id=item.id, item=item, extensions=list(ITEM["stac_extensions"]))
+            item = Item.model_validate(invalid_item())
+            with self.assertRaises(STACValidationException):
+                utils.validate_post(item_id=item.id, item=item, extensions=list(ITEM["stac_extensions"]))
@@ -0,0 +1,49 @@
+import gc
+import os
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import warmup
+from client import TransactionClient
+from settings import DEFAULT_EXTENSIONS, settings
+from startup import Startup
+from validation import get_extension_validator
+
+SCHEMA_DIRECTORY = str(Path(__file__).parent.parent / "benchmarks" / "schemas")
+
+
+class TestWarmup(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(settings, "schema_directory", SCHEMA_DIRECTORY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        get_extension_validator.cache_clear()
+        self.addCleanup(get_extension_validator.cache_clear)
+
+    def test_warm_up__compiles_validators(self):
+        client = TransactionClient()
+        timings = warmup.warm_up(client, ["CMIP6"])
+
+        assert list(timings) == ["CMIP6"]
+        assert get_extension_validator.cache_info().currsize == len(DEFAULT_EXTENSIONS["CMIP6"])
+        assert warmup.warmed_up
+        # Nothing is published, the Kafka client is not even created
+        assert client.producer._producer is None
+        assert client.outbox is None
+
+    def test_warm_up__failure_skips_collection(self):
+        with mock.patch.object(settings, "schema_directory", None), mock.patch("httpx.get", side_effect=OSError("offline")):
+            assert warmup.warm_up(TransactionClient(), ["CMIP7"]) == {}
+
+    def test_preload__freezes_master(self):
+        self.addCleanup(gc.unfreeze)
+        with mock.patch.object(warmup, "startup", Startup([lambda: None])), mock.patch.object(settings.warmup, "collections", ["CMIP6"]):
+            warmup.preload(TransactionClient())
+        assert gc.get_freeze_count() > 0
+
+        pid = os.fork()
+        if pid == 0:
+            # The worker inherits the compiled validators
+            os._exit(0 if get_extension_validator.cache_info().currsize else 1)
+        assert os.waitpid(pid, 0)[1] == 0
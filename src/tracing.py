@@ -0,0 +1,98 @@
+import logging
+from contextlib import contextmanager
+
+from settings import TracingSettings, settings
+
+try:
+    from opentelemetry import propagate, trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+OpenTelemetry tracing
+    Spans:
+        <Authorizer>.dispatch   server span of the request, continuing an incoming traceparent
+        globus.introspect, globus.get_groups, egi.introspect
+        authorize, validate_extensions, validate_post, validate_patch
+        kafka.produce or outbox.append
+    Kafka messages carry x-request-id and traceparent headers, so consumers can continue the trace.
+    Spans are no-ops unless opentelemetry-api is installed and a tracer provider is configured,
+    either by TRANSACTION_TRACING__EXPORTER or by the OpenTelemetry auto-instrumentation.
+"""
+
+REQUEST_ID_HEADER = "x-request-id"
+TRACER_NAME = "stac-transaction-api"
+
+
+def configure(tracing: TracingSettings) -> None:
+    """Install a tracer provider exporting spans as set in the settings.
+
+    Args:
+        tracing (TracingSettings): tracing settings
+    """
+    if trace is None or tracing.exporter == "none":
+        return
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if tracing.exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        exporter = OTLPSpanExporter()
+    elif tracing.exporter == "file":
+        exporter = ConsoleSpanExporter(out=open(tracing.file_path, "a"), formatter=lambda span: span.to_json(indent=None) + "\n")
+    else:
+        exporter = ConsoleSpanExporter()
+
+    provider = TracerProvider(resource=Resource.create({"service.name": tracing.service_name}))
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    logger.info("Tracing spans exported to %s", tracing.exporter)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Run a block in a child span of the current one."""
+    if trace is None:
+        yield None
+        return
+    with trace.get_tracer(TRACER_NAME).start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+@contextmanager
+def server_span(name: str, headers, **attributes):
+    """Run a request in a server span, continuing the trace of its traceparent header."""
+    if trace is None:
+        yield None
+        return
+    context = propagate.extract(headers)
+    with trace.get_tracer(TRACER_NAME).start_as_current_span(
+        name, context=context, kind=trace.SpanKind.SERVER, attributes=attributes
+    ) as current:
+        yield current
+
+
+def message_headers(request_id: str) -> list[tuple[str, bytes]]:
+    """Kafka headers continuing the current trace.
+
+    Args:
+        request_id (str): request id of the event
+
+    Returns:
+        list[tuple[str, bytes]]: x-request-id and, when tracing, traceparent/tracestate headers
+    """
+    headers = [(REQUEST_ID_HEADER, request_id.encode())]
+    if trace is not None:
+        carrier: dict[str, str] = {}
+        propagate.inject(carrier)
+        headers.extend((key, value.encode()) for key, value in carrier.items())
+    return headers
+
+
+configure(settings.tracing)
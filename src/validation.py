@@ -0,0 +1,614 @@
+import json
+import logging
+import re
+from contextlib import nullcontext
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+from urllib.parse import urlparse
+
+from esgf_core_utils.models.exceptions import (
+    ExpectedExtensionsMissingException,
+    ExtensionBelowMinimumException,
+    OperationNotPermittedException,
+    STACValidationException,
+    UnexpectedExtensionException,
+)
+from packaging.version import Version
+from stac_fastapi.extensions.transaction.request import (
+    PartialItem,
+    PatchAddReplaceTest,
+    PatchOperation,
+)
+from stac_pydantic.item import Item
+
+if TYPE_CHECKING:
+    from jsonschema.protocols import Validator
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Item validation
+    The validation of the API, importable without its settings, codec or metrics: publishers run
+    the same checks, against the same extension schemas, before sending an item.
+
+        from validation import prevalidate_post, ValidationError
+        prevalidate_post(item, schema_directory="benchmarks/schemas")
+
+    Schemas are read from `schema_directory` (<host>/<path> of the extension URI) if bundled there,
+    fetched otherwise. utils.py re-exports these functions for the API, with TRANSACTION_SCHEMA_DIRECTORY
+    and its Prometheus stage metrics.
+"""
+
+DEFAULT_EXTENSIONS = {
+    "CMIP6": {
+        "CMIP6": {
+            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip6\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://esgf.github.io/stac-transaction-api/cmip6/v3.0.4/schema.json",
+        },
+        "alternate_assets": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        },
+        "file": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        },
+    },
+    "CMIP6Plus": {
+        "CMIP6Plus": {
+            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip6plus\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://esgf.github.io/stac-transaction-api/cmip6plus/v1.0.4/schema.json",
+        },
+        "alternate_assets": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        },
+        "file": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        },
+    },
+    "CMIP7": {
+        "CMIP7": {
+            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cmip7\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://esgf.github.io/stac-transaction-api/cmip7/v1.0.0/schema.json",
+        },
+        "alternate_assets": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        },
+        "file": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        },
+    },
+    "CORDEX-CMIP6": {
+        "CORDEX-CMIP6": {
+            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/cordex-cmip6\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://esgf.github.io/stac-transaction-api/cordex-cmip6/v3.1.2/schema.json",
+        },
+        "alternate_assets": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        },
+        "file": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        },
+    },
+    "obs4MIPs": {
+        "obs4MIPs": {
+            "regex": [r"https:\/\/esgf\.github\.io\/stac-transaction-api\/obs4mips\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://esgf.github.io/stac-transaction-api/obs4mips/v1.0.0/schema.json",
+        },
+        "alternate_assets": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/alternate-assets\/v[0-9]\.[0-9]\.[0-9]\/schema\.json"],
+            "default": "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+        },
+        "file": {
+            "regex": [r"https:\/\/stac-extensions\.github\.io\/file\/v[0-9]\.[0-9]\.[0-9]/schema\.json"],
+            "default": "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        },
+    },
+}
+
+VERSION_REGEX = re.compile(
+    r"/v("
+    r"(?P<major>0|[1-9]\d*)\."
+    r"(?P<minor>0|[1-9]\d*)\."
+    r"(?P<patch>0|[1-9]\d*)"
+    r"(?:-[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?"
+    r"(?:\+[0-9A-Za-z-]+(?:\.[0-9A-Za-z-]+)*)?"
+    r")/"
+)
+
+REJECTED = (
+    ExpectedExtensionsMissingException,
+    ExtensionBelowMinimumException,
+    OperationNotPermittedException,
+    STACValidationException,
+    UnexpectedExtensionException,
+)
+
+# Stage timers, set by the API to its metrics (see instrument)
+_timers = None
+
+
+class ValidationError(Exception):
+    """An item rejected by the validation of the API.
+
+    Attributes:
+        item_id (str): ID of the item
+        errors (list[str]): reasons, as the API would give them, then the schema errors if any
+    """
+
+    def __init__(self, item_id: str, errors: list[str]) -> None:
+        super().__init__(f"{item_id}: {'; '.join(errors)}")
+        self.item_id = item_id
+        self.errors = errors
+
+
+def instrument(timers) -> None:
+    """Time the validation stages with ``timers.stage(name)`` and ``timers.schema_validation(extension)``.
+
+    Args:
+        timers: context manager factories, e.g. the metrics module
+    """
+    global _timers
+    _timers = timers
+
+
+def _stage(name: str):
+    return _timers.stage(name) if _timers else nullcontext()
+
+
+def _schema_validation(extension: str):
+    return _timers.schema_validation(extension) if _timers else nullcontext()
+
+
+def operation_to_partial_item(collection_id: str, operations: list[PatchOperation]) -> PartialItem:
+    """Convert operations to partial item
+
+    Args:
+        collection_id (str): ID of Item's Collection.
+        operations (list[PatchOperation]): List of operations to be converted to PartialItem
+
+    Raises:
+        OperationNotPermittedException: Move & Copy operatations not permitted
+
+    Returns:
+        PartialItem: Partial item equivalent to operations
+    """
+    item = {}
+
+    for operation in operations:
+
+        if operation.op == "remove":
+            operation = PatchAddReplaceTest(op="add", path=operation.path, value=None)
+
+        if operation.op in ["add", "replace"]:
+            if operation.path.lstrip("/") == "stac_extensions":
+                validate_extensions(
+                    collection_id=collection_id,
+                    item_extensions=operation.value,
+                    strict=True,
+                )
+
+            path_parts = operation.path.lstrip("/").split("/")
+
+            if isinstance(path_parts[-1], int):
+                path_parts.remove(-1)
+                nest = [operation.value]
+
+            else:
+                nest = operation.value
+
+            if isinstance(nest, list):
+                existing = item.copy()
+                for path_part in path_parts:
+                    existing = existing.get(path_part, {})
+
+                if existing:
+                    nest.extend(existing)
+
+            for path_part in reversed(path_parts):
+                nest = {path_part: nest}
+
+            item |= nest
+
+        if operation.op in ["move", "copy"]:
+            # May need to update this for alternat asset updates
+            raise OperationNotPermittedException(op=operation.op)
+
+    return PartialItem.model_validate(item)
+
+
+def validate_extension_version(minimum: str, extension: str) -> None:
+    """Validate an extenions version is above the minimum.
+
+    Args:
+        default (str): default extension with minimum version.
+        extension (str): extension to be validated.
+
+    Raises:
+        ExtensionBelowMinimumException: extension below minimum
+    """
+
+    minimum_version = VERSION_REGEX.search(minimum).group(1)
+    extension_version = VERSION_REGEX.search(extension).group(1)
+
+    if Version(extension_version) < Version(minimum_version):
+        raise ExtensionBelowMinimumException(extension=extension, minimum_version=f"v{minimum_version}")
+
+
+def validate_extensions(collection_id: str, item_extensions: list[str], strict: bool = False) -> list[str]:
+    """Validate expected default extensions are present.
+
+    Args:
+        collection_id (str): ID of Item's Collection.
+        item_extensions (list[str]): Given list of extensions.
+        strict (bool): if True Exception is raised if expected extensions are missing.
+
+    Raises:
+        UnexpectedExtensionException: Unexpected extensions
+        ExpectedExtensionsMissingException: Expected extension missing
+
+    Returns:
+        list[str]: list of extensions including defaults
+    """
+
+    expected_extensions = DEFAULT_EXTENSIONS.get(collection_id, {}).copy()
+
+    for item_extension in item_extensions:
+        expected = False
+        for (
+            expected_extension_key,
+            expected_extension,
+        ) in expected_extensions.copy().items():
+            if any(re.compile(regex).match(str(item_extension)) for regex in expected_extension["regex"]):
+                expected_extensions.pop(expected_extension_key)
+                expected = True
+
+                validate_extension_version(minimum=expected_extension["default"], extension=str(item_extension))
+
+        if not expected:
+            raise UnexpectedExtensionException(extension=item_extension)
+
+    missing_extensions = [expected_extension["default"] for expected_extension in expected_extensions.values()]
+
+    if strict & len(missing_extensions) > 0:
+        raise ExpectedExtensionsMissingException(extensions=missing_extensions)
+
+    item_extensions.extend(missing_extensions)
+
+    return item_extensions
+
+
+def get_null_keys(item: PartialItem) -> tuple[PartialItem, set[str]]:
+    """Remove and list null value keys from PatialItem.
+
+    Args:
+        item (dict): Item dictionary to be updated
+
+    Returns:
+        tuple[dict, list[str]]: The PartialItem with nulls removed and list of null keys
+    """
+
+    def nested_null_keys(d: dict) -> tuple[dict, set[str]]:
+        null_keys = set()
+        for k, v in list(d.items()):
+
+            if v is None:
+                del d[k]
+                null_keys.add(k)
+
+            if isinstance(v, dict):
+                sub_dict, sub_null_keys = nested_null_keys(v)
+                null_keys.update(sub_null_keys)
+                d[k] = sub_dict
+
+        return d, null_keys
+
+    item_dict, null_keys = nested_null_keys(item.model_dump())
+    item = PartialItem.model_validate(item_dict)
+
+    return item, null_keys
+
+
+def load_extension_schema(extension: str, schema_directory: str | None = None) -> dict:
+    """Load the JSON schema of an extension, from ``schema_directory`` if bundled there.
+
+    Bundled schemas are looked up as <schema_directory>/<host>/<path>, e.g.
+    <schema_directory>/stac-extensions.github.io/file/v2.1.0/schema.json
+
+    Args:
+        extension (str): Extension URI
+        schema_directory (str | None): directory of bundled schemas
+
+    Returns:
+        dict: JSON schema
+    """
+    if schema_directory:
+        url = urlparse(extension)
+        path = Path(schema_directory, url.netloc, url.path.lstrip("/"))
+        if path.is_file():
+            return json.loads(path.read_bytes())
+
+    import httpx
+
+    return httpx.get(extension).json()
+
+
+@lru_cache(maxsize=128)
+def get_extension_validator(extension: str, schema_directory: str | None = None) -> "Validator":
+    """Get JSON schema validator for an extension.
+
+    Extension URIs are versioned, so validators are cached for the life of the process.
+
+    Args:
+        extension (str): Extension URI
+        schema_directory (str | None): directory of bundled schemas
+
+    Returns:
+        Validator: Validator for extension
+    """
+    import jsonschema
+
+    schema = load_extension_schema(extension, schema_directory)
+    # This block is cribbed (w/ change in error handling) from
+    # jsonschema.validate
+    cls = jsonschema.validators.validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def validate_bbox(bbox: list[int | float]) -> None:
+    """Validate bounding box is WGS84
+
+    Args:
+        bbox (int | float): bounding box to be validated
+
+    Raises:
+        STACValidationException: _description_
+    """
+    minx, miny, maxx, maxy = bbox[:4]
+    if not (-180.0 <= minx <= 180.0 and -180.0 <= maxx <= 180.0 and -90.0 <= miny <= 90.0 and -90.0 <= maxy <= 90.0):
+        raise STACValidationException()
+
+
+def validate_geometry(geometry: dict) -> None:
+    """Validate GeoJSON geometry
+
+    Args:
+        geometry (dict): geometry to be validation.
+
+    Raises:
+        STACValidationException: Validation error
+    """
+    from shapely.geometry import shape
+
+    geometry_shape = shape(geometry)
+    if not geometry_shape.is_valid:
+        raise STACValidationException()
+
+    # Check geometry is WGS84
+    validate_bbox(geometry_shape.bounds)
+
+
+def patch_schema_errors(item: PartialItem, extensions: list[str], schema_directory: str | None = None) -> Iterator[tuple[str, list]]:
+    """Schema errors of a patch, per extension, ignoring missing required properties unless removed.
+
+    Args:
+        item (PartialItem): Partial Item to be validated
+        extensions (list[str]): List of STAC extensions to be validated against
+        schema_directory (str | None): directory of bundled schemas
+
+    Yields:
+        tuple[str, list]: extension, and its errors if any
+    """
+    item, null_keys = get_null_keys(item)
+    instance = item.model_dump(mode="json")
+
+    for extension in extensions:
+        extension_validator = get_extension_validator(str(extension), schema_directory)
+
+        required_keys = set()
+        raise_errors = []
+        with _schema_validation(str(extension)):
+            for error in extension_validator.iter_errors(instance):
+
+                if error.validator in ["oneOf"]:
+                    continue
+
+                elif error.validator == "required":
+                    required_keys.add(json.dumps(error.validator_value))
+
+                else:
+                    raise_errors.append(error)
+
+        for null_key_error in required_keys & null_keys:
+            raise_errors.append(f"Variable {null_key_error} is required and cannot be removed")
+
+        yield str(extension), raise_errors
+
+
+def post_schema_errors(item: Item, extensions: list[str], schema_directory: str | None = None) -> Iterator[tuple[str, list]]:
+    """Schema errors of an item, per extension.
+
+    Args:
+        item (Item): Item to be validated
+        extensions (list[str]): List of STAC extensions to be validated against
+        schema_directory (str | None): directory of bundled schemas
+
+    Yields:
+        tuple[str, list]: extension, and its errors if any
+    """
+    instance = item.model_dump(mode="json")
+
+    for extension in extensions:
+        extension_validator = get_extension_validator(str(extension), schema_directory)
+
+        with _schema_validation(str(extension)):
+            raise_errors = list(extension_validator.iter_errors(instance))
+
+        yield str(extension), raise_errors
+
+
+def validate_patch(
+    item_id: str,
+    item: PartialItem,
+    extensions: list[str],
+    schema_directory: str | None = None,
+) -> None:
+    """Validate a PartialItem patch request
+
+    Args:
+        item_id (str): ID of the item to validate
+        item (PartialItem): Partial Item to be validated to validate
+        extensions (list[str]): List of STAC extensions to be validated against
+        schema_directory (str | None): directory of bundled schemas
+
+    Raises:
+        STACValidationException: Validation error
+        UnexpectedExtensionException: Unexpect exception with validation
+    """
+    with _stage("geometry"):
+        if item.geometry:
+            validate_geometry(item.geometry)
+
+        if item.bbox:
+            validate_bbox(item.bbox)
+
+    for _, raise_errors in patch_schema_errors(item, extensions, schema_directory):
+        if raise_errors:
+            logger.error("STAC validation error: %s", item_id)
+
+            raise STACValidationException()
+
+
+def validate_post(
+    item_id: str,
+    item: Item,
+    extensions: list[str],
+    schema_directory: str | None = None,
+) -> None:
+    """Validate a Item post request
+
+    Args:
+        item_id (str): ID of the item to validate
+        item (Item): Partial Item to be validated to validate
+        extensions (list[str]): List of STAC extensions to be validated against
+        schema_directory (str | None): directory of bundled schemas
+
+    Raises:
+        STACValidationException: Validation error
+    """
+    with _stage("geometry"):
+        validate_geometry(item.geometry)
+        validate_bbox(item.bbox)
+
+    for _, raise_errors in post_schema_errors(item, extensions, schema_directory):
+        if raise_errors:
+            logger.error("STAC validation error: %s", item_id)
+
+            raise STACValidationException()
+
+
+def _rejected(item_id: str, exc: Exception) -> ValidationError:
+    detail = getattr(exc, "detail", None) or ""
+    return ValidationError(item_id, [f"{getattr(exc, 'title', type(exc).__name__)}: {detail}".rstrip(": ")])
+
+
+def _schema_rejected(item_id: str, schema_errors: Iterator[tuple[str, list]]) -> ValidationError | None:
+    errors = []
+    for extension, raise_errors in schema_errors:
+        for error in raise_errors:
+            if isinstance(error, str):
+                errors.append(f"{extension}: {error}")
+            else:
+                errors.append(f"{extension}: /{'/'.join(map(str, error.absolute_path))}: {error.message}")
+    return ValidationError(item_id, errors) if errors else None
+
+
+def prevalidate_post(item: dict | Item, collection_id: str | None = None, schema_directory: str | None = None) -> Item:
+    """Validate an item as the API does for ``POST /collections/{collection_id}/items``.
+
+    Args:
+        item (dict | Item): the item
+        collection_id (str | None): collection of the request, the item's by default
+        schema_directory (str | None): directory of bundled schemas
+
+    Raises:
+        ValidationError: the API would answer 400 (or 422 for an item that is not a STAC item)
+
+    Returns:
+        Item: the item, as parsed by the API
+    """
+    import pydantic
+
+    item_id = item.get("id", "") if isinstance(item, dict) else item.id
+    try:
+        model = item if isinstance(item, Item) else Item.model_validate(item)
+    except pydantic.ValidationError as exc:
+        raise ValidationError(item_id, [f"/{'/'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()]) from exc
+
+    collection_id = collection_id or model.collection
+    try:
+        extensions = validate_extensions(collection_id=collection_id, item_extensions=list(model.stac_extensions or []))
+        with _stage("geometry"):
+            validate_geometry(model.geometry)
+            validate_bbox(model.bbox)
+    except REJECTED as exc:
+        raise _rejected(model.id, exc) from exc
+
+    rejected = _schema_rejected(model.id, post_schema_errors(model, extensions, schema_directory))
+    if rejected:
+        raise rejected
+    return model
+
+
+def prevalidate_patch(
+    collection_id: str,
+    item_id: str,
+    patch: list[dict] | dict,
+    schema_directory: str | None = None,
+) -> PartialItem:
+    """Validate a patch as the API does for ``PATCH /collections/{collection_id}/items/{item_id}``.
+
+    Args:
+        collection_id (str): collection of the item
+        item_id (str): ID of the item
+        patch (list[dict] | dict): JSON Patch operations, or a JSON Merge Patch
+        schema_directory (str | None): directory of bundled schemas
+
+    Raises:
+        ValidationError: the API would answer 400 (or 422 for a malformed patch)
+
+    Returns:
+        PartialItem: the partial item the patch amounts to
+    """
+    import pydantic
+
+    try:
+        if isinstance(patch, list):
+            operations = pydantic.TypeAdapter(list[PatchOperation]).validate_python(patch)
+            item = operation_to_partial_item(collection_id=collection_id, operations=operations)
+        else:
+            item = PartialItem.model_validate(patch)
+        extensions = validate_extensions(collection_id=collection_id, item_extensions=list(item.stac_extensions or []))
+        with _stage("geometry"):
+            if item.geometry:
+                validate_geometry(item.geometry)
+            if item.bbox:
+                validate_bbox(item.bbox)
+    except pydantic.ValidationError as exc:
+        raise ValidationError(item_id, [f"/{'/'.join(map(str, error['loc']))}: {error['msg']}" for error in exc.errors()]) from exc
+    except REJECTED as exc:
+        raise _rejected(item_id, exc) from exc
+
+    rejected = _schema_rejected(item_id, patch_schema_errors(item, extensions, schema_directory))
+    if rejected:
+        raise rejected
+    return item
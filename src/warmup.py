@@ -0,0 +1,148 @@
+import gc
+import logging
+import time
+from datetime import datetime
+
+from esgf_core_utils.models.kafka.events import (
+    Auth,
+    CreatePayload,
+    Data,
+    KafkaEvent,
+    Metadata,
+    PatchPayload,
+    Publisher,
+    RequesterData,
+)
+from stac_pydantic.item import Item
+
+from client import TransactionClient, patch_adapter
+from codec import codec
+from settings import DEFAULT_EXTENSIONS, settings
+from startup import startup
+from utils import get_extension_validator, operation_to_partial_item, validate_patch, validate_post
+from validation import REJECTED
+
+# Setup logger
+logger = logging.getLogger("uvicorn.error")
+
+"""
+Warm-up
+    The first request of a process used to pay for fetching and compiling the extension schemas,
+    and for the first use of the models, codec and compressor. With TRANSACTION_WARMUP__ENABLED,
+    a synthetic item of each collection (TRANSACTION_WARMUP__COLLECTIONS, all by default) is run
+    through the create and patch pipeline before the worker accepts traffic: validators, access
+    control policy lookup, event encoding and compression. Nothing is published.
+
+    Preloading (gunicorn.conf.py): the master runs the startup steps and the warm-up once, freezes
+    the objects it holds out of the garbage collector, then forks. The workers share the compiled
+    validators and the policy copy-on-write, and skip both steps. The Kafka producer, outbox and
+    SQLite rate limiter are opened by each worker, after the fork.
+"""
+
+WARMUP_ITEM_ID = "warmup"
+RETRACTION = [{"op": "add", "path": "/properties/retracted", "value": True}]
+
+warmed_up = False
+
+
+def synthetic_item(collection_id: str) -> Item:
+    """Item of a collection, with its default extensions.
+
+    Args:
+        collection_id (str): ID of the Collection
+
+    Returns:
+        Item: synthetic item, valid for the core STAC model only
+    """
+    return Item.model_validate(
+        {
+            "type": "Feature",
+            "stac_version": "1.0.0",
+            "id": WARMUP_ITEM_ID,
+            "collection": collection_id,
+            "stac_extensions": [extension["default"] for extension in DEFAULT_EXTENSIONS.get(collection_id, {}).values()],
+            "geometry": {"type": "Polygon", "coordinates": [[[-180, -90], [180, -90], [180, 90], [-180, 90], [-180, -90]]]},
+            "bbox": [-180, -90, 180, 90],
+            "properties": {"datetime": None, "start_datetime": "2000-01-01T00:00:00Z", "end_datetime": "2000-12-31T23:59:59Z"},
+            "links": [],
+            "assets": {"data0000": {"href": f"https://esgf.invalid/{collection_id}/{WARMUP_ITEM_ID}.nc", "roles": ["data"]}},
+        }
+    )
+
+
+def warm_up_collection(client: TransactionClient, collection_id: str) -> None:
+    item = synthetic_item(collection_id)
+    # Compile every validator, validation stops at the first failing extension
+    for extension in item.stac_extensions:
+        get_extension_validator(str(extension))
+
+    acp = getattr(settings.client, "access_control_policy", None)
+    if isinstance(acp, dict):
+        client.allowed_groups(item.properties, acp)
+
+    patch = patch_adapter.validate_python(RETRACTION)
+    for candidate, validate in [(item, validate_post), (operation_to_partial_item(collection_id, patch), validate_patch)]:
+        try:
+            client.validate_item(collection_id=collection_id, item_id=item.id, item=candidate, validate=validate)
+        except REJECTED as exc:
+            # The synthetic item is not meant to pass the extension schemas
+            logger.debug("Warm-up item rejected by %s: %s", validate.__name__, exc)
+
+    metadata = Metadata(
+        auth=Auth(requester_data=RequesterData(client_id=WARMUP_ITEM_ID, iss=WARMUP_ITEM_ID, sub=WARMUP_ITEM_ID)),
+        event_id=WARMUP_ITEM_ID,
+        publisher=Publisher(package=WARMUP_ITEM_ID, version=""),
+        request_id=WARMUP_ITEM_ID,
+        time=datetime.now().isoformat(),
+        schema_version="1.0.0",
+    )
+    payloads = [
+        CreatePayload(method="POST", collection_id=collection_id, item=item.model_dump()),
+        PatchPayload(method="PATCH", collection_id=collection_id, item_id=item.id, patch=patch_adapter.dump_python(patch)),
+    ]
+    for payload in payloads:
+        client.compressor.compress(codec.encode_event(KafkaEvent(metadata=metadata, data=Data(type="STAC", payload=payload))))
+
+
+def warm_up(client: TransactionClient, collections: list[str] | None = None) -> dict[str, float]:
+    """Run a synthetic item of each collection through the pipeline, without publishing it.
+
+    A collection failing to warm up is logged and skipped, its first request pays instead.
+
+    Args:
+        client (TransactionClient): client serving the requests
+        collections (list[str] | None): collections to warm up, all by default
+
+    Returns:
+        dict[str, float]: warm-up seconds of each collection
+    """
+    global warmed_up
+
+    timings = {}
+    for collection_id in collections or list(DEFAULT_EXTENSIONS):
+        started = time.perf_counter()
+        try:
+            warm_up_collection(client, collection_id)
+        except Exception as exc:
+            logger.warning("Warm-up of %s failed: %s", collection_id, exc)
+            continue
+        timings[collection_id] = time.perf_counter() - started
+
+    logger.info("Warm-up of %s in %.3fs", ", ".join(timings) or "no collection", sum(timings.values()))
+    warmed_up = True
+    return timings
+
+
+def preload(client: TransactionClient) -> None:
+    """Prepare a master process before it forks its workers.
+
+    Raises:
+        Exception: startup failed, the workers are not started
+    """
+    started = time.perf_counter()
+    startup.start().result()
+    warm_up(client, settings.warmup.collections)
+    # Objects of the master are never collected, so the workers do not touch, and copy, their pages
+    gc.collect()
+    gc.freeze()
+    logger.info("Preloaded in %.3fs, %s objects frozen", time.perf_counter() - started, gc.get_freeze_count())
@@ -1,13 +1,240 @@
 import os
 import json
 import argparse
+import asyncio
+import math
 import random
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
 from urllib import parse as urlparse
-from stac_client import TransactionClient
 
+from loadtest import percentile
+from prevalidate import check_patch, check_post
+from shards import PayloadStore
+from stac_client import PublishResult, TransactionClient
 
-def main(args):
-    tc = TransactionClient(stac_api=args.stac_transaction_api)
+"""
+Data Challenge driver
+    Publishes the items of a data challenge in two phases, POST then PATCH, with `--concurrency`
+    requests in flight and at most `--rate` requests per second. Data challenge 4:
+        POST    every item, a property of items after the 400th changed to the wrong type
+        PATCH   retraction of items 101-200, an alternate location for every asset of items 1-100 and 201-300
+    Every accepted or permanently rejected request (4xx other than 429) is appended to the
+    `--checkpoint` file: an interrupted run started again with the same arguments skips them, and
+    sends again those which ran out of retries. Random changes are seeded by `--seed`, so runs are repeatable.
+    With `--prevalidate`, requests failing the validation of the API (prevalidate.py) are not sent.
+    The `--report` file gives, per phase, the throughput, latency percentiles and status codes.
+"""
+
+
+@dataclass
+class Task:
+    phase: str
+    item_id: str
+    request: Callable[[], Awaitable[PublishResult]]
+
+
+@dataclass
+class Phase:
+    results: list[PublishResult] = field(default_factory=list)
+    skipped: int = 0
+    elapsed: float = 0.0
+
+
+class Pacer:
+    """Spaces requests out to at most ``rate`` per second, unlimited if 0."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next = time.monotonic()
+
+    async def wait(self) -> None:
+        if not self.interval:
+            return
+        now = time.monotonic()
+        slot = max(self.next, now)
+        self.next = slot + self.interval
+        await asyncio.sleep(slot - now)
+
+
+def settled(status_code: int | None) -> bool:
+    """Whether a request is not to be sent again: accepted, or rejected for good."""
+    if status_code is None or status_code == 429:
+        return False
+    return status_code < 500
+
+
+class Checkpoint:
+    """Settled requests, one JSON line each, appended as they complete."""
+
+    def __init__(self, path: str | None) -> None:
+        self.path = path
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    # The last line may be partial if the run was killed
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done.add((record["phase"], record["item_id"]))
+        self.file = open(path, "a") if path else None
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self.done
+
+    def record(self, phase: str, result: PublishResult) -> None:
+        if self.file is None or not settled(result.status_code):
+            # Transport errors, 429 and 5xx are sent again on resume
+            return
+        self.file.write(json.dumps({"phase": phase, "item_id": result.item_id, "status_code": result.status_code}) + "\n")
+        self.file.flush()
+
+    def close(self) -> None:
+        if self.file:
+            self.file.close()
+
+
+def replication(entry: dict) -> list[dict]:
+    operations = []
+    for key, value in entry.get("assets", {}).items():
+        href_parsed = urlparse.urlparse(value.get("href", ""))
+        operations.append(
+            {
+                "op": "add",
+                "path": f"/assets/{key}",
+                "value": {
+                    "alternate": {
+                        "eagle.alcf.anl.gov": {
+                            "href": f"{href_parsed.scheme}://eagle.alcf.anl.gov{href_parsed.path}",
+                            "type": value.get("type", ""),
+                            "roles": value.get("roles", []),
+                            "description": value.get("description", ""),
+                            "alternate:name": "eagle.alcf.anl.gov",
+                        }
+                    },
+                },
+            }
+        )
+    return operations
+
+
+def plan(
+    tc: TransactionClient,
+    paths: list[str],
+    payloads_dir: str,
+    seed: int,
+    prevalidate: bool = False,
+    schema_directory: str | None = None,
+) -> dict[str, list[Task]]:
+    """Requests of data challenge 4, per phase, without those failing pre-validation if ``prevalidate``."""
+    rng = random.Random(seed)
+    payloads = PayloadStore(payloads_dir)
+    tasks = {"post": [], "patch": []}
+    for i, path in enumerate(paths):
+        path = path.strip()
+        item_id = path.replace("/", ".")
+        entry = payloads.get(item_id)
+        if entry is None:
+            print(f"Payload {item_id} does not exist in {payloads_dir}. Skipping.")
+            continue
+
+        post_entry = json.loads(json.dumps(entry))
+        # Change value type of random properties
+        if i > 400:
+            random_key = rng.choice(sorted(post_entry.get("properties").keys()))
+            if isinstance(post_entry.get("properties").get(random_key), str):
+                post_entry["properties"][random_key] = 5.4
+            else:
+                post_entry["properties"][random_key] = "test_value"
+        errors = check_post(post_entry, schema_directory) if prevalidate else []
+        if errors:
+            print(f"POST {item_id} invalid, not sent: {errors[0]}")
+        else:
+            tasks["post"].append(Task("post", item_id, lambda e=post_entry: tc.post(e)))
+
+        # Retraction
+        if 100 < i and i <= 200:
+            operations = [{"op": "add", "path": "/properties/retracted", "value": True}]
+        # Replication
+        elif i <= 300:
+            operations = replication(entry)
+        else:
+            continue
+        errors = check_patch("CMIP6", item_id, operations, schema_directory) if prevalidate else []
+        if errors:
+            print(f"PATCH {item_id} invalid, not sent: {errors[0]}")
+            continue
+        tasks["patch"].append(Task("patch", item_id, lambda o=operations, item_id=item_id: tc.json_patch("CMIP6", item_id, o)))
+    return tasks
+
+
+async def run_phase(tc: TransactionClient, name: str, tasks: list[Task], pacer: Pacer, checkpoint: Checkpoint, verbose: bool) -> Phase:
+    phase = Phase()
+    pending = []
+    for task in tasks:
+        if (task.phase, task.item_id) in checkpoint:
+            phase.skipped += 1
+        else:
+            pending.append(task)
+
+    def on_result(result: PublishResult) -> None:
+        checkpoint.record(name, result)
+        if verbose or not result.ok:
+            print(f"{result.operation} {result.item_id}: {result.status_code} {result.error or ''}")
+
+    async def paced(task: Task) -> PublishResult:
+        await pacer.wait()
+        return await task.request()
+
+    started = time.perf_counter()
+    if pending:
+        phase.results = await tc.batch((paced(task) for task in pending), on_result=on_result)
+    phase.elapsed = time.perf_counter() - started
+    return phase
+
+
+def milliseconds(seconds: float) -> float | None:
+    """Milliseconds, None (null in the report) for a phase without results."""
+    return None if math.isnan(seconds) else seconds * 1000
+
+
+def report(phases: dict[str, Phase]) -> dict:
+    summary = {}
+    for name, phase in phases.items():
+        latencies = sorted(result.seconds for result in phase.results)
+        count = len(latencies)
+        summary[name] = {
+            "requests": count,
+            "skipped": phase.skipped,
+            "elapsed_seconds": phase.elapsed,
+            "throughput": count / phase.elapsed if phase.elapsed else 0.0,
+            "p50_ms": milliseconds(percentile(latencies, 50)),
+            "p95_ms": milliseconds(percentile(latencies, 95)),
+            "p99_ms": milliseconds(percentile(latencies, 99)),
+            "max_ms": milliseconds(latencies[-1] if latencies else math.nan),
+            "retries": sum(result.attempts - 1 for result in phase.results),
+            "statuses": {str(status): n for status, n in sorted(Counter(r.status_code for r in phase.results).items(), key=lambda s: str(s[0]))},
+        }
+    return summary
+
+
+def print_report(summary: dict) -> None:
+    columns = ["req/s", "p50 ms", "p95 ms", "p99 ms", "max ms"]
+    print(f"\n{'phase':<8}{'requests':>10}{'skipped':>9}" + "".join(f"{column:>10}" for column in columns) + f"{'retries':>9}  statuses")
+    for name, s in summary.items():
+        statuses = " ".join(f"{status}:{n}" for status, n in s["statuses"].items())
+        latencies = "".join(
+            f"{s[column]:>10.1f}" if s[column] is not None else f"{'-':>10}" for column in ["p50_ms", "p95_ms", "p99_ms", "max_ms"]
+        )
+        print(f"{name:<8}{s['requests']:>10}{s['skipped']:>9}{s['throughput']:>10.1f}{latencies}{s['retries']:>9}  {statuses}")
+
+
+async def main(args):
+    tc = TransactionClient(stac_api=args.stac_transaction_api, concurrency=args.concurrency)
     region = "East" if args.east else "West"
 
     start_index = args.dc * 500 % 2000 + 1
@@ -16,79 +243,36 @@ def main(args):
         paths = f.readlines()
         print(len(paths), f"paths found for Data Challenge {args.dc}")
 
-    if args.dc == 4:
-        for i, path in enumerate(paths):
-            path = path.strip()
-            item_id = path.replace("/", ".")
-            file_name = path.replace("/", ".") + ".json"
-            file_path = os.path.join(args.payloads_dir, file_name)
-
-            if not os.path.exists(file_path):
-                print(f"File {file_path} does not exist. Skipping.")
-                continue
-            print(f"POSTing {path} to {region} STAC Transaction API")
-            with open(file_path, "r") as f:
-                entry = json.load(f)
-                print(f"Entry: {entry}")
-                # Change value type of random properties
-                if i > 400:
-                    random_key = random.choice(list(entry.get("properties").keys()))
-                    if isinstance(entry.get("properties").get(random_key), str):
-                        entry["properties"][random_key] = 5.4
-                    else:
-                        entry["properties"][random_key] = "test_value"
-                response = tc.post(entry)
-                print(f"Response: {response}")
-
-        for i, path in enumerate(paths):
-            path = path.strip()
-            item_id = path.replace("/", ".")
-
-            if not os.path.exists(file_path):
-                print(f"File {file_path} does not exist. Skipping.")
-                continue
-
-            print(f"PATCHing {path} to {region} STAC Transaction API")
-            # Retraction
-            if 100 < i and i <= 200:
-                operations = [{"op": "add", "path": "/properties/retracted", "value": True}]
-                response = tc.json_patch(
-                    "CMIP6",
-                    item_id=item_id,
-                    entry={"operations": operations},
-                )
-                print(f"Response: {response}")
-
-            # Replication
-            elif i <= 300:
-                with open(file_path, "r") as f:
-                    entry = json.load(f)
-                    assets = entry.get("assets", {})
-                    operations = []
-                    for key, value in assets.items():
-                        href = value.get("href", "")
-                        href_parsed = urlparse.urlparse(href)
-                        type = value.get("type", "")
-                        roles = value.get("roles", [])
-                        description = value.get("description", "")
-                        entry = {
-                            "op": "add",
-                            "path": f"/assets/{key}",
-                            "value": {
-                                "alternate": {
-                                    "eagle.alcf.anl.gov": {
-                                        "href": f"{href_parsed.scheme}://eagle.alcf.anl.gov{href_parsed.path}",
-                                        "type": type,
-                                        "roles": roles,
-                                        "description": description,
-                                        "alternate:name": "eagle.alcf.anl.gov",
-                                    }
-                                },
-                            },
-                        }
-                        operations.append(entry)
-                    response = tc.json_patch("CMIP6", item_id=item_id, entry={"operations": operations})
-                    print(f"Response: {response}")
+    if args.dc != 4:
+        print(f"No requests defined for Data Challenge {args.dc}")
+        return
+
+    tasks = plan(tc, paths, args.payloads_dir, args.seed, args.prevalidate, args.schema_directory)
+    checkpoint = Checkpoint(args.checkpoint or f"data-challenge-{args.dc}-{region}.checkpoint.jsonl")
+    pacer = Pacer(args.rate)
+    phases = {}
+    try:
+        async with tc:
+            for name in args.phases.split(","):
+                print(f"{name.upper()}ing {len(tasks[name])} items to {region} STAC Transaction API")
+                phases[name] = await run_phase(tc, name, tasks[name], pacer, checkpoint, args.verbose)
+    finally:
+        checkpoint.close()
+
+    summary = report(phases)
+    print_report(summary)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(
+                {
+                    "data_challenge": args.dc,
+                    "region": region,
+                    "config": {"concurrency": args.concurrency, "rate": args.rate, "seed": args.seed},
+                    "phases": summary,
+                },
+                f,
+                indent=2,
+            )
 
 
 if __name__ == "__main__":
@@ -104,6 +288,15 @@ if __name__ == "__main__":
         default="esgfng-payloads",
         help="A directory where files with ESGF-NG payloads will be stored.",
     )
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight")
+    parser.add_argument("--rate", type=float, default=0, help="Maximum requests per second, 0 for unlimited")
+    parser.add_argument("--phases", type=str, default="post,patch", help="Phases to run, in order")
+    parser.add_argument("--checkpoint", type=str, help="Checkpoint file, data-challenge-<dc>-<region>.checkpoint.jsonl by default")
+    parser.add_argument("--report", type=str, help="Write the report as JSON to this file")
+    parser.add_argument("--seed", type=int, default=4, help="Seed of the random property changes")
+    parser.add_argument("--prevalidate", action="store_true", help="Validate requests offline, and do not send the invalid ones")
+    parser.add_argument("--schema-directory", type=str, help="Extension schemas of the API for --prevalidate, fetched by default")
+    parser.add_argument("--verbose", action="store_true", help="Print every result, not only failures")
     args = parser.parse_args()
 
-    main(args)
+    asyncio.run(main(args))
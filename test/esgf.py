@@ -1,12 +1,27 @@
+import asyncio
+import hashlib
 import json
 import os
-import sys
+import random
 import time
+from datetime import datetime, timezone
 
 import httpx
 
 import settings
 
+"""
+Harvester of ESGF1 index documents
+    For each dataset path, the Dataset document and its File documents are fetched from
+    ESGF_SEARCH_URL, File documents by pages of `page_size`, with `concurrency` queries in flight
+    over a pool of connections. Failed queries (transport errors, 429 and 5xx) are retried with an
+    exponential backoff with jitter. Responses are cached in `cache_dir`, keyed by query.
+
+    Incremental harvesting: the time of the last harvest is kept in <documents_dir>/.harvest.json.
+    The next harvest downloads the datasets not yet downloaded, and those whose `_timestamp` is later
+    than the last harvest, found with a paginated query of the data node (`from`).
+"""
+
 esgf_search_url = settings.ESGF_SEARCH_URL
 
 facets = [
@@ -22,39 +37,15 @@ facets = [
     "version",
 ]
 
+RETRIED = [429, 500, 502, 503, 504]
+HARVEST_STATE = ".harvest.json"
 
-def get_search_response(object_type, limit, extra_params):
-    params = {
-        "limit": limit,
-        "offset": 0,
-        "replica": "False",
-        # "retracted": "False",
-        "project": "CMIP6",
-        "data_node": settings.DATA_NODE,
-        "type": object_type,
-        "format": "application/solr+json",
-    }
-    params.update(extra_params)
-
-    r = httpx.get(esgf_search_url, params=params, timeout=5.0)
-    # print(r)
-    if r.status_code != 200:
-        print(f"The ESGF Index server returned {r.status_code}")
-        sys.exit(1)
 
-    try:
-        search_response = r.json()
-    except ValueError:
-        print("Error when decoding JSON response from the ESGF Index server")
-        sys.exit(1)
-    # print(search_response)
-    response = search_response.get("response")
-    # print(response)
-    docs = response.get("docs")
-    return docs
-
-
-def get_dataset_document(path):
+class SearchError(Exception):
+    pass
+
+
+def dataset_params(path):
     splitted_path = path.split("/")
     params = {}
     for i in range(len(splitted_path)):
@@ -62,64 +53,205 @@ def get_dataset_document(path):
             params[facets[i]] = splitted_path[i][1:]
         else:
             params[facets[i]] = splitted_path[i]
-    while True:
-        docs = get_search_response("Dataset", 1, params)
-        if len(docs) == 1:
-            return docs
-        else:
-            time.sleep(1)
-            return None
+    return params
 
 
-def get_file_documents(dataset_id, number_of_files):
-    while True:
-        docs = get_search_response("File", number_of_files, {"dataset_id": dataset_id})
-        if len(docs) == number_of_files:
-            return docs
-        else:
-            time.sleep(1)
+class Harvester:
+    def __init__(
+        self,
+        search_url=esgf_search_url,
+        data_node=settings.DATA_NODE,
+        concurrency=8,
+        page_size=500,
+        retries=5,
+        backoff_seconds=1.0,
+        timeout_seconds=30.0,
+        cache_dir=None,
+    ):
+        self.search_url = search_url
+        self.data_node = data_node
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout_seconds = timeout_seconds
+        self.cache_dir = cache_dir
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.client = None
+        self.queries = 0
+        self.cache_hits = 0
+
+    async def __aenter__(self):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=self.timeout_seconds,
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        self.client = None
+
+    def cache_path(self, params):
+        key = hashlib.sha256(json.dumps([self.search_url, params], sort_keys=True).encode("utf8")).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    async def get(self, params, refresh=False):
+        """Search response of a query, from the cache if there, unless ``refresh``.
+
+        Raises:
+            SearchError: the query still failed after the retries
+        """
+        cache_path = self.cache_path(params) if self.cache_dir else None
+        if cache_path and not refresh and os.path.exists(cache_path):
+            self.cache_hits += 1
+            with open(cache_path, "r") as f:
+                return json.load(f)
+
+        async with self.semaphore:
+            for attempt in range(self.retries + 1):
+                try:
+                    r = await self.client.get(self.search_url, params=params)
+                except httpx.TransportError as exc:
+                    error = f"{type(exc).__name__}: {exc}"
+                else:
+                    if r.status_code == 200:
+                        break
+                    error = f"The ESGF Index server returned {r.status_code}"
+                    if r.status_code not in RETRIED:
+                        raise SearchError(error)
+                if attempt == self.retries:
+                    raise SearchError(error)
+                await asyncio.sleep(random.uniform(0, self.backoff_seconds * 2**attempt))
+            self.queries += 1
+
+        try:
+            search_response = r.json()
+        except ValueError:
+            raise SearchError("Error when decoding JSON response from the ESGF Index server")
+
+        if cache_path:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            write_json(cache_path, search_response)
+        return search_response
+
+    async def search(self, object_type, limit, offset, extra_params, refresh=False):
+        """(documents, number found) of a page of a search."""
+        params = {
+            "limit": limit,
+            "offset": offset,
+            "replica": "False",
+            # "retracted": "False",
+            "project": "CMIP6",
+            "data_node": self.data_node,
+            "type": object_type,
+            "format": "application/solr+json",
+        }
+        params.update(extra_params)
+        response = (await self.get(params, refresh)).get("response")
+        return response.get("docs"), response.get("numFound", 0)
+
+    async def search_all(self, object_type, extra_params, number_found=None, refresh=False):
+        """Every document of a search, the pages after the first fetched concurrently."""
+        docs, found = await self.search(object_type, self.page_size, 0, extra_params, refresh)
+        found = number_found if number_found is not None else found
+        pages = await asyncio.gather(
+            *(self.search(object_type, self.page_size, offset, extra_params, refresh) for offset in range(self.page_size, found, self.page_size))
+        )
+        for page, _ in pages:
+            docs.extend(page)
+        return docs
+
+    async def download_dataset_documents(self, path, refresh=False):
+        """Dataset document followed by its File documents, None if not found."""
+        dataset_documents, _ = await self.search("Dataset", 1, 0, dataset_params(path), refresh)
+        if len(dataset_documents) != 1:
+            print(f"Dataset {path} not found")
+            return None
+        dataset_document = dataset_documents[0]
+        number_of_files = dataset_document.get("number_of_files")
+        file_documents = await self.search_all("File", {"dataset_id": dataset_document.get("id")}, number_of_files, refresh)
+        if len(file_documents) != number_of_files:
+            print(f"Files for dataset {path} not found: {len(file_documents)} of {number_of_files}")
             return None
+        return dataset_documents + file_documents
+
+    async def changed_since(self, timestamp):
+        """instance_id of the datasets of the data node changed since ``timestamp``."""
+        docs = await self.search_all("Dataset", {"from": timestamp, "fields": "instance_id"}, refresh=True)
+        return {doc.get("instance_id") for doc in docs}
+
+
+def write_json(file_path, data):
+    # Written then renamed, an interrupted harvest leaves no partial file
+    temporary = f"{file_path}.{os.getpid()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, file_path)
+
+
+def read_state(documents_dir):
+    try:
+        with open(os.path.join(documents_dir, HARVEST_STATE), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
 
+async def harvest(paths, documents_dir, harvester, incremental=True):
+    """Download the documents of each dataset path to <documents_dir>/<path with dots>.json.
 
-def download_dataset_documents(path):
-    dataset_documents = get_dataset_document(path)
-    if not dataset_documents:
-        print(f"Dataset {path} not found")
-        return None
-    if len(dataset_documents) == 0:
-        print(f"Dataset {path} not found")
-        sys.exit(1)
-    dataset_document = dataset_documents[0]
-    dataset_id = dataset_document.get("id")
-    number_of_files = dataset_document.get("number_of_files")
-    # print(dataset_id, number_of_files)
-    file_documents = get_file_documents(dataset_id, number_of_files)
-    if not file_documents:
-        print(f"Files for dataset {path} not found")
-        return None
-    if len(file_documents) == 0:
-        print(f"Files for dataset {path} not found")
-        sys.exit(1)
-    dataset_documents.extend(file_documents)
-    return dataset_documents
-
-
-def download(paths, documents_dir):
-    if not os.path.exists(documents_dir):
-        os.makedirs(documents_dir)
-
-    counter = 1
-    for path in paths:
-        file_name = path.replace("/", ".") + ".json"
-        file_path = os.path.join(documents_dir, file_name)
-        if os.path.exists(file_path):
-            print(f"{counter}/{len(paths)}: File {file_name} already exists")
-            counter += 1
-            continue
-        docs = download_dataset_documents(path)
+    Returns:
+        dict[str, int]: number of datasets downloaded, skipped and failed
+    """
+    os.makedirs(documents_dir, exist_ok=True)
+    started = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    state = read_state(documents_dir)
+
+    changed = set()
+    if incremental and state.get("harvested"):
+        changed = await harvester.changed_since(state["harvested"])
+        print(f"{len(changed)} datasets changed since {state['harvested']}")
+
+    counts = {"downloaded": 0, "skipped": 0, "failed": 0}
+
+    async def download_one(path):
+        instance_id = path.replace("/", ".")
+        file_path = os.path.join(documents_dir, f"{instance_id}.json")
+        if os.path.exists(file_path) and instance_id not in changed:
+            counts["skipped"] += 1
+            return
+        try:
+            # A changed dataset is fetched again, not read from the cache
+            docs = await harvester.download_dataset_documents(path, refresh=instance_id in changed)
+        except SearchError as exc:
+            print(f"Dataset {path} failed: {exc}")
+            docs = None
         if not docs:
-            continue
-        with open(file_path, "w") as f:
-            json.dump(docs, f, indent=4)
-        print(f"{counter}/{len(paths)}: Downloaded", path)
-        counter += 1
+            counts["failed"] += 1
+            return
+        write_json(file_path, docs)
+        counts["downloaded"] += 1
+        done = sum(counts.values())
+        print(f"{done}/{len(paths)}: Downloaded", path)
+
+    await asyncio.gather(*(download_one(path) for path in paths))
+
+    if not counts["failed"]:
+        # Only a complete harvest moves the mark, failed datasets are retried by the next one
+        write_json(os.path.join(documents_dir, HARVEST_STATE), {"harvested": started})
+    return counts
+
+
+def download(paths, documents_dir, concurrency=8, page_size=500, cache_dir=None, incremental=True):
+    async def run():
+        async with Harvester(concurrency=concurrency, page_size=page_size, cache_dir=cache_dir) as harvester:
+            started = time.perf_counter()
+            counts = await harvest(paths, documents_dir, harvester, incremental)
+            print(
+                f"Harvested in {time.perf_counter() - started:.1f}s: {counts}, "
+                f"{harvester.queries} queries, {harvester.cache_hits} from the cache"
+            )
+            return counts
+
+    return asyncio.run(run())
@@ -1,6 +1,13 @@
 import re
 from settings import STAC_API
 
+"""
+Conversion of ESGF1 index documents to STAC items
+    The documents of a dataset are read in a single pass: the Dataset document, the Globus URL of
+    the first File document, and the first netCDF HTTPServer URL of each File document. Conversion
+    is linear in the number of File documents and URLs.
+"""
+
 
 item_properties = {
     "CMIP6": [
@@ -77,12 +84,40 @@ list_properties = [
 ]
 
 
-def convert2stac(json_data):
-    dataset_doc = {}
+GLOBUS_URL = re.compile(r"^globus:([^/]*)(.*/)[^/]*$")
+HTTPSERVER_NETCDF = "application/netcdf|HTTPServer"
+
+
+def index_documents(json_data):
+    """(Dataset document, Globus URL, HTTPServer URLs) of the documents of a dataset, in a single pass.
+
+    The Globus URL is the last one of the first File document, the HTTPServer URLs are the first
+    netCDF one of each File document, in order.
+    """
+    dataset_doc = None
+    globus_url = None
+    http_urls = []
+    first_file = True
     for doc in json_data:
-        if doc.get("type") == "Dataset":
+        doc_type = doc.get("type")
+        if doc_type == "File":
+            urls = doc.get("url")
+            http_url = None
+            for url in urls:
+                if first_file and url.startswith("globus:"):
+                    globus_url = url
+                if http_url is None and url.endswith(HTTPSERVER_NETCDF):
+                    http_url = url.split("|", 1)[0]
+            if http_url is not None:
+                http_urls.append(http_url)
+            first_file = False
+        elif doc_type == "Dataset" and dataset_doc is None:
             dataset_doc = doc
-            break
+    return dataset_doc or {}, globus_url, http_urls
+
+
+def convert2stac(json_data):
+    dataset_doc, globus_url, http_urls = index_documents(json_data)
 
     collection = dataset_doc.get("project")[0]
     item_id = dataset_doc.get("instance_id")
@@ -136,44 +171,29 @@ def convert2stac(json_data):
     }
 
     assets = {}
+    access = dataset_doc.get("access")
+    data_node = dataset_doc.get("data_node")
+
+    if "Globus" in access and globus_url is not None:
+        m = GLOBUS_URL.search(globus_url)
+        href = f"https://app.globus.org/file-manager?origin_id={m[1]}&origin_path={m[2]}"
+        assets["globus"] = {
+            "href": href,
+            "description": "Globus Web App Link",
+            "type": "text/html",
+            "roles": ["data"],
+            "alternate:name": data_node,
+        }
 
-    if "Globus" in dataset_doc.get("access"):
-        for doc in json_data:
-            if doc.get("type") == "File":
-                urls = doc.get("url")
-                for url in urls:
-                    if url.startswith("globus:"):
-                        m = re.search(r"^globus:([^/]*)(.*/)[^/]*$", url)
-                        href = f"https://app.globus.org/file-manager?origin_id={m[1]}&origin_path={m[2]}"
-                        assets = {
-                            "globus": {
-                                "href": href,
-                                "description": "Globus Web App Link",
-                                "type": "text/html",
-                                "roles": ["data"],
-                                "alternate:name": dataset_doc.get("data_node"),
-                            }
-                        }
-                break
-
-    if "HTTPServer" in dataset_doc.get("access"):
-        counter = 0
-        for doc in json_data:
-            if doc.get("type") == "File":
-                urls = doc.get("url")
-                for url in urls:
-                    if url.endswith("application/netcdf|HTTPServer"):
-                        url_split = url.split("|")
-                        href = url_split[0]
-                        assets[f"data{counter:04}"] = {
-                            "href": href,
-                            "description": "HTTPServer Link",
-                            "type": "application/netcdf",
-                            "roles": ["data"],
-                            "alternate:name": dataset_doc.get("data_node"),
-                        }
-                        counter += 1
-                        break
+    if "HTTPServer" in access:
+        for counter, href in enumerate(http_urls):
+            assets[f"data{counter:04}"] = {
+                "href": href,
+                "description": "HTTPServer Link",
+                "type": "application/netcdf",
+                "roles": ["data"],
+                "alternate:name": data_node,
+            }
 
     item["assets"] = assets
 
@@ -0,0 +1,219 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+"""
+Local stand-in for the identity providers of the STAC Transaction API
+    Globus Auth:
+        POST /v2/oauth2/token/introspect    token introspection
+        POST /v2/oauth2/token               dependent tokens for Globus Groups
+    Globus Groups:
+        GET /v2/groups/my_groups            active membership of every configured group
+    EGI Check-in:
+        POST /egi/introspect                token introspection with ESGF entitlements
+    Tokens starting with TOKEN_PREFIX are active, any other token is reported inactive.
+    Point the API at it with GLOBUS_SDK_SERVICE_URL_AUTH, GLOBUS_SDK_SERVICE_URL_GROUPS
+    and TRANSACTION_CLIENT__INTROSPECTION_ENDPOINT.
+"""
+
+TOKEN_PREFIX = "loadtest-"
+ROLES = ["CREATE", "UPDATE", "DELETE", "REPLICATE", "REVOKE"]
+
+
+class FakeIdentityProvider(ThreadingHTTPServer):
+    """
+    Fake Globus Auth, Globus Groups and EGI Check-in server
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        client_id: str,
+        scope_string: str,
+        issuer: str,
+        groups: list[str],
+        audience: str = "localhost",
+        latency: float = 0.0,
+    ) -> None:
+        """
+        Args:
+            address (tuple[str, int]): host and port to listen on, port 0 for any free port
+            client_id (str): client id of the API, the token audience for Globus
+            scope_string (str): scope of the introspected Globus tokens
+            issuer (str): issuer of the introspected tokens
+            groups (list[str]): Globus group ids every token is an active member of
+            audience (str): host of the API, the token audience for EGI
+            latency (float): seconds to wait before every response
+        """
+        super().__init__(address, FakeIdentityProviderHandler)
+        self.client_id = client_id
+        self.scope_string = scope_string
+        self.issuer = issuer
+        self.groups = groups
+        self.audience = audience
+        self.latency = latency
+        self.requests: dict[str, int] = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, path: str) -> None:
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def token_info(self, token: str) -> dict:
+        if not token.startswith(TOKEN_PREFIX):
+            return {"active": False}
+        return {
+            "active": True,
+            "aud": [self.client_id],
+            "scope": self.scope_string,
+            "iss": self.issuer,
+            "client_id": f"{token}-client",
+            "sub": f"{token}-sub",
+            "exp": int(time.time()) + 3600,
+        }
+
+    def egi_token_info(self, token: str) -> dict:
+        if not token.startswith(TOKEN_PREFIX):
+            return {"active": False}
+        entitlements = [
+            f"urn:mace:egi.eu:group:esgf.vo.egi.eu:{kind}:*:role={role}#aai.egi.eu" for kind in ["project", "node"] for role in ROLES
+        ]
+        return {
+            "active": True,
+            "aud": [f"https://{self.audience}"],
+            "client_id": f"{token}-client",
+            "sub": f"{token}-sub",
+            "iss": self.issuer,
+            "exp": int(time.time()) + 3600,
+            "entitlements": entitlements,
+        }
+
+    def dependent_tokens(self, token: str) -> list[dict]:
+        return [
+            {
+                "resource_server": "groups.api.globus.org",
+                "access_token": f"groups-{token}",
+                "refresh_token": None,
+                "expires_in": 3600,
+                "token_type": "Bearer",
+                "scope": "urn:globus:auth:scope:groups.api.globus.org:view_my_groups_and_memberships",
+            }
+        ]
+
+    def my_groups(self, token: str) -> list[dict]:
+        return [
+            {
+                "id": group,
+                "name": f"Load test group {group}",
+                "my_memberships": [{"group_id": group, "identity_id": f"{token}-identity", "status": "active", "role": "member"}],
+            }
+            for group in self.groups
+        ]
+
+
+class FakeIdentityProviderHandler(BaseHTTPRequestHandler):
+    server: FakeIdentityProvider
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    def form(self) -> dict[str, str]:
+        length = int(self.headers.get("content-length") or 0)
+        return {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+
+    def bearer(self) -> str:
+        return (self.headers.get("authorization") or "")[7:]
+
+    def send_json(self, content, status: int = 200) -> None:
+        body = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self) -> None:
+        path = self.path.split("?")[0]
+        self.server.count(path)
+        time.sleep(self.server.latency)
+        form = self.form()
+        if path == "/v2/oauth2/token/introspect":
+            self.send_json(self.server.token_info(form.get("token", "")))
+        elif path == "/v2/oauth2/token":
+            self.send_json(self.server.dependent_tokens(form.get("token", "")))
+        elif path == "/egi/introspect":
+            self.send_json(self.server.egi_token_info(form.get("token", "")))
+        else:
+            self.send_json({"detail": "Not Found"}, status=404)
+
+    def do_GET(self) -> None:
+        path = self.path.split("?")[0]
+        self.server.count(path)
+        time.sleep(self.server.latency)
+        if path == "/v2/groups/my_groups":
+            self.send_json(self.server.my_groups(self.bearer().removeprefix("groups-")))
+        else:
+            self.send_json({"detail": "Not Found"}, status=404)
+
+
+def serve(
+    client_id: str,
+    scope_string: str,
+    issuer: str,
+    groups: list[str],
+    audience: str = "localhost",
+    latency: float = 0.0,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> FakeIdentityProvider:
+    """Start a fake identity provider in a background thread.
+
+    Returns:
+        FakeIdentityProvider: running server, stop it with ``shutdown()``
+    """
+    server = FakeIdentityProvider(
+        (host, port),
+        client_id=client_id,
+        scope_string=scope_string,
+        issuer=issuer,
+        groups=groups,
+        audience=audience,
+        latency=latency,
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Globus Auth, Globus Groups and EGI Check-in server")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--client-id", type=str, required=True, help="TRANSACTION_CLIENT__CLIENT_ID of the API")
+    parser.add_argument("--scope-string", type=str, default="", help="TRANSACTION_CLIENT__SCOPE_STRING of the API")
+    parser.add_argument("--issuer", type=str, default="https://auth.globus.org", help="TRANSACTION_CLIENT__ISSUER of the API")
+    parser.add_argument("--group", type=str, action="append", default=[], help="Globus group id, repeat for several groups")
+    parser.add_argument("--audience", type=str, default="localhost", help="Host of the API, the EGI token audience")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before every response")
+    args = parser.parse_args()
+
+    server = FakeIdentityProvider(
+        (args.host, args.port),
+        client_id=args.client_id,
+        scope_string=args.scope_string,
+        issuer=args.issuer,
+        groups=args.group,
+        audience=args.audience,
+        latency=args.latency,
+    )
+    print(f"Fake identity provider listening on {server.url}")
+    server.serve_forever()
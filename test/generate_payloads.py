@@ -1,38 +1,80 @@
 import argparse
 import json
 import os
+import time
+from multiprocessing import Pool
+
 from esgf import download
 from esgfng import convert2stac
+from shards import ShardWriter, compact_index, encode, read_entries
 
 
-def convert(paths, documents_dir, payloads_dir):
-    if not os.path.exists(payloads_dir):
-        os.makedirs(payloads_dir)
+def document_source(document_file_path: str) -> str | None:
+    """Modification time and size of a document, None if it does not exist."""
+    try:
+        stat = os.stat(document_file_path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
 
-    counter = 1
-    for path in paths:
-        file_name = path.replace("/", ".") + ".json"
-        file_path = os.path.join(payloads_dir, file_name)
-        if os.path.exists(file_path):
-            print(f"{counter}/{len(paths)}: File {file_name} already exists")
-            counter += 1
-            continue
 
-        document_file_path = os.path.join(documents_dir, file_name)
-        if not os.path.exists(document_file_path):
-            print(f"{counter}/{len(paths)}: File {file_name} does not exist in {documents_dir}")
-            counter += 1
-            continue
+def convert_one(task):
+    """(item_id, record, source, error) of a dataset, run in a worker process."""
+    item_id, document_file_path, source, compress = task
+    try:
         with open(document_file_path, "r") as df:
             json_data = json.load(df)
-            item = convert2stac(json_data)
-            with open(file_path, "w") as f:
-                json.dump(item, f, indent=4)
-                print(f"{counter}/{len(paths)}: Generated {file_name}")
-                counter += 1
+    except FileNotFoundError:
+        return item_id, None, source, f"File {os.path.basename(document_file_path)} does not exist in {os.path.dirname(document_file_path)}"
+    try:
+        return item_id, encode(convert2stac(json_data), compress), source, None
+    except Exception as exc:
+        return item_id, None, source, f"Conversion of {item_id} failed: {type(exc).__name__}: {exc}"
+
+
+def convert(paths, documents_dir, payloads_dir, workers=None, compress=True, shard_records=10000):
+    """Convert the documents of each dataset path, in a pool of processes, into payload shards.
 
+    Datasets already in the index of the payloads directory are skipped, unless their document
+    changed since, e.g. downloaded again by an incremental harvest.
+    """
+    done = read_entries(payloads_dir)
+    tasks = []
+    for path in paths:
+        item_id = path.replace("/", ".")
+        document_file_path = os.path.join(documents_dir, f"{item_id}.json")
+        source = document_source(document_file_path)
+        if source is None and item_id in done:
+            continue
+        if source is None or done.get(item_id, {}).get("source") != source:
+            tasks.append((item_id, document_file_path, source, compress))
+    changed = sum(item_id in done for item_id, *_ in tasks)
+    print(f"{len(paths) - len(tasks)}/{len(paths)}: already converted, {changed} changed since")
+    if not tasks:
+        return
+
+    started = time.perf_counter()
+    writer = ShardWriter(payloads_dir, compress=compress, shard_records=shard_records)
+    converted = failed = 0
+    try:
+        with Pool(processes=workers) as pool:
+            for item_id, record, source, error in pool.imap_unordered(convert_one, tasks, chunksize=16):
+                if error:
+                    print(error)
+                    failed += 1
+                    continue
+                writer.write(item_id, record, source)
+                converted += 1
+                if converted % 1000 == 0:
+                    print(f"{converted}/{len(tasks)}: Generated, {converted / (time.perf_counter() - started):.0f}/s")
+    finally:
+        writer.close()
+        if changed:
+            compact_index(payloads_dir)
+    print(f"Generated {converted} payloads in {time.perf_counter() - started:.1f}s, {failed} failed")
 
-def main(datasets, documents_dir, payloads_dir):
+
+def main(datasets, documents_dir, payloads_dir, harvest_options, convert_options):
     paths = []
     with open(datasets, "r") as f:
         paths = f.readlines()
@@ -40,8 +82,8 @@ def main(datasets, documents_dir, payloads_dir):
     print("Loading paths from", datasets)
     print("Found", len(paths), "paths")
 
-    download(paths, documents_dir)
-    convert(paths, documents_dir, payloads_dir)
+    download(paths, documents_dir, **harvest_options)
+    convert(paths, documents_dir, payloads_dir, **convert_options)
 
 
 if __name__ == "__main__":
@@ -64,6 +106,28 @@ if __name__ == "__main__":
         default="esgfng-payloads",
         help="A directory where files with ESGF-NG payloads will be stored.",
     )
+    parser.add_argument("--concurrency", type=int, default=8, help="Queries to the ESGF Index server in flight.")
+    parser.add_argument("--page-size", type=int, default=500, help="File documents per query.")
+    parser.add_argument("--cache-dir", type=str, help="A directory where ESGF Index responses are cached, keyed by query.")
+    parser.add_argument(
+        "--no-incremental",
+        action="store_true",
+        help="Skip every dataset already downloaded, without checking for changes since the last harvest.",
+    )
+    parser.add_argument("--workers", type=int, help="Conversion processes, one per core by default.")
+    parser.add_argument("--format", choices=["jsonl", "jsonl.gz"], default="jsonl.gz", help="Format of the payload shards.")
+    parser.add_argument("--shard-records", type=int, default=10000, help="Payloads per shard.")
     args = parser.parse_args()
 
-    main(args.datasets, args.documents_dir, args.payloads_dir)
+    harvest_options = {
+        "concurrency": args.concurrency,
+        "page_size": args.page_size,
+        "cache_dir": args.cache_dir,
+        "incremental": not args.no_incremental,
+    }
+    convert_options = {
+        "workers": args.workers,
+        "compress": args.format == "jsonl.gz",
+        "shard_records": args.shard_records,
+    }
+    main(args.datasets, args.documents_dir, args.payloads_dir, harvest_options, convert_options)
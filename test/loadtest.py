@@ -0,0 +1,403 @@
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from urllib import parse as urlparse
+
+import httpx
+
+from fake_idp import TOKEN_PREFIX, serve
+from shards import PayloadStore
+from synthetic import example_event, synthetic_item
+
+"""
+End-to-end load test of the STAC Transaction API
+    Runs api:app under uvicorn with several workers, with Globus and EGI introspection served by
+    fake_idp.py and Kafka replaced by the memory producer backend, then replays a mix of
+    requests modelled on data_challenge.py:
+        post            POST of a valid item
+        post_invalid    POST of an item with a property of the wrong type, expected to be rejected
+        retraction      JSON PATCH retracting an item
+        replication     JSON PATCH adding an alternate location to every asset
+    Reports throughput, p50/p95/p99 latency and error rate per scenario. No real service is contacted.
+"""
+
+ROOT = Path(__file__).parent.parent
+POLICY_PATH = ROOT / "src" / "settings" / "config" / "access_control_policy.json"
+SCHEMA_DIRECTORY = ROOT / "benchmarks" / "schemas"
+USER_AGENT = "loadtest/1.0"
+DEFAULT_MIX = "post=4,post_invalid=1,retraction=1,replication=2"
+
+
+@dataclass
+class Request:
+    scenario: str
+    method: str
+    path: str
+    body: bytes
+    content_type: str
+    rejected: bool = False
+
+
+@dataclass
+class Result:
+    latencies: list[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: int = 0
+    replayed: int = 0
+
+
+def synthetic_items(count: int, assets: int) -> list[dict]:
+    """CMIP6 items built from schemas/post_event_example.json, one per variable.
+
+    Args:
+        count (int): number of items
+        assets (int): number of data assets of each item
+
+    Returns:
+        list[dict]: STAC items
+    """
+    event = example_event()
+    variable_id = event["data"]["payload"]["item"]["properties"]["variable_id"]
+    return [synthetic_item(event, "CMIP6", assets, f"{variable_id}{i:05}") for i in range(count)]
+
+
+def load_items(payloads_dir: str) -> list[dict]:
+    """Items generated by generate_payloads.py."""
+    return list(PayloadStore(payloads_dir))
+
+
+def invalid(item: dict, rng: random.Random) -> dict:
+    """Change the value type of a random property, as data challenge 4 does."""
+    item = copy.deepcopy(item)
+    key = rng.choice(list(item["properties"].keys()))
+    item["properties"][key] = 5.4 if isinstance(item["properties"][key], str) else "test_value"
+    return item
+
+
+def replication(item: dict) -> list[dict]:
+    """JSON PATCH operations replicating every asset to eagle.alcf.anl.gov, as data challenge 4 does."""
+    operations = []
+    for key, value in item.get("assets", {}).items():
+        href = urlparse.urlparse(value.get("href", ""))
+        operations.append(
+            {
+                "op": "add",
+                "path": f"/assets/{key}",
+                "value": {
+                    "alternate": {
+                        "eagle.alcf.anl.gov": {
+                            "href": f"{href.scheme}://eagle.alcf.anl.gov{href.path}",
+                            "type": value.get("type", ""),
+                            "roles": value.get("roles", []),
+                            "description": value.get("description", ""),
+                            "alternate:name": "eagle.alcf.anl.gov",
+                        }
+                    },
+                },
+            }
+        )
+    return operations
+
+
+def build_requests(items: list[dict], seed: int) -> dict[str, list[Request]]:
+    """Pre-encoded requests of every scenario, so the driver only sends bytes."""
+    rng = random.Random(seed)
+    requests = defaultdict(list)
+    for item in items:
+        collection, item_id = item["collection"], item["id"]
+        path = f"/collections/{collection}/items"
+        requests["post"].append(Request("post", "POST", path, json.dumps(item).encode(), "application/json"))
+        requests["post_invalid"].append(
+            Request("post_invalid", "POST", path, json.dumps(invalid(item, rng)).encode(), "application/json", rejected=True)
+        )
+        retraction = [{"op": "add", "path": "/properties/retracted", "value": True}]
+        requests["retraction"].append(
+            Request("retraction", "PATCH", f"{path}/{item_id}", json.dumps(retraction).encode(), "application/json-patch+json")
+        )
+        requests["replication"].append(
+            Request("replication", "PATCH", f"{path}/{item_id}", json.dumps(replication(item)).encode(), "application/json-patch+json")
+        )
+    return requests
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        scenario, weight = part.split("=")
+        weights[scenario.strip()] = float(weight)
+    return weights
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return math.nan
+    return values[min(len(values) - 1, max(0, math.ceil(q / 100 * len(values)) - 1))]
+
+
+def report(results: dict[str, Result], elapsed: float) -> dict:
+    scenarios = {}
+    for scenario, result in sorted(results.items()):
+        latencies = sorted(result.latencies)
+        count = len(latencies)
+        scenarios[scenario] = {
+            "requests": count,
+            "throughput": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": (latencies[-1] if latencies else math.nan) * 1000,
+            "error_rate": result.errors / count if count else 0.0,
+            "replayed": result.replayed,
+            "statuses": {str(status): n for status, n in sorted(result.statuses.items(), key=lambda s: str(s[0]))},
+        }
+    total = sum(s["requests"] for s in scenarios.values())
+    errors = sum(r.errors for r in results.values())
+    return {
+        "elapsed_seconds": elapsed,
+        "requests": total,
+        "throughput": total / elapsed if elapsed else 0.0,
+        "error_rate": errors / total if total else 0.0,
+        "scenarios": scenarios,
+    }
+
+
+def print_report(summary: dict) -> None:
+    print(
+        f"\n{summary['requests']} requests in {summary['elapsed_seconds']:.1f}s, "
+        f"{summary['throughput']:.1f} req/s, {summary['error_rate']:.2%} errors"
+    )
+    print(f"{'scenario':<14}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>9}  statuses")
+    for scenario, s in summary["scenarios"].items():
+        statuses = " ".join(f"{status}:{n}" for status, n in s["statuses"].items())
+        print(
+            f"{scenario:<14}{s['requests']:>10}{s['throughput']:>10.1f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+            f"{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}{s['error_rate']:>9.2%}  {statuses}"
+        )
+
+
+def failed(request: Request, status: int | str) -> bool:
+    """A transport error, a server error, or a client error of a request expected to be accepted."""
+    if not isinstance(status, int) or status >= 500:
+        return True
+    return status >= 400 and not request.rejected
+
+
+async def run(args, base_url: str, host: str, requests: dict[str, list[Request]]) -> tuple[dict[str, Result], float]:
+    weights = parse_mix(args.mix)
+    unknown = set(weights) - set(requests)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios in --mix: {', '.join(sorted(unknown))}")
+    scenarios, cum_weights = list(weights), list(weights.values())
+    results: dict[str, Result] = defaultdict(Result)
+    rng = random.Random(args.seed)
+
+    started = time.monotonic()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+    sent = 0
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+
+        async def worker(index: int) -> None:
+            nonlocal sent
+            token = f"{TOKEN_PREFIX}{index % args.publishers}"
+            while time.monotonic() < deadline and (not args.requests or sent < args.requests):
+                sent += 1
+                request = rng.choice(requests[rng.choices(scenarios, cum_weights)[0]])
+                headers = {
+                    "Authorization": f"Bearer {token}",
+                    "Content-Type": request.content_type,
+                    # Without a port, as behind the load balancer, the EGI token audience is the host
+                    "Host": host,
+                    "User-Agent": USER_AGENT,
+                    "X-Request-Id": uuid.uuid4().hex,
+                }
+                start = time.monotonic()
+                try:
+                    response = await client.request(request.method, request.path, content=request.body, headers=headers)
+                    status = response.status_code
+                    replayed = "idempotent-replayed" in response.headers
+                except httpx.HTTPError as exc:
+                    status, replayed = type(exc).__name__, False
+                end = time.monotonic()
+
+                if start < measure_from:
+                    continue
+                result = results[request.scenario]
+                result.latencies.append(end - start)
+                result.statuses[status] += 1
+                result.errors += failed(request, status)
+                result.replayed += replayed
+
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+
+    return results, time.monotonic() - max(measure_from, started)
+
+
+def server_environment(args, idp_url: str, host: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "PYTHONPATH": os.pathsep.join([str(ROOT / "src"), env.get("PYTHONPATH", "")]),
+            "TRANSACTION_AUTHORIZER": args.authorizer,
+            "TRANSACTION_CLIENT__CLIENT_ID": "loadtest",
+            "TRANSACTION_CLIENT__CLIENT_SECRET": "loadtest",
+            "TRANSACTION_CLIENT__ISSUER": "https://auth.globus.org",
+            "TRANSACTION_CLIENT__SCOPE_STRING": "https://auth.globus.org/scopes/loadtest/ingest",
+            "TRANSACTION_CLIENT__POLICY_PATH": Path(args.policy).resolve().as_uri(),
+            "TRANSACTION_CLIENT__INTROSPECTION_ENDPOINT": f"{idp_url}/egi/introspect",
+            "TRANSACTION_SCHEMA_DIRECTORY": args.schema_directory,
+            "GLOBUS_SDK_SERVICE_URL_AUTH": f"{idp_url}/",
+            "GLOBUS_SDK_SERVICE_URL_GROUPS": f"{idp_url}/",
+            "TRANSACTION_PRODUCER__BACKEND": args.producer,
+            "TRANSACTION_PRODUCER__LATENCY_SECONDS": str(args.ack_latency),
+            "TRANSACTION_PRODUCER__FILE_DIRECTORY": str(Path(args.events_dir).resolve()),
+        }
+    )
+    return env
+
+
+def policy_groups(policy: dict | list) -> list[str]:
+    """Every group id of an access control policy."""
+    if isinstance(policy, list):
+        return [group["uuid"] for group in policy]
+    return sorted({group for subpolicy in policy.values() for group in policy_groups(subpolicy)})
+
+
+def wait_until_ready(server: subprocess.Popen, base_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"The API exited with status {server.returncode}")
+        try:
+            if httpx.get(f"{base_url}/healthcheck", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"The API did not become ready within {timeout:.0f}s")
+
+
+@contextmanager
+def local_api(args):
+    """Run the API with the fake identity provider, unless ``args.url`` is given.
+
+    Yields:
+        tuple: base URL, host header and fake identity provider (None for ``args.url``)
+    """
+    if args.url:
+        yield args.url, urlparse.urlparse(args.url).hostname, None
+        return
+
+    host = "127.0.0.1"
+    idp = serve(
+        client_id="loadtest",
+        scope_string="https://auth.globus.org/scopes/loadtest/ingest",
+        issuer="https://auth.globus.org",
+        groups=policy_groups(json.loads(Path(args.policy).read_text())),
+        audience=host,
+        latency=args.idp_latency,
+    )
+    base_url = f"http://{host}:{args.port}"
+    command = [sys.executable, "-m", "uvicorn", "api:app", "--host", host, "--port", str(args.port)]
+    command += ["--workers", str(args.workers), "--no-access-log", "--log-level", args.log_level]
+    print(f"Starting {args.workers} {args.authorizer} worker(s) on {base_url}, fake identity provider on {idp.url}")
+    # A scratch working directory, so no .env file is picked up
+    server = subprocess.Popen(command, env=server_environment(args, idp.url, host), cwd=tempfile.mkdtemp(prefix="loadtest-"))
+    try:
+        wait_until_ready(server, base_url)
+        yield base_url, host, idp
+    finally:
+        server.send_signal(signal.SIGINT)
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        idp.shutdown()
+
+
+def add_server_arguments(parser: argparse.ArgumentParser) -> None:
+    """Arguments of the API started by local_api."""
+    parser.add_argument("--url", type=str, help="Send the requests to a running API instead of starting one")
+    parser.add_argument("--port", type=int, default=8008, help="Port of the started API")
+    parser.add_argument("--workers", type=int, default=2, help="uvicorn workers of the started API")
+    parser.add_argument("--authorizer", choices=["globus", "egi"], default="globus")
+    parser.add_argument("--log-level", type=str, default="warning", help="uvicorn log level of the started API")
+    parser.add_argument("--policy", type=str, default=str(POLICY_PATH), help="Access control policy of the started API")
+    parser.add_argument("--schema-directory", type=str, default=str(SCHEMA_DIRECTORY), help="Extension schemas of the started API")
+    parser.add_argument("--idp-latency", type=float, default=0.05, help="Seconds the fake identity provider takes to respond")
+    parser.add_argument("--producer", choices=["memory", "file"], default="memory", help="Producer backend standing in for Kafka")
+    parser.add_argument("--ack-latency", type=float, default=0.005, help="Seconds the producer backend takes to acknowledge")
+    parser.add_argument("--events-dir", type=str, default="loadtest-events", help="Directory of the file producer backend")
+
+
+def main(args):
+    items = load_items(args.payloads_dir) if args.payloads_dir else synthetic_items(args.items, args.assets)
+    if not items:
+        raise SystemExit("No items to publish")
+    requests = build_requests(items, args.seed)
+    print(f"{len(items)} items, mix {args.mix}")
+
+    with local_api(args) as (base_url, host, idp):
+        results, elapsed = asyncio.run(run(args, base_url, host, requests))
+
+    summary = report(results, elapsed)
+    summary["config"] = {
+        "workers": args.workers,
+        "concurrency": args.concurrency,
+        "publishers": args.publishers,
+        "authorizer": args.authorizer,
+        "mix": args.mix,
+        "items": len(items),
+        "assets": args.assets if not args.payloads_dir else None,
+        "idp_latency": args.idp_latency,
+        "producer": args.producer,
+        "ack_latency": args.ack_latency,
+    }
+    if idp:
+        summary["identity_provider_requests"] = dict(idp.requests)
+    print_report(summary)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Report written to {args.report}")
+
+    if args.max_error_rate is not None and summary["error_rate"] > args.max_error_rate:
+        raise SystemExit(f"Error rate {summary['error_rate']:.2%} above {args.max_error_rate:.2%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="STAC Transaction API load test")
+    add_server_arguments(parser)
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight")
+    parser.add_argument("--publishers", type=int, default=8, help="Distinct bearer tokens")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--requests", type=int, default=0, help="Stop after this many requests, 0 for no limit")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    parser.add_argument("--mix", type=str, default=DEFAULT_MIX, help="Weights of the post, post_invalid, retraction and replication scenarios")
+    parser.add_argument("--items", type=int, default=500, help="Synthetic items, as many as a data challenge")
+    parser.add_argument("--assets", type=int, default=10, help="Data assets of each synthetic item")
+    parser.add_argument("--payloads-dir", type=str, help="Publish the items generated by generate_payloads.py instead")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--report", type=str, help="Write the report as JSON to this file")
+    parser.add_argument("--max-error-rate", type=float, help="Exit with an error above this error rate, for CI")
+    args = parser.parse_args()
+
+    main(args)
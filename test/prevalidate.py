@@ -0,0 +1,73 @@
+import argparse
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+from shards import PayloadStore
+
+# The validation of the API, importable without its settings (src/validation.py)
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from validation import ValidationError, prevalidate_patch, prevalidate_post  # noqa: E402
+
+"""
+Offline pre-validation
+    Runs the validation of the STAC Transaction API on items before they are published: the
+    extensions of their collection, geometry and bbox, and the extension JSON schemas, read from
+    --schema-directory (<host>/<path> of the extension URI) if given and bundled there, fetched
+    otherwise: the published schemas the API validates with.
+    An invalid item is reported with the reasons the API would give, and is never sent.
+"""
+
+
+def check_post(item: dict, schema_directory: str | None = None) -> list[str]:
+    """Reasons the API would reject a POST of the item, empty if none."""
+    try:
+        prevalidate_post(item, schema_directory=schema_directory)
+    except ValidationError as exc:
+        return exc.errors
+    return []
+
+
+def check_patch(collection_id: str, item_id: str, patch: list[dict] | dict, schema_directory: str | None = None) -> list[str]:
+    """Reasons the API would reject a PATCH of the item, empty if none."""
+    try:
+        prevalidate_patch(collection_id, item_id, patch, schema_directory=schema_directory)
+    except ValidationError as exc:
+        return exc.errors
+    return []
+
+
+def main(payloads_dir: str, schema_directory: str | None, verbose: bool) -> int:
+    started = time.perf_counter()
+    counts = Counter()
+    for item in PayloadStore(payloads_dir):
+        errors = check_post(item, schema_directory)
+        counts["invalid" if errors else "valid"] += 1
+        if errors:
+            print(f"{item.get('id')}: invalid")
+            for error in errors if verbose else errors[:1]:
+                print(f"    {error}")
+    print(f"{counts['valid']} valid, {counts['invalid']} invalid, in {time.perf_counter() - started:.1f}s")
+    return 1 if counts["invalid"] else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validate payloads offline, as the STAC Transaction API would.")
+    parser.add_argument(
+        "--payloads-dir",
+        type=str,
+        default="esgfng-payloads",
+        help="A directory where files with ESGF-NG payloads are stored.",
+    )
+    parser.add_argument(
+        "--schema-directory",
+        type=str,
+        default=None,
+        help="A directory of the extension schemas of the API, <host>/<path>. By default, and if not bundled, schemas are fetched.",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Print every error of an invalid item, not only the first")
+    args = parser.parse_args()
+
+    sys.exit(main(args.payloads_dir, args.schema_directory, args.verbose))
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+from fake_idp import TOKEN_PREFIX
+from loadtest import add_server_arguments, local_api, percentile
+
+# Captures are read as the API writes them, capture.py imports without the settings of the API
+sys.path.append(str(Path(__file__).parent.parent / "src"))
+
+from capture import capture_body, read_captures  # noqa: E402
+
+"""
+Replay of captured traffic
+    Sends the requests captured by the API (TRANSACTION_CAPTURE__ENABLED, src/capture.py) to an
+    instance started as by loadtest.py, with the fake identity provider and Kafka stand-ins, or to
+    --url. Requests keep their spacing in time, divided by --speed (0 sends them as fast as
+    --concurrency allows), so the load shape of production is reproduced.
+        --auth stub     each captured publisher gets its own token of the fake identity provider
+        --auth token    every request carries --token, for an instance with a real authorizer
+    Idempotency keys are replaced by new ones, the same for the requests that shared one.
+    Reports, per method, throughput, latency percentiles, status codes, how many statuses match
+    the capture, and how late requests were sent against the schedule.
+"""
+
+# Set by httpx, or meaningless once replayed
+SKIPPED_HEADERS = {"host", "content-length", "connection", "transfer-encoding", "accept-encoding", "keep-alive", "expect"}
+
+
+@dataclass
+class Replayed:
+    latencies: list[float] = field(default_factory=list)
+    lags: list[float] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    matched: int = 0
+
+
+class Credentials:
+    """Authorization header of each captured publisher."""
+
+    def __init__(self, auth: str, token: str | None = None) -> None:
+        self.auth = auth
+        self.token = token
+        self.publishers = {}
+
+    def header(self, requester: str | None) -> str | None:
+        if self.auth == "token":
+            return f"Bearer {self.token}"
+        if requester is None:
+            return None
+        index = self.publishers.setdefault(requester, len(self.publishers))
+        return f"Bearer {TOKEN_PREFIX}replay-{index}"
+
+
+def request_headers(record: dict, credentials: Credentials, host: str, idempotency_keys: dict[str, str]) -> dict[str, str]:
+    headers = {name: value for name, value in record["headers"].items() if name not in SKIPPED_HEADERS}
+    if "idempotency-key" in headers:
+        headers["idempotency-key"] = idempotency_keys.setdefault(headers["idempotency-key"], uuid.uuid4().hex)
+    authorization = credentials.header(record.get("requester"))
+    if authorization:
+        headers["authorization"] = authorization
+    # Without a port, as behind the load balancer, the EGI token audience is the host
+    headers["host"] = host
+    return headers
+
+
+async def replay(args, records: list[dict], base_url: str, host: str, credentials: Credentials) -> tuple[dict[str, Replayed], float]:
+    results: dict[str, Replayed] = defaultdict(Replayed)
+    idempotency_keys = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    first = records[0]["time"]
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+
+        async def send(record: dict, scheduled: float) -> None:
+            async with semaphore:
+                start = time.monotonic()
+                path = record["path"] + (f"?{record['query']}" if record.get("query") else "")
+                headers = request_headers(record, credentials, host, idempotency_keys)
+                try:
+                    response = await client.request(record["method"], path, content=capture_body(record), headers=headers)
+                    status = response.status_code
+                except httpx.HTTPError as exc:
+                    status = type(exc).__name__
+                result = results[record["method"]]
+                result.latencies.append(time.monotonic() - start)
+                result.lags.append(start - scheduled)
+                result.statuses[status] += 1
+                result.matched += status == record.get("status")
+
+        started = time.monotonic()
+        tasks = []
+        for record in records:
+            scheduled = started + (record["time"] - first) / args.speed if args.speed > 0 else started
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(record, scheduled)))
+        await asyncio.gather(*tasks)
+
+    return results, time.monotonic() - started
+
+
+def report(results: dict[str, Replayed], elapsed: float) -> dict:
+    summary = {"elapsed_seconds": elapsed, "methods": {}}
+    for method, result in sorted(results.items()):
+        latencies, lags = sorted(result.latencies), sorted(result.lags)
+        count = len(latencies)
+        summary["methods"][method] = {
+            "requests": count,
+            "throughput": count / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "lag_p99_ms": percentile(lags, 99) * 1000,
+            "matched": result.matched,
+            "statuses": {str(status): n for status, n in sorted(result.statuses.items(), key=lambda s: str(s[0]))},
+        }
+    return summary
+
+
+def print_report(summary: dict) -> None:
+    columns = ["req/s", "p50 ms", "p95 ms", "p99 ms", "lag p99"]
+    print(f"\n{'method':<8}{'requests':>10}" + "".join(f"{column:>10}" for column in columns) + f"{'matched':>9}  statuses")
+    for method, s in summary["methods"].items():
+        statuses = " ".join(f"{status}:{n}" for status, n in s["statuses"].items())
+        print(
+            f"{method:<8}{s['requests']:>10}{s['throughput']:>10.1f}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}"
+            f"{s['p99_ms']:>10.1f}{s['lag_p99_ms']:>10.1f}{s['matched']:>9}  {statuses}"
+        )
+
+
+def main(args):
+    records = read_captures(args.capture_dir)
+    if args.requests:
+        records = records[: args.requests]
+    if not records:
+        raise SystemExit(f"No captured requests in {args.capture_dir}")
+    if args.auth == "token" and not args.token:
+        raise SystemExit("--auth token needs --token")
+    truncated = sum(record.get("body_truncated", False) for record in records)
+    span = records[-1]["time"] - records[0]["time"]
+    print(f"{len(records)} requests captured over {span:.1f}s, replayed at {args.speed or 'full'}x speed")
+    if truncated:
+        print(f"{truncated} bodies were truncated by the capture, raise TRANSACTION_CAPTURE__MAX_BODY_BYTES")
+
+    with local_api(args) as (base_url, host, _):
+        results, elapsed = asyncio.run(replay(args, records, base_url, host, Credentials(args.auth, args.token)))
+
+    summary = report(results, elapsed)
+    summary["config"] = {"speed": args.speed, "concurrency": args.concurrency, "auth": args.auth, "requests": len(records)}
+    print_report(summary)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay traffic captured by the STAC Transaction API")
+    parser.add_argument("--capture-dir", type=str, required=True, help="TRANSACTION_CAPTURE__DIRECTORY of the captured API")
+    add_server_arguments(parser)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed, 1 for the captured rate, 0 as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=256, help="Requests in flight")
+    parser.add_argument("--auth", choices=["stub", "token"], default="stub", help="Tokens of the fake identity provider, or --token")
+    parser.add_argument("--token", type=str, help="Bearer token of every request, with --auth token")
+    parser.add_argument("--requests", type=int, default=0, help="Replay only the first requests, 0 for all")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Request timeout in seconds")
+    parser.add_argument("--report", type=str, help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    main(args)
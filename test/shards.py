@@ -0,0 +1,156 @@
+import gzip
+import json
+import os
+import re
+
+"""
+Payload shards
+    generate_payloads.py streams the items into shard files in the payloads directory:
+        payloads-000001.jsonl[.gz]  one item per line, at most `shard_records` per shard
+        index.jsonl                 {"id", "shard", "offset", "length", "source"} of every item, in writing order
+    In a compressed shard every line is its own gzip member: the shard is a valid gzip file as a
+    whole, and each item can be read on its own from its offset and length.
+    The index is also the manifest of the items converted: it is appended once a shard is flushed,
+    and an interrupted run leaves at most a shard with items missing from the index, which the next
+    run converts again into a new shard. "source" identifies the document an item was converted from
+    (modification time and size): an item whose document changed is converted again, its later entry
+    superseding the earlier one, which compact_index drops.
+"""
+
+INDEX = "index.jsonl"
+SHARD = re.compile(r"payloads-(\d{6})\.jsonl(\.gz)?$")
+
+
+def encode(item: dict, compress: bool) -> bytes:
+    line = json.dumps(item, separators=(",", ":")).encode("utf8") + b"\n"
+    return gzip.compress(line, compresslevel=6, mtime=0) if compress else line
+
+
+def decode(record: bytes) -> dict:
+    if record[:2] == b"\x1f\x8b":
+        record = gzip.decompress(record)
+    return json.loads(record)
+
+
+def read_entries(payloads_dir: str) -> dict[str, dict]:
+    """Latest index entry of every item."""
+    entries = {}
+    try:
+        with open(os.path.join(payloads_dir, INDEX), "r") as f:
+            for line in f:
+                # The last line may be partial if the run was killed
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["id"]] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def read_index(payloads_dir: str) -> dict[str, tuple[str, int, int]]:
+    """(shard, offset, length) of every item of the index."""
+    return {item_id: (entry["shard"], entry["offset"], entry["length"]) for item_id, entry in read_entries(payloads_dir).items()}
+
+
+def compact_index(payloads_dir: str) -> None:
+    """Rewrite the index without the entries superseded by a later conversion of their item."""
+    path = os.path.join(payloads_dir, INDEX)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        for entry in read_entries(payloads_dir).values():
+            f.write(json.dumps(entry) + "\n")
+    os.replace(tmp, path)
+
+
+class ShardWriter:
+    """Appends records to new shards of a payloads directory, and their entries to the index."""
+
+    def __init__(self, payloads_dir: str, compress: bool = True, shard_records: int = 10000) -> None:
+        self.payloads_dir = payloads_dir
+        self.compress = compress
+        self.shard_records = shard_records
+        os.makedirs(payloads_dir, exist_ok=True)
+        existing = [int(m.group(1)) for m in map(SHARD.match, os.listdir(payloads_dir)) if m]
+        self.number = max(existing, default=0)
+        self.index = open(os.path.join(payloads_dir, INDEX), "a")
+        self.shard = None
+        self.pending = []
+
+    def _open(self) -> None:
+        self.number += 1
+        self.shard_name = f"payloads-{self.number:06d}.jsonl{'.gz' if self.compress else ''}"
+        self.shard = open(os.path.join(self.payloads_dir, self.shard_name), "wb")
+        self.offset = 0
+        self.records = 0
+
+    def _flush(self) -> None:
+        # Entries are indexed once their records are on disk
+        self.shard.flush()
+        for entry in self.pending:
+            self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self.pending = []
+
+    def write(self, item_id: str, record: bytes, source: str | None = None) -> None:
+        if self.shard is None:
+            self._open()
+        self.shard.write(record)
+        entry = {"id": item_id, "shard": self.shard_name, "offset": self.offset, "length": len(record)}
+        if source is not None:
+            entry["source"] = source
+        self.pending.append(entry)
+        self.offset += len(record)
+        self.records += 1
+        if len(self.pending) >= 100:
+            self._flush()
+        if self.records >= self.shard_records:
+            self._flush()
+            self.shard.close()
+            self.shard = None
+
+    def close(self) -> None:
+        if self.shard is not None:
+            self._flush()
+            self.shard.close()
+            self.shard = None
+        self.index.close()
+
+
+class PayloadStore:
+    """Items of a payloads directory, from its shards, or one <id>.json file per item."""
+
+    def __init__(self, payloads_dir: str) -> None:
+        self.payloads_dir = payloads_dir
+        self.index = read_index(payloads_dir)
+
+    def __contains__(self, item_id: str) -> bool:
+        return item_id in self.index or os.path.exists(os.path.join(self.payloads_dir, f"{item_id}.json"))
+
+    def get(self, item_id: str) -> dict | None:
+        if item_id in self.index:
+            shard, offset, length = self.index[item_id]
+            with open(os.path.join(self.payloads_dir, shard), "rb") as f:
+                f.seek(offset)
+                return decode(f.read(length))
+        try:
+            with open(os.path.join(self.payloads_dir, f"{item_id}.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def __iter__(self):
+        """Every item, shard by shard, then the <id>.json files."""
+        by_shard = {}
+        for shard, offset, length in self.index.values():
+            by_shard.setdefault(shard, []).append((offset, length))
+        for shard, records in sorted(by_shard.items()):
+            with open(os.path.join(self.payloads_dir, shard), "rb") as f:
+                for offset, length in sorted(records):
+                    f.seek(offset)
+                    yield decode(f.read(length))
+        for name in sorted(os.listdir(self.payloads_dir)):
+            if name.endswith(".json") and name[: -len(".json")] not in self.index:
+                with open(os.path.join(self.payloads_dir, name), "r") as f:
+                    yield json.load(f)
@@ -1,7 +1,16 @@
+import asyncio
+import email.utils
+import importlib.util
+import json
 import os
+import random
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Iterable
 
+import httpx
 from globus_sdk import (
-    BaseClient,
     GroupsClient,
     NativeAppAuthClient,
     RefreshTokenAuthorizer,
@@ -11,15 +20,109 @@ from globus_sdk.tokenstorage import SimpleJSONFileAdapter
 
 from settings import STAC_CLIENT, STAC_TRANSACTION_API, TOKEN_STORAGE_FILE
 
-__version__ = "0.2.0"
+__version__ = "0.3.0"
+
+"""
+Publishing client of the STAC Transaction API
+    Requests share a pool of HTTP/2 connections (HTTP/1.1 if h2 is not installed), at most
+    `concurrency` in flight. Responses 429 and 5xx, and transport errors, are retried up to
+    `retries` times after the Retry-After of the response, or an exponential backoff with full
+    jitter. Every request carries an Idempotency-Key, so a retried POST or PATCH is published once.
+    Access tokens are refreshed through the Globus token storage, TOKEN_STORAGE_FILE.
+
+    async with TransactionClient(concurrency=32) as tc:
+        results = await tc.post_batch(items)
+"""
+
+ACCEPTED = [200, 201, 202]
+RETRIED = [429, 500, 502, 503, 504]
+
+
+@dataclass
+class PublishResult:
+    operation: str
+    collection_id: str
+    item_id: str
+    status_code: int | None
+    attempts: int
+    seconds: float
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code in ACCEPTED
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class GlobusAuth(httpx.Auth):
+    """Authorization header of a globus_sdk authorizer, refreshed when expired or rejected."""
+
+    def __init__(self, authorizer) -> None:
+        self.authorizer = authorizer
+
+    def auth_flow(self, request: httpx.Request):
+        request.headers["Authorization"] = self.authorizer.get_authorization_header()
+        response = yield request
+        if response.status_code == 401 and self.authorizer.handle_missing_authorization():
+            request.headers["Authorization"] = self.authorizer.get_authorization_header()
+            yield request
+
+
+def retry_after(response: httpx.Response) -> float | None:
+    """Seconds to wait from the Retry-After header, in seconds or as an HTTP date."""
+    value = response.headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def problem(response: httpx.Response) -> str:
+    """Error of a rejected request, from its RFC 9457 body if any."""
+    try:
+        body = response.json()
+    except ValueError:
+        return response.text[:200]
+    if isinstance(body, dict) and "title" in body:
+        return f"{body['title']}: {body.get('detail', '')}"
+    return json.dumps(body)[:200]
 
 
 class TransactionClient:
-    def __init__(self, stac_api=None, verbose=False, silent=False):
-        if stac_api:
-            self.stac_api = stac_api
-        else:
-            self.stac_api = STAC_TRANSACTION_API.get("base_url")
+    def __init__(
+        self,
+        stac_api: str | None = None,
+        concurrency: int = 16,
+        retries: int = 5,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 30.0,
+        timeout_seconds: float = 30.0,
+        authorizer=None,
+    ):
+        """
+        Args:
+            stac_api (str | None): base URL of the API, STAC_TRANSACTION_API["base_url"] by default
+            concurrency (int): requests in flight
+            retries (int): retries of a request answered 429 or 5xx, or failing in transport
+            backoff_seconds (float): backoff of the first retry, doubled on each retry
+            max_backoff_seconds (float): maximum backoff, and maximum Retry-After honoured
+            timeout_seconds (float): timeout of each attempt
+            authorizer: globus_sdk authorizer, the token storage (after a login flow if empty) by default
+        """
+        self.stac_api = stac_api or STAC_TRANSACTION_API.get("base_url")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.timeout_seconds = timeout_seconds
         self.scopes = [
             GroupsScopes.view_my_groups_and_memberships,
             STAC_TRANSACTION_API.get("scope_string"),
@@ -28,7 +131,12 @@ class TransactionClient:
             client_id=STAC_CLIENT.get("client_id"),
             app_name="ESGF2 STAC Transaction API",
         )
-        self._create_clients()
+        self.groups_client = None
+        if authorizer is None:
+            authorizer = self._create_authorizers()
+        self.authorizer = authorizer
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.http = None
 
     def _do_login_flow(self):
         self.auth_client.oauth2_start_flow(requested_scopes=self.scopes, refresh_tokens=True)
@@ -37,7 +145,7 @@ class TransactionClient:
         auth_code = input("Please enter the code here: ").strip()
         return self.auth_client.oauth2_exchange_code_for_tokens(auth_code)
 
-    def _create_clients(self):
+    def _create_authorizers(self) -> RefreshTokenAuthorizer:
         filename = os.path.expanduser(TOKEN_STORAGE_FILE)
         token_storage = SimpleJSONFileAdapter(filename)
         if not token_storage.file_exists():
@@ -58,99 +166,138 @@ class TransactionClient:
         )
         self.groups_client = GroupsClient(authorizer=groups_authorizer)
 
-        transaction_authorizer = RefreshTokenAuthorizer(
+        return RefreshTokenAuthorizer(
             self.transaction_tokens["refresh_token"],
             self.auth_client,
             access_token=self.transaction_tokens["access_token"],
             expires_at=self.transaction_tokens["expires_at_seconds"],
             on_refresh=token_storage.on_refresh,
         )
-        self.transaction_client = BaseClient(base_url=self.stac_api, authorizer=transaction_authorizer)
+
+    async def __aenter__(self) -> "TransactionClient":
+        self.http = httpx.AsyncClient(
+            base_url=self.stac_api,
+            auth=GlobusAuth(self.authorizer),
+            http2=importlib.util.find_spec("h2") is not None,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+            timeout=self.timeout_seconds,
+            headers={"User-Agent": f"test_client/{__version__}"},
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.http.aclose()
+        self.http = None
 
     def get_my_groups(self):
-        groups = self.groups_client.get_my_groups()
-        return groups
+        return self.groups_client.get_my_groups()
+
+    def backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        delay = retry_after(response) if response is not None else None
+        if delay is None:
+            delay = random.uniform(0, self.backoff_seconds * 2**attempt)
+        return min(delay, self.max_backoff_seconds)
+
+    async def request(
+        self,
+        operation: str,
+        method: str,
+        collection_id: str,
+        item_id: str,
+        path: str,
+        body: Any,
+        content_type: str = "application/json",
+    ) -> PublishResult:
+        """Send a request, retrying on 429, 5xx and transport errors.
+
+        Returns:
+            PublishResult: last response, or error of the last attempt
+        """
+        content = json.dumps(body).encode("utf8")
+        headers = {"Content-Type": content_type, "Idempotency-Key": uuid.uuid4().hex}
+        async with self.semaphore:
+            # Latency of the request, not of its wait for a slot
+            started = time.perf_counter()
+            for attempt in range(self.retries + 1):
+                try:
+                    response = await self.http.request(method, path, content=content, headers=headers)
+                except httpx.TransportError as exc:
+                    response, error = None, f"{type(exc).__name__}: {exc}"
+                else:
+                    error = None if response.status_code in ACCEPTED else problem(response)
+                    if response.status_code not in RETRIED:
+                        break
+                if attempt < self.retries:
+                    await asyncio.sleep(self.backoff(attempt, response))
 
-    def post(self, entry):
+        return PublishResult(
+            operation=operation,
+            collection_id=collection_id,
+            item_id=item_id,
+            status_code=response.status_code if response is not None else None,
+            attempts=attempt + 1,
+            seconds=time.perf_counter() - started,
+            error=error,
+        )
+
+    async def post(self, entry: dict) -> PublishResult:
         collection = entry.get("collection")
-        headers = {
-            "User-Agent": f"test_client/{__version__}",
-        }
-        resp = self.transaction_client.post(f"/collections/{collection}/items", headers=headers, data=entry)
-        if resp.http_status == 201:
-            print(resp.http_status)
-            print("Published (POST)")
-            return True
-        elif resp.http_status == 202:
-            print(resp.http_status)
-            print("Queued for publication (POST)")
-            return True
-        else:
-            print(f"Failed to publish (POST): Error {resp.http_status}")
-            return False
+        return await self.request("post", "POST", collection, entry.get("id"), f"/collections/{collection}/items", entry)
 
-    def put(self, entry):
+    async def put(self, entry: dict) -> PublishResult:
         collection = entry.get("collection")
         item_id = entry.get("id")
-        headers = {
-            "User-Agent": f"test_client/{__version__}",
-        }
-        resp = self.transaction_client.put(f"/collections/{collection}/items/{item_id}", headers=headers, data=entry)
-        if resp.http_status == 201:
-            print(resp.http_status)
-            print("Updated (PUT)")
-            return True
-        elif resp.http_status == 202:
-            print(resp.http_status)
-            print("Queued for update (PUT)")
-            return True
-        else:
-            print(f"Failed to update (PUT): Error {resp.http_status}")
-            return False
+        return await self.request("put", "PUT", collection, item_id, f"/collections/{collection}/items/{item_id}", entry)
 
-    def json_patch(self, collection, item_id, entry):
+    async def json_patch(self, collection: str, item_id: str, operations: list[dict]) -> PublishResult:
         """
         RFC 6902 https://tools.ietf.org/html/rfc6902
         JSON Patch is a format for describing changes to a JSON document
         in a way that is similar to a diff
         It consists of a sequence of operations to be applied to the target JSON document
         """
-        headers = {
-            "Content-Type": "application/json-patch+json",
-            "User-Agent": f"test_client/{__version__}",
-        }
-        resp = self.transaction_client.patch(f"/collections/{collection}/items/{item_id}", headers=headers, data=entry)
-        if resp.http_status == 201:
-            print(resp.http_status)
-            print("Updated (JSON PATCH)")
-            return True
-        elif resp.http_status == 202:
-            print(resp.http_status)
-            print("Queued for update (JSON PATCH)")
-            return True
-        else:
-            print(f"Failed to update (JSON PATCH): Error {resp.http_status}")
-            return False
+        path = f"/collections/{collection}/items/{item_id}"
+        return await self.request("json_patch", "PATCH", collection, item_id, path, operations, "application/json-patch+json")
 
-    def merge_patch(self, collection, item_id, entry):
+    async def merge_patch(self, collection: str, item_id: str, entry: dict) -> PublishResult:
         """
         RFC 7396 https://tools.ietf.org/html/rfc7396
         Merge Patch is a format for describing changes to a JSON document
         that is intended to be applied in a way that is similar to a merge
         """
-        headers = {
-            "Content-Type": "application/merge-patch+json",
-            "User-Agent": f"test_client/{__version__}",
-        }
-        resp = self.transaction_client.patch(f"/collections/{collection}/items/{item_id}", headers=headers, data=entry)
-        if resp.http_status == 201:
-            print(resp.http_status)
-            print("Updated (MERGE PATCH)")
-            return True
-        elif resp.http_status == 202:
-            print(resp.http_status)
-            print("Queued for update (MERGE PATCH)")
-            return True
-        else:
-            print(f"Failed to update (MERGE PATCH): Error {resp.http_status}")
-            return False
+        path = f"/collections/{collection}/items/{item_id}"
+        return await self.request("merge_patch", "PATCH", collection, item_id, path, entry, "application/merge-patch+json")
+
+    async def batch(
+        self,
+        requests: Iterable[Awaitable[PublishResult]],
+        on_result: Callable[[PublishResult], None] | None = None,
+    ) -> list[PublishResult]:
+        """Run requests concurrently, within the concurrency of the client.
+
+        Args:
+            requests (Iterable[Awaitable[PublishResult]]): requests, e.g. ``tc.post(entry)``
+            on_result (Callable[[PublishResult], None] | None): called with each result, as it completes
+
+        Returns:
+            list[PublishResult]: results, in the order of the requests
+        """
+
+        async def run(request: Awaitable[PublishResult]) -> PublishResult:
+            result = await request
+            if on_result:
+                on_result(result)
+            return result
+
+        return await asyncio.gather(*(run(request) for request in requests))
+
+    async def post_batch(self, entries: Iterable[dict], on_result=None) -> list[PublishResult]:
+        return await self.batch((self.post(entry) for entry in entries), on_result)
+
+    async def json_patch_batch(self, patches: Iterable[tuple[str, str, list[dict]]], on_result=None) -> list[PublishResult]:
+        """JSON Patch a batch of items, given as (collection, item_id, operations)."""
+        return await self.batch((self.json_patch(*patch) for patch in patches), on_result)
+
+    async def merge_patch_batch(self, patches: Iterable[tuple[str, str, dict]], on_result=None) -> list[PublishResult]:
+        """Merge Patch a batch of items, given as (collection, item_id, entry)."""
+        return await self.batch((self.merge_patch(*patch) for patch in patches), on_result)
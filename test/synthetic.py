@@ -0,0 +1,112 @@
+import copy
+import json
+from pathlib import Path
+from urllib import parse as urlparse
+
+"""
+Synthetic items
+    Current-format CMIP6 and CMIP7 items built from schemas/post_event_example.json, with any number
+    of data assets, shared by loadtest.py and the benchmarks.
+"""
+
+ROOT = Path(__file__).parent.parent
+EXAMPLE_EVENT = ROOT / "schemas" / "post_event_example.json"
+EXTENSIONS = {
+    "CMIP6": "https://esgf.github.io/stac-transaction-api/cmip6/v3.0.4/schema.json",
+    "CMIP7": "https://esgf.github.io/stac-transaction-api/cmip7/v1.0.0/schema.json",
+}
+PREFIXED = [
+    "activity_id",
+    "experiment_id",
+    "frequency",
+    "grid_label",
+    "institution_id",
+    "nominal_resolution",
+    "product",
+    "realm",
+    "source_id",
+    "source_type",
+    "sub_experiment_id",
+    "table_id",
+    "variable_id",
+    "variant_label",
+]
+
+
+def example_event() -> dict:
+    """schemas/post_event_example.json, completed with a geometry, links and ids."""
+    event = json.loads(EXAMPLE_EVENT.read_text())
+    item = event["data"]["payload"]["item"]
+    item["bbox"] = [-180.0, -90.0, 180.0, 90.0]
+    item["geometry"] = {
+        "type": "Polygon",
+        "coordinates": [[[-180.0, -90.0], [180.0, -90.0], [180.0, 90.0], [-180.0, 90.0], [-180.0, -90.0]]],
+    }
+    item["properties"]["datetime"] = None
+    item["links"] = []
+    event["metadata"].setdefault("event_id", "synthetic")
+    event["metadata"].setdefault("request_id", "synthetic")
+    return event
+
+
+def synthetic_item(event: dict, project: str, assets: int, variable_id: str | None = None) -> dict:
+    """A current-format item of ``project`` with ``assets`` data files, built from the example item.
+
+    Args:
+        event (dict): example event
+        project (str): CMIP6 or CMIP7
+        assets (int): number of data assets
+        variable_id (str | None): variable of the item, in its id and file names, that of the example by default
+
+    Returns:
+        dict: STAC item
+    """
+    example = copy.deepcopy(event["data"]["payload"]["item"])
+    prefix = project.lower()
+    example_variable_id = example["properties"]["variable_id"]
+    variable_id = variable_id or example_variable_id
+
+    properties = {
+        "datetime": None,
+        "start_datetime": example["properties"]["start_datetime"],
+        "end_datetime": example["properties"]["end_datetime"],
+        "project": project,
+        f"{prefix}:mip_era": project,
+        f"{prefix}:version": "v" + example["properties"]["version"],
+    }
+    properties.update({f"{prefix}:{key}": example["properties"][key] for key in PREFIXED})
+    properties[f"{prefix}:variable_id"] = variable_id
+
+    href = example["assets"]["data0000"]["href"]
+    base, name = href.rsplit("/", 1)
+    stem = name.rsplit("_", 1)[0].replace(example_variable_id, variable_id, 1)
+    item_assets = {
+        "globus": example["assets"]["globus"] | {"roles": ["data"]},
+    }
+    for i in range(assets):
+        item_assets[f"data{i:04}"] = {
+            "href": f"{base}/{stem}_{1850 + i:04}0101-{1850 + i:04}1231.nc",
+            "description": "HTTPServer Link",
+            "type": "application/netcdf",
+            "roles": ["data"],
+            "alternate:name": urlparse.urlparse(href).hostname,
+            "file:size": 1_000_000 + i,
+            "file:checksum": f"1220{i:064x}",
+        }
+
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": [
+            EXTENSIONS[project],
+            "https://stac-extensions.github.io/alternate-assets/v1.2.0/schema.json",
+            "https://stac-extensions.github.io/file/v2.1.0/schema.json",
+        ],
+        "id": example["id"].replace("CMIP6", project, 1).replace(example_variable_id, variable_id, 1),
+        "collection": project,
+        "geometry": example["geometry"],
+        "bbox": example["bbox"],
+        "properties": properties,
+        "links": [],
+        "assets": item_assets,
+    }